@@ -11,6 +11,17 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")              # Azure AI Inference
 OPENAI_EMBEDDINGS_URL = os.getenv("OPENAI_EMBEDDINGS_URL")  # GitHub Models endpoint
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))  # después se responde sin LLM
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "900"))
+# Ejecución de los endpoints (app/services/executor.py): hilos, cola por carril y plazo por petición
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", str(max(2, os.cpu_count() or 1))))
+EXECUTOR_QUEUE = int(os.getenv("EXECUTOR_QUEUE", "32"))  # más allá se responde 503
+EXECUTOR_TIMEOUT_SECONDS = float(os.getenv("EXECUTOR_TIMEOUT_SECONDS", "30"))
+# Datasets compartidos entre workers: features/master mapeados desde <dataset>.arrow (ver store.py)
+SHARED_DATA = os.getenv("SHARED_DATA", "1") != "0"
+# Caché HTTP de las respuestas de analytics (app/services/http_cache.py): entradas del LRU y max-age
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "256"))
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))  # 0 = el navegador revalida siempre (304)
 
 if not GITHUB_TOKEN:
     raise RuntimeError("GITHUB_TOKEN no está configurado en el archivo .env")
@@ -1,19 +1,48 @@
 # app/main.py
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routers import analytics, chatbot, crimes, geo
+from app.services import executor, http_cache, registry, store
 from fastapi.middleware.cors import CORSMiddleware 
-app = FastAPI(title="Santander Security API", version="1.0.0")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+ # Carga única de master/features compartida por todos los routers
+ store.preload()
+ # Sigue a models/current.json: un modelo nuevo o fijado se carga sin reiniciar la API
+ stop = threading.Event()
+ registry.watch(stop)
+ yield
+ stop.set()
+ executor.shutdown()
+
+app = FastAPI(title="Santander Security API", version="1.0.0", lifespan=lifespan)
+
+# En el event loop: responde aunque los hilos de trabajo estén ocupados
 @app.get("/health")
-def health():
+async def health():
  return {"status": "ok"}
 
+@app.get("/metrics/executor")
+async def executor_metrics():
+ # Ocupación, colas y rechazos (load shedding) por carril y por ruta
+ return executor.metrics()
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+ # Aciertos, 304 e invalidaciones de la caché de respuestas
+ return http_cache.metrics()
+
+# ETag + LRU de respuestas por versión de datos/modelo; CORS (se agrega después) queda por fuera
+app.add_middleware(http_cache.ResponseCache)
 app.add_middleware(
  CORSMiddleware,
  allow_origins=["http://localhost:5173"], 
  allow_credentials=True,
  allow_methods=["*"],
  allow_headers=["*"],
+ expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(analytics.router)
@@ -14,11 +14,60 @@ class RiskPredictResponse(BaseModel):
     probability: float
     used_features: Dict[str, Any]
 
+class RiskBatchRequest(BaseModel):
+    items: List[RiskPredictRequest] = Field(..., max_length=5000)
+
+class RiskBatchItem(BaseModel):
+    departamento: str
+    municipio: Optional[str]
+    anio: int
+    mes: int
+    encontrado: bool
+    prediction: Optional[int] = None
+    probability: Optional[float] = None
+
+class RiskBatchResponse(BaseModel):
+    items: List[RiskBatchItem]
+
 class MetricsResponse(BaseModel):
     roc_auc: float
     pr_auc: float
     report: dict
 
+class ModelVersion(BaseModel):
+    version: str
+    backend: Optional[str] = None
+    created_at: str
+    features: Optional[List[str]] = None
+    ventana_train: Optional[Dict[str, Any]] = None  # {"desde", "hasta", "filas"}
+    ventana_test: Optional[Dict[str, Any]] = None
+    roc_auc: Optional[float] = None
+    pr_auc: Optional[float] = None
+    current: bool
+    pinned: bool
+
+class ModelPointer(BaseModel):
+    version: str
+    pinned: bool
+    at: str
+
+class FeatureContribution(BaseModel):
+    feature: str
+    shap: float  # log-odds
+
+class FeatureImportance(BaseModel):
+    feature: str
+    importancia: float  # media de |SHAP| ponderada por filas
+
+class ExplainResponse(BaseModel):
+    municipio: str
+    anio: int
+    mes: int
+    filas: int
+    base: float
+    contribuciones: List[FeatureContribution]
+    importancia_global: List[FeatureImportance]
+
 class TrendPoint(BaseModel):
     anio: int
     mes: int
@@ -37,6 +86,7 @@ class CrimeQuery(BaseModel):
     anio: Optional[int] = None
     mes: Optional[int] = None
     limit: int = 100
+    cursor: Optional[str] = None  # X-Next-Cursor de la página anterior
 
 # Para /crimes/query (estructura simple)
 class CrimeRecord(BaseModel):
@@ -1,84 +1,84 @@
 # app/routers/analytics.py
 from fastapi import APIRouter, HTTPException
 from typing import Optional
-import joblib
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from sklearn.metrics import classification_report, roc_auc_score, precision_recall_curve, auc
-from app.config import MODELS_DIR, PROC_DIR
+from app.services import store, compiled, executor, explain, kpis, model_metrics, olap, registry, risk, scores
 from app.models.schemas import (
-    RiskPredictRequest, RiskPredictResponse, MetricsResponse,
-    TrendPoint, MunicipioDistributionItem
+    RiskPredictRequest, RiskPredictResponse, RiskBatchRequest, RiskBatchItem, RiskBatchResponse, MetricsResponse,
+    ModelVersion, ModelPointer, ExplainResponse, TrendPoint, MunicipioDistributionItem
 )
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
-_model = None
-_features_df = None
-
 def _load_artifacts():
-    global _model, _features_df
-    if _model is None:
-        _model = joblib.load(MODELS_DIR / "risk_model.pkl")
-    if _features_df is None:
-        _features_df = pd.read_parquet(PROC_DIR / "features.parquet")
-        _features_df = _features_df[_features_df["departamento"] == "SANTANDER"].copy()
+    """Modelo, scorer y snapshot del features vigentes (se recargan si train/ETL publican
+    versiones nuevas). Cada petición usa solo lo que recibe aquí: un cambio de versión a
+    mitad de la petición no mezcla el modelo de una con el features de otra."""
+    pipeline = store.model()
+    # Para puntuar en línea: arreglos NumPy exportados del mismo pkl (o el Pipeline si no hay)
+    scorer = compiled.current(pipeline)
+    return pipeline, scorer, store.snapshot("features")
+
+def _lookup(snap: store.Snapshot = None) -> risk.LookupTable:
+    # Tabla indexada por (departamento, municipio, anio, mes), una por versión del features
+    return (snap or store.snapshot("features")).derived("risk.lookup", risk.lookup_table)
 
 #def _feature_row(departamento: str, municipio: str | None, anio: int, mes: int) -> pd.DataFrame:
 def _feature_row(departamento: str, municipio: Optional[str], anio: int, mes: int) -> pd.DataFrame:
-    df = _features_df
-    filt = (df["departamento"] == departamento) & (df["anio"] == anio) & (df["mes"] == mes)
-    if municipio and "municipio" in df.columns:
-        filt = filt & (df["municipio"] == municipio)
-    candidates = df.loc[filt]
-    if candidates.empty:
-        raise HTTPException(status_code=404, detail="No hay features para ese periodo/ubicación")
+    table = _lookup()
     # Usamos la fila con mayor 'cantidad' como representativa
-    row = candidates.sort_values("cantidad", ascending=False).head(1)
-    return row[[
-        "departamento","anio","mes",
-        "tasa_delitos_muni_mes_lag","tasa_delitos_dep_mes_lag","acumulado_90d"
-    ]]
+    pos = table.positions([(departamento, municipio or None, anio, mes)])[0]
+    if pos < 0:
+        raise HTTPException(status_code=404, detail="No hay features para ese periodo/ubicación")
+    return table.X.iloc[[pos]]
 
 @router.get("/municipios")
+@executor.offload("light")
 def listar_municipios():
-    _load_artifacts()
-    df = _features_df.copy()
+    df = store.snapshot("features").df
     municipios = sorted(df["municipio"].unique().tolist())
     return {"municipios": municipios}
 
 
-@router.get("/metrics", response_model=MetricsResponse)
-def metrics():
-    _load_artifacts()
-    df = _features_df
+def _validation(model: store.Snapshot, snap: store.Snapshot, persist: bool = True) -> dict:
+    """Métricas de validación del modelo sobre el último año del features (como validate.py).
+    Con `persist` se guardan junto al pkl, así se calculan una sola vez por versión del modelo."""
+    df = snap.df
     ultimo_anio = int(df["anio"].max())
-    val_df = df[df["anio"] == ultimo_anio].copy()
-
-    X_val = val_df[[
-        "departamento","anio","mes",
-        "tasa_delitos_muni_mes_lag","tasa_delitos_dep_mes_lag","acumulado_90d"
-    ]]
-    y_val = val_df["riesgo_alto"]
-
-    if hasattr(_model, "predict_proba"):
-        y_proba = _model.predict_proba(X_val)[:, 1]
-        roc = float(roc_auc_score(y_val, y_proba))
-        precision, recall, _ = precision_recall_curve(y_val, y_proba)
-        pr = float(auc(recall, precision))
-    else:
-        roc = pr = 0.0
+    val_mask = (df["anio"] == ultimo_anio).to_numpy(dtype=bool, na_value=False)
+    y_val = df.loc[val_mask, "riesgo_alto"]
+    # Probabilidades precalculadas por versión de modelo (sin volver a puntuar)
+    cached, _ = scores.current(snap, model)
+    val_scores = cached[val_mask]
+    y_proba = val_scores["probabilidad"].to_numpy() if hasattr(model.data, "predict_proba") else None
+    val = {**model_metrics.evaluate(y_val, val_scores["prediccion"].to_numpy(), y_proba), "anio": ultimo_anio}
+    # Solo si el pkl vigente sigue siendo el evaluado (pudo cambiar a mitad de la petición)
+    if persist and store.model_version() == model.version:
+        model_metrics.write("validation", val)
+    return val
+
+def _saved_validation(model: store.Snapshot, snap: store.Snapshot) -> dict:
+    # Validación guardada con el modelo (validate.py o una petición anterior); si no hay, se calcula y se guarda
+    return (model_metrics.current(model) or {}).get("validation") or _validation(model, snap)
+
 
-    report_dict = classification_report(y_val, _model.predict(X_val), output_dict=True)
-    return MetricsResponse(roc_auc=roc, pr_auc=pr, report=report_dict)
+@router.get("/metrics", response_model=MetricsResponse)
+@executor.offload("heavy", limit=2)
+def metrics(rescore: bool = False):
+    """Métricas de validación guardadas con el modelo; `rescore=true` las recalcula sobre el
+    features vigente (sin reemplazar las guardadas)."""
+    model, _, snap = _load_artifacts()
+    val = _validation(model, snap, persist=False) if rescore else _saved_validation(model, snap)
+    return MetricsResponse(roc_auc=val["roc_auc"], pr_auc=val["pr_auc"], report=val["report"])
 
 
 @router.get("/risk/predict")
+@executor.offload("heavy")
 def risk_predict():
-    _load_artifacts()
-    df = _features_df.copy()
-    df = df[df["departamento"] == "SANTANDER"]
+    model, _, snap = _load_artifacts()
+    df = snap.df
 
     if df.empty:
         return {
@@ -87,34 +87,25 @@ def risk_predict():
             "ranking_municipios": []
         }
 
-    # detectar último mes con datos en todo Santander
-    ultimo = df.sort_values(["anio", "mes"]).iloc[-1]
-    anio = int(ultimo["anio"])
-    mes = int(ultimo["mes"])
-
-    # features para predicción (todos los municipios juntos)
-    df_mes = df[(df["anio"] == anio) & (df["mes"] == mes)]
-    X = df_mes[[
-        "departamento", "anio", "mes",
-        "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"
-    ]]
-
-    if hasattr(_model, "predict_proba"):
-        proba = _model.predict_proba(X)[:, 1]
-        df_mes = df_mes.assign(probabilidad=proba)
-        y_proba = float(proba.mean())  # promedio general
-    else:
-        y_hat = _model.predict(X)
-        df_mes = df_mes.assign(probabilidad=y_hat)
-        y_proba = float(y_hat.mean())
+    # detectar último mes con datos en todo Santander (roll-up anio-mes del cubo)
+    cube = olap.current(snap)
+    anio, mes = (int(v) for v in cube.sum(by=["anio", "mes"], measure="filas").index[-1])
+
+    # probabilidades precalculadas de todos los municipios del mes
+    mes_mask = ((df["anio"] == anio) & (df["mes"] == mes)).to_numpy(dtype=bool, na_value=False)
+    cached, _ = scores.current(snap, model)
+    proba = cached["probabilidad"].to_numpy()[mes_mask]
+    df_mes = df[mes_mask].assign(probabilidad=proba)
+    y_proba = float(proba.mean())  # promedio general
 
-    # análisis contextual agregado
+    # análisis contextual agregado (cubo filtrado al mes)
     if not df_mes.empty:
-        genero_top = df_mes.groupby("genero")["cantidad"].sum().sort_values(ascending=False).index[0]
-        grupo_top = df_mes.groupby("grupo_etario")["cantidad"].sum().sort_values(ascending=False).index[0]
-        dia_top = df_mes.groupby("dia_semana")["cantidad"].sum().sort_values(ascending=False).index[0]
-        franja_top = df_mes.groupby("franja_hora")["cantidad"].sum().sort_values(ascending=False).index[0]
-        delito_top = df_mes.groupby("tipo_delito")["cantidad"].sum().sort_values(ascending=False).index[0]
+        top = lambda dim: cube.sum(by=[dim], where={"anio": anio, "mes": mes}).sort_values(ascending=False).index[0]
+        genero_top = top("genero")
+        grupo_top = top("grupo_etario")
+        dia_top = top("dia_semana")
+        franja_top = top("franja_hora")
+        delito_top = top("tipo_delito")
     else:
         genero_top = grupo_top = dia_top = franja_top = delito_top = "SIN_DATO"
 
@@ -129,7 +120,7 @@ def risk_predict():
 
     # ranking de municipios críticos (top 5 por probabilidad promedio)
     ranking = (
-        df_mes.groupby("municipio")["probabilidad"]
+        df_mes.groupby("municipio", observed=True)["probabilidad"]
         .mean()
         .sort_values(ascending=False)
         .head(5)
@@ -147,34 +138,76 @@ def risk_predict():
 
 
 
-@router.get("/prediction/trend")
-def prediction_trend():
-    _load_artifacts()
-    df = _features_df.copy()
-
+@router.post("/risk/batch", response_model=RiskBatchResponse)
+@executor.offload("heavy")
+def risk_batch(payload: RiskBatchRequest):
+    """Riesgo para muchas combinaciones (municipio, anio, mes) con un solo predict_proba."""
+    _, scorer, snap = _load_artifacts()
+    table = _lookup(snap)
+    keys = [(it.departamento, it.municipio or None, it.anio, it.mes) for it in payload.items]
+    pos = table.positions(keys)
+    found = pos >= 0
+    prediction = np.zeros(len(keys), dtype=int)
+    probability = np.zeros(len(keys))
+    if found.any():
+        prediction[found], probability[found] = risk.score(scorer, table.X.iloc[pos[found]])
+
+    items = []
+    for k, ok, y, p in zip(keys, found.tolist(), prediction.tolist(), probability.tolist()):
+        items.append(RiskBatchItem(
+            departamento=k[0], municipio=k[1], anio=k[2], mes=k[3], encontrado=ok,
+            prediction=y if ok else None, probability=round(p, 4) if ok else None,
+        ))
+    return RiskBatchResponse(items=items)
+
+@router.get("/models", response_model=list[ModelVersion])
+@executor.offload("light")
+def list_models():
+    """Versiones del registro de modelos; `current` es la que sirve la API."""
+    return registry.versions()
+
+@router.post("/models/{version}/pin", response_model=ModelPointer)
+@executor.offload("heavy", limit=1)
+def pin_model(version: str):
+    """Sirve `version` (también para volver a una anterior) aunque se entrenen versiones nuevas."""
+    try:
+        pointer = registry.pin(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Versión de modelo desconocida: {version}")
+    # La carga la paga esta petición, no la siguiente predicción
+    registry.warm()
+    return pointer
+
+@router.delete("/models/pin", response_model=ModelPointer)
+@executor.offload("light")
+def unpin_model():
+    """Quita la fijación: el próximo entrenamiento vuelve a activarse solo."""
+    pointer = registry.unpin()
+    if pointer is None:
+        raise HTTPException(status_code=404, detail="No hay registro de modelos")
+    return pointer
+
+@router.get("/explain/{municipio}", response_model=ExplainResponse)
+@executor.offload("light")
+def explain_municipio(municipio: str, anio: Optional[int] = None, mes: Optional[int] = None):
+    """Contribución SHAP de cada variable al riesgo del municipio (último mes por defecto),
+    precalculada para el modelo vigente por explain.py."""
+    explanations = explain.current()
+    if explanations is None:
+        raise HTTPException(status_code=503, detail="Explicaciones no calculadas para el modelo vigente (python -m app.services.explain)")
+    out = explanations.municipio(municipio.strip().upper(), anio, mes)
+    if out is None:
+        raise HTTPException(status_code=404, detail="No hay explicaciones para ese municipio/periodo")
+    return out
+
+def _trend(df: pd.DataFrame, cached: pd.DataFrame) -> dict:
     # Reales
     reales = df.groupby(["anio", "mes"], as_index=False)["cantidad"].sum().rename(columns={"cantidad": "reales"})
-    preds = []
-
-    for (anio, mes), sub in df.groupby(["anio", "mes"]):
-        X = sub[[
-            "departamento", "anio", "mes",
-            "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"
-        ]]
-        if hasattr(_model, "predict_proba"):
-            proba = _model.predict_proba(X)[:, 1]
-            pred_value = (proba * sub["cantidad"]).sum()
-        else:
-            y_hat = _model.predict(X)
-            pred_value = y_hat.sum()
-
-        # ruido controlado
-        noise = np.random.normal(loc=0, scale=0.05 * pred_value)
-        pred_value = max(0, int(pred_value + noise))
 
-        preds.append({"anio": int(anio), "mes": int(mes), "predichos": pred_value})
-
-    pred_df = pd.DataFrame(preds)
+    # Predichos: casos esperados (probabilidad x cantidad) agregados por mes, sin ruido
+    esperados = df[["anio", "mes"]].assign(predichos=cached["probabilidad"].to_numpy() * df["cantidad"].to_numpy())
+    pred_df = esperados.groupby(["anio", "mes"], as_index=False)["predichos"].sum()
+    pred_df["predichos"] = pred_df["predichos"].clip(lower=0).astype(int)
 
     # calibración global
     calibration_factor = (reales["reales"].sum() / pred_df["predichos"].sum()) if pred_df["predichos"].sum() else 1.0
@@ -196,94 +229,60 @@ def prediction_trend():
     return {
         "serie": [TrendPoint(**r) for r in merged.to_dict(orient="records")],
         "reduccion_pct": round(reduccion_pct, 1),
-        "roc_auc": round(getattr(_model, "roc_auc_", 0.9996), 4),
-        "pr_auc": round(getattr(_model, "pr_auc_", 0.9998), 4)
+    }
+
+@router.get("/prediction/trend")
+@executor.offload("heavy", limit=2)
+def prediction_trend():
+    model, _, snap = _load_artifacts()
+    cached, model_version = scores.current(snap, model)
+    # Determinista: se calcula una vez por versión de features y de modelo
+    trend = snap.derived(f"trend:{model_version}", lambda df: _trend(df, cached))
+    # AUCs de la validación guardada con el modelo (calculada y guardada aquí si aún no existe)
+    val = _saved_validation(model, snap)
+    return {
+        **trend,
+        "roc_auc": round(val["roc_auc"], 4),
+        "pr_auc": round(val["pr_auc"], 4)
     }
 
 
 
 
 @router.get("/distribution/municipios", response_model=list[MunicipioDistributionItem])
+@executor.offload("light")
 def distribution_municipios():
-    _load_artifacts()
-    df = _features_df.copy()
+    cube = olap.current(store.snapshot("features"))
     # Último año para el panel
-    ultimo_anio = int(df["anio"].max())
-    df = df[df["anio"] == ultimo_anio]
-    dist = df.groupby("municipio", as_index=False)["cantidad"].sum().rename(columns={"cantidad": "incidentes"})
+    ultimo_anio = int(cube.sum(by=["anio"], measure="filas").index.max())
+    dist = cube.sum(by=["municipio"], where={"anio": ultimo_anio}).rename("incidentes").reset_index()
     dist = dist.sort_values("incidentes", ascending=False)
     return [MunicipioDistributionItem(**r) for r in dist.to_dict(orient="records")]
 
-def _month_bounds(last_date: pd.Timestamp):
-    cur_start = last_date.replace(day=1)
-    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
-    return cur_start, prev_start
+async def _kpis() -> dict:
+    # Con kpis.json vigente es leer un dict: se responde desde el event loop; si no, se deriva en el pool
+    return kpis.current() if kpis.fresh() else await executor.run("heavy", kpis.current)
+
+@router.get("/kpis")
+async def kpis_batch():
+    # Todas las tarjetas del tablero en un solo viaje
+    return await _kpis()
 
 @router.get("/incidents/total")
-def incidents_total():
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
-    last_date = df["fecha_hecho"].max()
-    cur_start = last_date.replace(day=1)
-    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
-    cur = df[(df["fecha_hecho"] >= cur_start) & (df["fecha_hecho"] <= last_date)]
-    prev = df[(df["fecha_hecho"] >= prev_start) & (df["fecha_hecho"] < cur_start)]
-    cur_total = int(cur["cantidad"].sum())
-    prev_total = int(prev["cantidad"].sum())
-    var_pct = ((cur_total - prev_total) / prev_total * 100) if prev_total else 0.0
-    return {"valor": cur_total, "variacion_pct": round(var_pct, 1)}
+async def incidents_total():
+    return (await _kpis())["incidents_total"]
 
 
 @router.get("/response-time")
-def response_time():
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
-    last_date = df["fecha_hecho"].max()
-    cur_start = last_date.replace(day=1)
-    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
-    cur = df[(df["fecha_hecho"] >= cur_start) & (df["fecha_hecho"] <= last_date)]
-    prev = df[(df["fecha_hecho"] >= prev_start) & (df["fecha_hecho"] < cur_start)]
-    cur_val = float(cur["acumulado_90d"].max()) if "acumulado_90d" in cur.columns and len(cur) else "N/A"
-    prev_val = float(prev["acumulado_90d"].max()) if "acumulado_90d" in prev.columns and len(prev) else 0.0
-    var_pct = ((cur_val - prev_val) / prev_val * 100) if isinstance(cur_val, float) and prev_val else 0.0
-    return {"valor": round(cur_val, 1) if isinstance(cur_val, float) else "N/A", "variacion_pct": round(var_pct, 1)}
+async def response_time():
+    return (await _kpis())["response_time"]
 
 
 @router.get("/crime-rate")
-def crime_rate():
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
-    last_date = df["fecha_hecho"].max()
-    cur_start = last_date.replace(day=1)
-    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
-    cur = df[(df["fecha_hecho"] >= cur_start) & (df["fecha_hecho"] <= last_date)]
-    prev = df[(df["fecha_hecho"] >= prev_start) & (df["fecha_hecho"] < cur_start)]
-    cur_rate = float(cur["tasa_delitos_dep_mes_lag"].mean()) if "tasa_delitos_dep_mes_lag" in cur.columns and len(cur) else "N/A"
-    prev_rate = float(prev["tasa_delitos_dep_mes_lag"].mean()) if "tasa_delitos_dep_mes_lag" in prev.columns and len(prev) else 0.0
-    var_pct = ((cur_rate - prev_rate) / prev_rate * 100) if isinstance(cur_rate, float) and prev_rate else 0.0
-    return {"valor": round(cur_rate, 1) if isinstance(cur_rate, float) else "N/A", "variacion_pct": round(var_pct, 1)}
-
-
+async def crime_rate():
+    return (await _kpis())["crime_rate"]
 
 
 @router.get("/cases/resolved")
-def cases_resolved():
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
-
-    last_date = df["fecha_hecho"].max()
-    cur_start = last_date.replace(day=1)
-    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
-
-    cur = df[(df["fecha_hecho"] >= cur_start) & (df["fecha_hecho"] <= last_date) & (df["riesgo_alto"] == 1)]
-    prev = df[(df["fecha_hecho"] >= prev_start) & (df["fecha_hecho"] < cur_start) & (df["riesgo_alto"] == 1)]
-
-    cur_total = int(cur["cantidad"].sum()) if "cantidad" in cur.columns else len(cur)
-    prev_total = int(prev["cantidad"].sum()) if "cantidad" in prev.columns else len(prev)
-    var_pct = ((cur_total - prev_total) / prev_total * 100) if prev_total else 0.0
-
-    return {"valor": cur_total, "variacion_pct": round(var_pct, 1)}
+async def cases_resolved():
+    return (await _kpis())["cases_resolved"]
@@ -1,38 +1,30 @@
 # app/routers/chatbot.py
-from fastapi import APIRouter
-import pandas as pd
+import json
+from contextlib import aclosing
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
-from app.config import PROC_DIR, OPENAI_EMBEDDINGS_URL, GITHUB_TOKEN, MODEL_NAME
 from app.models.schemas import ChatRequest, ChatResponse
+from app.services import chat_index, executor, llm, olap, store
 
 router = APIRouter(prefix="/chatbot", tags=["chatbot"])
 
-# Inicializar cliente
-client = ChatCompletionsClient(
-    endpoint=OPENAI_EMBEDDINGS_URL,
-    credential=AzureKeyCredential(GITHUB_TOKEN),
+SYSTEM_ASK = "Eres un asistente comunitario de seguridad ciudadana."
+SYSTEM_QUICK = "Eres un asistente comunitario."
+PROMPT_PREDICCION = "Genera una predicción de seguridad ciudadana para los próximos meses en Santander."
+FALLBACK_PREDICCION = (
+    "Por ahora no puedo generar la predicción. Puedes consultar la tendencia de casos "
+    "reales y proyectados en el tablero de analítica."
 )
 
 def _summary(municipio: Optional[str], delito: Optional[str]):
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-    if municipio and "municipio" in df.columns:
-        df = df[df["municipio"] == municipio.upper()]
-    if delito and "tipo_delito" in df.columns:
-        df = df[df["tipo_delito"] == delito.upper()]
-    total = int(df["cantidad"].sum()) if "cantidad" in df.columns else 0
-    hora_counts = (
-        df.groupby("franja_hora")["cantidad"].sum().sort_values(ascending=False)
-        if "franja_hora" in df.columns else pd.Series(dtype=int)
-    )
+    # Agregados del cubo OLAP (sin recorrer las filas del features)
+    cube = olap.current()
+    where = {"municipio": municipio.upper() if municipio else None, "tipo_delito": delito.upper() if delito else None}
+    total = int(cube.sum(where=where))
+    hora_counts = cube.sum(by=["franja_hora"], where=where).sort_values(ascending=False)
     hora = hora_counts.index[0] if len(hora_counts) else "SIN_DATO"
-    top_muni = (
-        df.groupby("municipio")["cantidad"].sum().sort_values(ascending=False).head(3).index.tolist()
-        if "municipio" in df.columns else []
-    )
+    top_muni = cube.sum(by=["municipio"], where=where).sort_values(ascending=False).head(3).index.tolist()
     reco = [
         f"Evita desplazarte en {hora.lower()} en zonas de alta concentración.",
         "Usa rutas iluminadas y comparte itinerarios con familiares.",
@@ -40,52 +32,26 @@ def _summary(municipio: Optional[str], delito: Optional[str]):
     ]
     return total, hora, top_muni, reco
 
-@router.post("/ask", response_model=ChatResponse)
-def ask(req: ChatRequest):
-    import unicodedata
-
-    # Función de normalización: minúsculas + quitar tildes
-    def normalize(text: str) -> str:
-        if not isinstance(text, str):
-            return ""
-        text = text.lower()
-        text = unicodedata.normalize("NFD", text)
-        return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
-
-    # Cargar datos
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
-
-    pregunta = normalize(req.pregunta)
-
-    # setectar entidades clave 
-    def detectar(lista, texto):
-        lista_norm = [normalize(item) for item in lista]
-        return next((lista[i] for i, item in enumerate(lista_norm) if item in texto), None)
-
-    municipio = detectar(df["municipio"].dropna().unique(), pregunta)
-    tipo_delito = detectar(df["tipo_delito"].dropna().unique(), pregunta)
-    grupo_etario = detectar(df["grupo_etario"].dropna().unique(), pregunta)
-    franja_hora = detectar(df["franja_hora"].dropna().unique(), pregunta)
-    genero = detectar(df["genero"].dropna().unique(), pregunta)
-
-    # Aplicar filtros dinámicos 
-    df_filtrado = df.copy()
-    if municipio:
-        df_filtrado = df_filtrado[df_filtrado["municipio"] == municipio]
-    if tipo_delito:
-        df_filtrado = df_filtrado[df_filtrado["tipo_delito"] == tipo_delito]
-    if grupo_etario:
-        df_filtrado = df_filtrado[df_filtrado["grupo_etario"] == grupo_etario]
-    if franja_hora:
-        df_filtrado = df_filtrado[df_filtrado["franja_hora"] == franja_hora]
-    if genero:
-        df_filtrado = df_filtrado[df_filtrado["genero"] == genero]
-
-    # generar resumen 
-    total = int(df_filtrado["cantidad"].sum())
-    hora = df_filtrado["franja_hora"].value_counts().idxmax() if not franja_hora and not df_filtrado.empty else (franja_hora or "SIN_DATO")
-    top_muni = df_filtrado["municipio"].value_counts().head(3).index.tolist()
+def _ask_context(pregunta: str):
+    """Prompt para el LLM, respuesta de respaldo (solo con datos), resumen de los datos y versión de los datos usados."""
+    # Índice de entidades (una vez por versión del features) y cubo OLAP
+    snap = store.snapshot("features")
+    cube = olap.current(snap)
+
+    # detectar entidades clave (una pasada del autómata sobre la pregunta normalizada)
+    entidades = chat_index.entities(snap).detect(pregunta)
+    municipio = entidades["municipio"]
+    tipo_delito = entidades["tipo_delito"]
+    grupo_etario = entidades["grupo_etario"]
+    franja_hora = entidades["franja_hora"]
+    genero = entidades["genero"]
+
+    # generar resumen desde el cubo (filtros = entidades detectadas)
+    total = int(cube.sum(where=entidades))
+    hora_counts = cube.sum(by=["franja_hora"], where=entidades, measure="filas").sort_values(ascending=False)
+    hora = hora_counts.index[0] if not franja_hora and len(hora_counts) else (franja_hora or "SIN_DATO")
+    muni_counts = cube.sum(by=["municipio"], where=entidades, measure="filas").sort_values(ascending=False)
+    top_muni = muni_counts.head(3).index.tolist()
     reco = [
         f"Evita desplazarte en la franja {hora.lower()} en zonas de alta concentración.",
         "Usa rutas iluminadas y comparte itinerarios con familiares.",
@@ -94,7 +60,7 @@ def ask(req: ChatRequest):
 
     # construir prompt para el LLM 
     prompt = f"""
-    Usuario pregunta: {req.pregunta}
+    Usuario pregunta: {pregunta}
 
     Entidades detectadas:
     - Municipio: {municipio or "no especificado"}
@@ -113,40 +79,74 @@ def ask(req: ChatRequest):
     con un tono claro, útil y preventivo, integrando los datos anteriores en la respuesta.
     """
 
-    response = client.complete(
-        messages=[
-            SystemMessage(content="Eres un asistente comunitario de seguridad ciudadana."),
-            UserMessage(content=prompt)
-        ],
-        temperature=0.7,
-        top_p=1.0,
-        model=MODEL_NAME
+    # Si el LLM no responde a tiempo se contesta solo con los datos
+    fallback = (
+        f"Por ahora no puedo darte una respuesta detallada. Según los datos{f' de {municipio}' if municipio else ''}: "
+        f"{total} eventos registrados; franja horaria de mayor riesgo: {hora}; "
+        f"municipios críticos: {', '.join(top_muni) if top_muni else 'SIN_DATO'}. {' '.join(reco)}"
     )
+    resumen = {"entidades": entidades, "total": total, "hora": hora, "top_muni": top_muni, "reco": reco}
+    return prompt, fallback, resumen, snap.version
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    return ChatResponse(answer=response.choices[0].message.content)
+@router.post("/ask", response_model=ChatResponse)
+async def ask(req: ChatRequest):
+    # El contexto (índice + cubo) va al pool; la espera del LLM no ocupa ningún hilo
+    prompt, fallback, _, version = await executor.run("light", _ask_context, req.pregunta)
+    answer = await llm.gateway().complete(
+        [("system", SYSTEM_ASK), ("user", prompt)], fallback, version, temperature=0.7, top_p=1.0,
+    )
+    return ChatResponse(answer=answer)
 
 
+@router.post("/ask/stream")
+async def ask_stream(req: ChatRequest, request: Request):
+    """Igual que /ask pero en Server-Sent Events: primero `resumen` (datos locales), luego
+    `token` a medida que el modelo escribe y al final `fin` (o `error` si se corta)."""
+    prompt, fallback, resumen, version = await executor.run("light", _ask_context, req.pregunta)
 
+    async def events():
+        yield _sse("resumen", resumen)
+        # Cada fragmento se pide al modelo cuando el anterior ya salió hacia el cliente
+        # (contrapresión); si el cliente se desconecta, aclosing cierra la conexión con el modelo.
+        tokens = llm.gateway().stream(
+            [("system", SYSTEM_ASK), ("user", prompt)], fallback, version, temperature=0.7, top_p=1.0,
+        )
+        async with aclosing(tokens):
+            try:
+                async for text in tokens:
+                    if await request.is_disconnected():
+                        return
+                    yield _sse("token", {"text": text})
+            except Exception as e:
+                yield _sse("error", {"detail": type(e).__name__})
+                return
+        yield _sse("fin", {})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/quick/{tipo}", response_model=ChatResponse)
-def quick(tipo: str, municipio: Optional[str] = None):
+async def quick(tipo: str, municipio: Optional[str] = None):
     tipo = tipo.lower()
     if tipo == "estadisticas":
-        total, hora, top_muni, _ = _summary(municipio, None)
+        total, hora, top_muni, _ = await executor.run("light", _summary, municipio, None)
         muni_txt = f" en {municipio}" if municipio else ""
         return ChatResponse(answer=f"Total de eventos{muni_txt}: {total}. Franja de mayor riesgo: {hora}.")
     elif tipo == "prediccion":
-        response = client.complete(
-            messages=[
-                SystemMessage(content="Eres un asistente comunitario."),
-                UserMessage(content="Genera una predicción de seguridad ciudadana para los próximos meses en Santander.")
-            ],
-            model=MODEL_NAME
+        # Mismo prompt en cada clic: se responde desde la caché mientras no cambien los datos
+        version = await executor.run("light", lambda: store.snapshot("features").version)
+        answer = await llm.gateway().complete(
+            [("system", SYSTEM_QUICK), ("user", PROMPT_PREDICCION)], FALLBACK_PREDICCION, version,
         )
-        return ChatResponse(answer=response.choices[0].message.content)
+        return ChatResponse(answer=answer)
     elif tipo == "situacion":
-        total, hora, top_muni, _ = _summary(municipio, None)
+        total, hora, top_muni, _ = await executor.run("light", _summary, municipio, None)
         return ChatResponse(
             answer=f"Situación en {municipio or 'el área'}: {total} eventos. Riesgo mayor en {hora}. "
                    f"Zonas críticas: {', '.join(top_muni) if top_muni else 'SIN_DATO'}."
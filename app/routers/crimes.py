@@ -1,51 +1,63 @@
 # app/routers/crimes.py
-from fastapi import APIRouter
-import pandas as pd
-from app.config import PROC_DIR
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
 from app.models.schemas import CrimeQuery, CrimeRecord, CrimeRecentRecord
+from app.services import executor, query_engine, recency, store
 
 router = APIRouter(prefix="/crimes", tags=["crimes"])
 
-_df = None
+RECENT_LIMIT = 100
 
-def _load_data():
-    global _df
-    if _df is None:
-        _df = pd.read_parquet(PROC_DIR / "master.parquet")
-        _df = _df[_df["departamento"] == "SANTANDER"].copy()
-        _df["fecha_hecho"] = pd.to_datetime(_df["fecha_hecho"], errors="coerce")
+def _recent_payload(snap: store.Snapshot) -> bytes:
+    df = recency.latest(snap, RECENT_LIMIT)
+    return recency.render(recency.columns_to_records({
+        "id": [f"#{i:03d}" for i in df.index],
+        "tipo": recency.text(df["tipo_delito"]),
+        "descripcion": "Reporte reciente de " + recency.text(df["delito"]),
+        "ubicacion": recency.text(df["municipio"]) + ", " + recency.text(df["departamento"]),
+        "fecha": df["fecha_hecho"].map(str),
+        "severidad": recency.severity(df["cantidad"]),
+        "estado": ["En Atención"] * len(df),
+    }))
 
 @router.get("/recent", response_model=list[CrimeRecentRecord])
+@executor.offload("light")
 def recent():
-    _load_data()
-    df = _df.sort_values("fecha_hecho", ascending=False).head(100)
-    out = []
-    for i, r in df.iterrows():
-        out.append(CrimeRecentRecord(
-            id=f"#{i:03d}",
-            tipo=str(r.get("tipo_delito", "OTRO")),
-            descripcion = f"Reporte reciente de {r.get('delito')}",
-            ubicacion=f"{str(r.get('municipio',''))}, {str(r.get('departamento',''))}",
-            fecha=str(r["fecha_hecho"]),
-            severidad="crítica" if (r.get("cantidad", 0) or 0) >= 3 else ("alta" if (r.get("cantidad", 0) or 0) == 2 else "media"),
-            estado="En Atención"
-        ))
-    return out
+    # La respuesta ya serializada se guarda por versión del master
+    snap = store.snapshot("master")
+    return Response(snap.derived("crimes.recent", lambda _: _recent_payload(snap)), media_type="application/json")
+
+QUERY_COLS = ["departamento", "municipio", "fecha_hecho", "tipo_delito", "cantidad"]
+
+def _after(cursor: Optional[str], snap: store.Snapshot) -> Optional[int]:
+    if not cursor:
+        return None
+    version, _, rank = cursor.rpartition(".")
+    if version != snap.version:
+        raise HTTPException(status_code=409, detail="El cursor corresponde a otra versión de los datos; repite la consulta")
+    try:
+        return int(rank)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 @router.post("/query", response_model=list[CrimeRecord])
-def query(payload: CrimeQuery):
-    _load_data()
-    df = _df.copy()
-    filt = (df["departamento"] == payload.departamento)
-    if payload.municipio and "municipio" in df.columns:
-        filt &= (df["municipio"] == payload.municipio)
-    if payload.tipo_delito and "tipo_delito" in df.columns:
-        filt &= (df["tipo_delito"] == payload.tipo_delito)
+@executor.offload("light")
+def query(payload: CrimeQuery, response: Response):
+    snap = store.snapshot("master")
+    filters = {"departamento": payload.departamento}
+    if payload.municipio:
+        filters["municipio"] = payload.municipio
+    if payload.tipo_delito:
+        filters["tipo_delito"] = payload.tipo_delito
     if payload.anio:
-        filt &= (df["anio"] == payload.anio)
+        filters["anio"] = payload.anio
     if payload.mes:
-        filt &= (df["mes"] == payload.mes)
+        filters["mes"] = payload.mes
 
-    df = df.loc[filt, ["departamento","municipio","fecha_hecho","tipo_delito","cantidad"]].sort_values("fecha_hecho", ascending=False).head(payload.limit)
-    df["fecha_hecho"] = df["fecha_hecho"].astype(str)
+    positions, next_rank = query_engine.current(snap).search(filters, payload.limit, _after(payload.cursor, snap))
+    if next_rank is not None:
+        response.headers["X-Next-Cursor"] = f"{snap.version}.{next_rank}"
+    # assign: frame nuevo, el snapshot compartido no se modifica
+    df = snap.df.iloc[positions][QUERY_COLS]
+    df = df.assign(fecha_hecho=df["fecha_hecho"].astype(str))
     return [CrimeRecord(**r) for r in df.to_dict(orient="records")]
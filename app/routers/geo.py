@@ -1,37 +1,46 @@
 # app/routers/geo.py
-from fastapi import APIRouter
-import pandas as pd
-from app.config import PROC_DIR, GEO_DIR
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+import numpy as np
 from app.models.schemas import GeoIncident
+from app.services import executor, geoindex, recency, store
 
 router = APIRouter(prefix="/geo", tags=["geo"])
 
-_df = None
-_geo = None
+INCIDENTS_LIMIT = 200
 
-def _load():
-    global _df, _geo
-    if _df is None:
-        _df = pd.read_parquet(PROC_DIR / "master.parquet")
-        _df = _df[_df["departamento"] == "SANTANDER"].copy()
-    if _geo is None:
-        _geo = pd.read_csv(GEO_DIR / "municipios.csv") 
+def _render(snap: store.Snapshot, positions: np.ndarray) -> bytes:
+    idx = geoindex.current(snap)
+    df = snap.df.iloc[positions]
+    return recency.render(recency.columns_to_records({
+        "lat": idx.lat[positions].tolist(),
+        "lon": idx.lon[positions].tolist(),
+        "severidad": recency.severity(df["cantidad"]),
+        "estado": ["En Atención"] * len(df),
+        "municipio": recency.text(df["municipio"]),
+    }))
 
-@router.get("/incidents", response_model=list[GeoIncident])
-def incidents():
-    _load()
-    df = _df.sort_values("fecha_hecho", ascending=False).head(200).reset_index(drop=True)
+def _parse_bbox(bbox: str):
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser min_lon,min_lat,max_lon,max_lat")
+    return min_lon, min_lat, max_lon, max_lat
 
-    df["codigo_dane"] = df["codigo_dane"].astype(str)
-    _geo["codigo_dane"] = _geo["codigo_dane"].astype(str)
-    df = df.merge(_geo, on="codigo_dane", how="left")  
-    incidents = []
-    for _, r in df.iterrows():
-        incidents.append(GeoIncident(
-            lat=float(r.get("lat", 0)),
-            lon=float(r.get("lon", 0)),
-            severidad="crítica" if (r.get("cantidad", 0) or 0) >= 3 else ("alta" if (r.get("cantidad", 0) or 0) == 2 else "media"),
-            estado="En Atención",
-            municipio=str(r.get("municipio", ""))
-        ))
-    return incidents
\ No newline at end of file
+@router.get("/incidents", response_model=list[GeoIncident])
+@executor.offload("light")
+def incidents(
+    bbox: Optional[str] = Query(None, description="Viewport del mapa: min_lon,min_lat,max_lon,max_lat"),
+    municipio: Optional[str] = None,
+    limit: int = Query(INCIDENTS_LIMIT, ge=1, le=5000),
+):
+    snap = store.snapshot("master")
+    if bbox is None and municipio is None and limit == INCIDENTS_LIMIT:
+        # Vista por defecto: ya serializada una vez por versión del master
+        order = snap.derived("recency", recency.index)
+        payload = snap.derived("geo.incidents", lambda _: _render(snap, order[:INCIDENTS_LIMIT]))
+        return Response(payload, media_type="application/json")
+    positions = geoindex.current(snap).query(
+        bbox=_parse_bbox(bbox) if bbox is not None else None, municipio=municipio, limit=limit,
+    )
+    return Response(_render(snap, positions), media_type="application/json")
@@ -1,6 +1,5 @@
 # scripts/bootstrap.sh
 set -e
 mkdir -p app/data/{raw,processed,models,logs}
+# Pipeline completo: master, features, cubo OLAP, KPIs, entrenamiento, scores, validación y SHAP
 python -m app.services.etl --fetch
-python -m app.services.features --build
-python -m app.services.train --fit
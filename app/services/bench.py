@@ -0,0 +1,990 @@
+# app/services/bench.py
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from app.config import COMMON_COLS, GEO_DIR, PROC_DIR
+from app.models.schemas import CrimeRecentRecord, GeoIncident
+from app.services import dtypes, etl, features, store
+
+def synthetic_events(rows: int, n_munis: int = 87, years: int = 8, seed: int = 42) -> pd.DataFrame:
+    """Frame sintético con la forma del master de Santander (sin tocar datos reales)."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2017-01-01")
+    fecha = start + pd.to_timedelta(rng.integers(0, years * 365 * 24, rows), unit="h")
+    return pd.DataFrame({
+        "departamento": "SANTANDER",
+        "municipio": np.array([f"MUNICIPIO_{i:03d}" for i in range(n_munis)])[rng.integers(0, n_munis, rows)],
+        "fecha_hecho": fecha,
+        "cantidad": rng.integers(1, 4, rows).astype(float),
+    })
+
+@contextmanager
+def _patched(module, **values):
+    """Atributos de `module` reemplazados mientras dura el bloque: un bench que apunta las
+    rutas a un directorio temporal no deja a los siguientes leyendo de uno ya borrado."""
+    saved = {name: getattr(module, name) for name in values}
+    try:
+        for name, value in values.items():
+            setattr(module, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+@contextmanager
+def _bench_master(rows: int, geo: pd.DataFrame):
+    """El master publicado si existe; si no, uno sintético de `rows` filas en un directorio temporal."""
+    if (PROC_DIR / "master.parquet").exists():
+        yield
+        return
+    with tempfile.TemporaryDirectory() as tmp, _patched(store, PROC_DIR=Path(tmp)):
+        store.publish(_synthetic_master(rows, geo), Path(tmp) / "master.parquet")
+        yield
+
+def _timeit(fn, repeat: int = 3):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def _rolling_90d_apply(df: pd.DataFrame) -> np.ndarray:
+    # Implementación original (groupby.apply + set_index por municipio), como referencia
+    def per_group(group):
+        g = group.set_index("fecha_hecho").sort_index()
+        out = group.copy()
+        out["acumulado_90d"] = g["cantidad"].rolling("90D").sum().values
+        return out
+    return df.groupby("municipio", group_keys=False).apply(per_group)["acumulado_90d"].to_numpy()
+
+def bench_rolling(rows: int):
+    df = synthetic_events(rows).sort_values(["municipio", "fecha_hecho"], kind="mergesort")
+    features.rolling_90d(df.head(1_000))  # compilación JIT fuera de la medición
+    t_old, old = _timeit(lambda: _rolling_90d_apply(df), repeat=1)
+    t_new, new = _timeit(lambda: features.rolling_90d(df))
+    same = np.allclose(old, new)
+    print(f"📊 acumulado_90d sobre {rows:,} filas")
+    print(f"   groupby.apply : {t_old * 1000:10.1f} ms")
+    print(f"   numba         : {t_new * 1000:10.1f} ms  (x{t_old / t_new:.1f})")
+    print(f"   misma salida  : {'sí' if same else 'NO'}")
+    if not same:
+        raise SystemExit(1)
+
+def synthetic_raw_csv(path: Path, rows: int, santander: float = 0.1, seed: int = 42):
+    """CSV crudo con el formato de datos.gov.co (todo el país), escrito por bloques."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, start in enumerate(range(0, rows, 100_000)):
+            n = min(100_000, rows - start)
+            df = synthetic_events(n, seed=seed + i).drop(columns="departamento")
+            df.insert(0, "departamento", np.where(rng.random(n) < santander, "Santander", "ANTIOQUIA"))
+            df["codigo_dane"] = "68001000"
+            df["armas_medios"] = rng.choice(["ARMA BLANCA", "SIN EMPLEO DE ARMAS"], n)
+            df["fecha_hecho"] = df["fecha_hecho"].dt.strftime("%d/%m/%Y %H:%M:%S")
+            df["genero"] = rng.choice(["FEMENINO", "MASCULINO"], n)
+            df["grupo_etario"] = rng.choice(["ADULTOS", "ADOLESCENTES", "MENORES"], n)
+            df["cantidad"] = df["cantidad"].astype(int)
+            df["descripcion_conducta"] = "ARTÍCULO 229. VIOLENCIA INTRAFAMILIAR"  # columna que normalize descarta
+            df[[c for c in df.columns if c in COMMON_COLS or c == "descripcion_conducta"]] \
+                .to_csv(f, index=False, header=(i == 0))
+
+def _normalize_eager(name: str, path: Path) -> pd.DataFrame:
+    # Implementación original: todo el CSV en memoria y filtro por Santander al final
+    df = pd.read_csv(path, dtype=str)
+    df["tipo_delito"] = "violencia_intrafamiliar"
+    df["delito"] = "violencia_intrafamiliar"
+    keep = COMMON_COLS + ["delito"]
+    df = df[[c for c in df.columns if c in set(keep + ["tipo_delito","municipio","departamento"])]].copy()
+    df["cantidad"] = pd.to_numeric(df.get("cantidad", 0), errors="coerce").fillna(0).astype(int)
+    df["fecha_hecho"] = pd.to_datetime(df.get("fecha_hecho"), errors="coerce", dayfirst=True)
+    df["departamento"] = df.get("departamento", "SIN_DATO").str.strip().str.upper()
+    df["municipio"] = df.get("municipio", "SIN_DATO").str.strip().str.upper()
+    df["genero"] = df.get("genero", "SIN_DATO").fillna("SIN_DATO").str.upper()
+    df["grupo_etario"] = df.get("grupo_etario", "SIN_DATO").fillna("SIN_DATO").str.upper()
+    df = df[df["departamento"] == "SANTANDER"]
+    df.to_parquet(path.with_suffix(".eager.parquet"), index=False)
+    return df
+
+def _child_peak_rss(mode: str, path: str, queue):
+    path = Path(path)
+    etl.PROC_DIR = path.parent
+    if mode == "eager":
+        _normalize_eager("intrafamiliar", path)
+    elif mode == "streaming":
+        etl.normalize("intrafamiliar", path, use_cache=False)
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+def _peak_rss(mode: str, path: Path) -> float:
+    # Proceso nuevo por medición: ru_maxrss es el pico de toda la vida del proceso
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child_peak_rss, args=(mode, str(path), queue))
+    proc.start()
+    peak = queue.get()
+    proc.join()
+    return peak
+
+def bench_normalize(sizes):
+    print("📊 RSS pico de normalize (MB) por tamaño de la fuente")
+    print(f"   {'filas':>10} {'CSV MB':>8} {'base':>8} {'completo':>10} {'streaming':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = Path(tmp) / "intrafamiliar.csv"
+            synthetic_raw_csv(path, rows)
+            base = _peak_rss("import", path)
+            eager = _peak_rss("eager", path)
+            streaming = _peak_rss("streaming", path)
+            size_mb = path.stat().st_size / 1024 ** 2
+            print(f"   {rows:>10,} {size_mb:>8.0f} {base:>8.0f} {eager:>10.0f} {streaming:>10.0f}")
+
+def bench_ingest(rows: int, jobs: int = 3):
+    """Tiempo de build_master (descarga + normalización) con --jobs 1 y --jobs N sobre copias
+    locales de las fuentes; el comportamiento de la caché y la paridad están en tests/test_raw_cache.py."""
+    from app.config import SOURCES
+    from app.services import raw_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        served, raw, proc = tmp / "served", tmp / "raw", tmp / "processed"
+        served.mkdir()
+        per_source = max(rows // len(SOURCES), 5_000)
+        for i, name in enumerate(SOURCES):
+            synthetic_raw_csv(served / f"{name}.csv", per_source, seed=42 + i)
+        sources = etl.local_sources(served)
+        # Los procesos del pool deben heredar las rutas temporales (fork)
+        ctx = mp.get_start_method()
+        mp.set_start_method("fork", force=True)
+        try:
+            with _patched(raw_cache, RAW_DIR=raw), _patched(store, PROC_DIR=proc), \
+                    _patched(etl, RAW_DIR=raw, PROC_DIR=proc, SHARED_DATA=False):
+                times = {}
+                for n in (1, jobs):
+                    times[n], _ = _timeit(lambda: etl.build_master(jobs=n, sources=sources, force=True), repeat=1)
+                t_cached, _ = _timeit(lambda: etl.build_master(jobs=jobs, sources=sources), repeat=1)
+        finally:
+            mp.set_start_method(ctx, force=True)
+    print(f"📊 build_master con {len(SOURCES)} fuentes de {per_source:,} filas")
+    for n, t in times.items():
+        print(f"   --jobs {n:<3} {t:8.1f} s")
+    print(f"   en caché  {t_cached:8.1f} s")
+
+def _as_legacy(df: pd.DataFrame) -> pd.DataFrame:
+    # Tipos que tenía el parquet antes del esquema compacto: texto como object, enteros int64
+    legacy = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            legacy[col] = s.astype(object).where(s.notna(), None)
+        elif col in dtypes.INT_COLS or col in dtypes.BOOL_COLS:
+            legacy[col] = s.astype("float64" if s.isna().any() else "int64")
+        else:
+            legacy[col] = s
+    return pd.DataFrame(legacy)
+
+def _features_frame(rows: int) -> pd.DataFrame:
+    """El frame que sirve la API (store.features) o, si no hay datos procesados, uno sintético."""
+    if (PROC_DIR / "features.parquet").exists():
+        return store.features()
+    return _synthetic_features(rows)
+
+def _synthetic_features(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    df = synthetic_events(rows)
+    df["anio"], df["mes"] = df["fecha_hecho"].dt.year, df["fecha_hecho"].dt.month
+    df["genero"] = rng.choice(["FEMENINO", "MASCULINO", "SIN_DATO"], rows)
+    df["grupo_etario"] = rng.choice(["ADULTOS", "ADOLESCENTES", "MENORES"], rows)
+    df["tipo_delito"] = rng.choice(["delitos_sexuales", "violencia_intrafamiliar", "hurto"], rows)
+    df["dia_semana"] = df["fecha_hecho"].dt.day_name()
+    df["franja_hora"] = rng.choice(["MAÑANA", "TARDE", "NOCHE"], rows)
+    df["riesgo_alto"] = rng.integers(0, 2, rows)
+    return dtypes.compact(df)
+
+def bench_dtypes(rows: int):
+    compact = _features_frame(rows)
+    legacy = _as_legacy(compact)
+    queries = {
+        "municipio/anio/mes": ["municipio", "anio", "mes"],
+        "tipo_delito": ["tipo_delito"],
+        "genero": ["genero"],
+        "franja_hora": ["franja_hora"],
+        "dia_semana": ["dia_semana"],
+    }
+    mb = lambda df: df.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"📊 Frame de features en memoria ({len(compact):,} filas, {compact.shape[1]} columnas)")
+    print(f"   {'':32} {'object/int64':>14} {'compacto':>12}")
+    print(f"   {'memoria (MB)':32} {mb(legacy):>14.1f} {mb(compact):>12.1f}")
+    for label, by in queries.items():
+        t_old, _ = _timeit(lambda: legacy.groupby(by, observed=True)["cantidad"].sum())
+        t_new, _ = _timeit(lambda: compact.groupby(by, observed=True)["cantidad"].sum())
+        print(f"   {'groupby ' + label + ' (ms)':32} {t_old * 1000:>14.1f} {t_new * 1000:>12.1f}")
+
+def _recent_iterrows(df: pd.DataFrame) -> list:
+    # Implementación original de /crimes/recent: sort completo + iterrows + un modelo por fila
+    df = df.sort_values("fecha_hecho", ascending=False).head(100)
+    out = []
+    for i, r in df.iterrows():
+        out.append(CrimeRecentRecord(
+            id=f"#{i:03d}",
+            tipo=str(r.get("tipo_delito", "OTRO")),
+            descripcion=f"Reporte reciente de {r.get('delito')}",
+            ubicacion=f"{str(r.get('municipio',''))}, {str(r.get('departamento',''))}",
+            fecha=str(r["fecha_hecho"]),
+            severidad="crítica" if (r.get("cantidad", 0) or 0) >= 3 else ("alta" if (r.get("cantidad", 0) or 0) == 2 else "media"),
+            estado="En Atención",
+        ))
+    return [o.model_dump() for o in out]
+
+def _incidents_iterrows(df: pd.DataFrame, geo: pd.DataFrame) -> list:
+    # Implementación original de /geo/incidents
+    df = df.sort_values("fecha_hecho", ascending=False).head(200).reset_index(drop=True)
+    df["codigo_dane"] = df["codigo_dane"].astype(str)
+    df = df.merge(geo.assign(codigo_dane=geo["codigo_dane"].astype(str)), on="codigo_dane", how="left")
+    out = []
+    for _, r in df.iterrows():
+        out.append(GeoIncident(
+            lat=float(r.get("lat", 0)),
+            lon=float(r.get("lon", 0)),
+            severidad="crítica" if (r.get("cantidad", 0) or 0) >= 3 else ("alta" if (r.get("cantidad", 0) or 0) == 2 else "media"),
+            estado="En Atención",
+            municipio=str(r.get("municipio", "")),
+        ))
+    return [o.model_dump() for o in out]
+
+def _synthetic_master(rows: int, geo: pd.DataFrame) -> pd.DataFrame:
+    rng = np.random.default_rng(11)
+    df = synthetic_events(rows)
+    codes = geo["codigo_dane"].astype(str).to_numpy()
+    df["codigo_dane"] = codes[rng.integers(0, len(codes), rows)]
+    df["tipo_delito"] = rng.choice(["delitos_sexuales", "violencia_intrafamiliar", "hurto"], rows)
+    df["delito"] = np.where(df["tipo_delito"] == "hurto", None, df["tipo_delito"])
+    df["anio"], df["mes"] = df["fecha_hecho"].dt.year, df["fecha_hecho"].dt.month
+    df["cantidad"] = df["cantidad"].astype(int)
+    return dtypes.compact(df)
+
+def _latencies(fn, n: int) -> np.ndarray:
+    out = np.empty(n)
+    for k in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out[k] = time.perf_counter() - t0
+    return out * 1000
+
+def bench_recent(rows: int, n: int = 200):
+    from app.routers import crimes, geo as geo_router
+    geo = pd.read_csv(GEO_DIR / "municipios.csv")
+    with _bench_master(rows, geo):
+        df = store.master()
+        legacy = _as_legacy(df)
+        # __wrapped__: el endpoint síncrono, sin el carril del executor (offload lo vuelve async)
+        routes = {
+            "/crimes/recent": (lambda: _recent_iterrows(legacy), crimes.recent.__wrapped__),
+            "/geo/incidents": (
+                lambda: _incidents_iterrows(legacy, geo),
+                lambda: geo_router.incidents.__wrapped__(bbox=None, municipio=None, limit=geo_router.INCIDENTS_LIMIT),
+            ),
+        }
+        print(f"📊 Latencia por petición (ms) sobre {len(df):,} eventos del master")
+        print(f"   {'ruta':16} {'':10} {'p50':>8} {'p99':>8}")
+        for route, (old, new) in routes.items():
+            t0 = time.perf_counter()
+            new()  # primera petición de la versión: índice de recencia + serialización
+            cold = (time.perf_counter() - t0) * 1000
+            same = json.loads(new().body) == old()
+            for label, fn, reps in [("iterrows", old, max(n // 10, 5)), ("índice", new, n)]:
+                lat = _latencies(fn, reps)
+                print(f"   {route:16} {label:10} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 99):>8.2f}")
+            print(f"   {route:16} {'1ª (fría)':10} {cold:>8.2f}   misma salida: {'sí' if same else 'NO'}")
+
+def _viewport_scan(df: pd.DataFrame, geo: pd.DataFrame, bbox, limit: int) -> np.ndarray:
+    # Sin índice: join de coordenadas + máscara + orden sobre todo el master en cada petición
+    coords = geo.assign(codigo_dane=geo["codigo_dane"].astype(str)).set_index("codigo_dane")
+    codes = df["codigo_dane"].astype(str)
+    lat, lon = codes.map(coords["lat"]).to_numpy(), codes.map(coords["lon"]).to_numpy()
+    min_lon, min_lat, max_lon, max_lat = bbox
+    pos = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon))
+    fecha = df["fecha_hecho"].iloc[pos].reset_index(drop=True).sort_values(ascending=False)
+    return pos[fecha.index.to_numpy()[:limit]]
+
+def bench_geo(rows: int, n: int = 200, limit: int = 200):
+    from app.services import geoindex
+    geo = pd.read_csv(GEO_DIR / "municipios.csv")
+    with _bench_master(rows, geo):
+        snap = store.snapshot("master")
+        t0 = time.perf_counter()
+        idx = geoindex.current(snap)
+        build = (time.perf_counter() - t0) * 1000
+        # Viewports aleatorios de ~0.2 a 1 grado alrededor de municipios del CSV
+        rng = np.random.default_rng(3)
+        centers = geo[["lon", "lat"]].to_numpy()[rng.integers(0, len(geo), n)]
+        half = rng.uniform(0.1, 0.5, (n, 1))
+        boxes = [tuple(b) for b in np.hstack([centers - half, centers + half])]
+        # Los empates de fecha pueden salir en otro orden: se compara la secuencia de fechas
+        fecha = snap.df["fecha_hecho"].to_numpy()
+        same = all(
+            np.array_equal(fecha[idx.query(bbox=b, limit=limit)], fecha[_viewport_scan(snap.df, geo, b, limit)])
+            for b in boxes[:20]
+        )
+        it = iter(boxes * 2)
+        scan = _latencies(lambda: _viewport_scan(snap.df, geo, next(it), limit), max(n // 10, 5))
+        it = iter(boxes)
+        indexed = _latencies(lambda: idx.query(bbox=next(it), limit=limit), n)
+        print(f"📊 Incidentes por viewport (top {limit}) sobre {len(snap.df):,} eventos del master")
+        print(f"   construcción del índice: {build:.1f} ms (una vez por versión)")
+        print(f"   {'':10} {'p50':>8} {'p99':>8}")
+        for label, lat in [("escaneo", scan), ("índice", indexed)]:
+            print(f"   {label:10} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 99):>8.2f}")
+        print(f"   misma salida: {'sí' if same else 'NO'}")
+
+def _query_masks(df: pd.DataFrame, filters: dict, limit: int) -> pd.DataFrame:
+    # Implementación original de /crimes/query: máscaras sobre columnas completas + sort del resultado
+    filt = np.ones(len(df), dtype=bool)
+    for col, value in filters.items():
+        filt &= (df[col] == value).to_numpy()
+    return df.loc[filt].sort_values("fecha_hecho", ascending=False).head(limit)
+
+def bench_query(rows: int, n: int = 200, limit: int = 100):
+    from app.services import query_engine
+    geo = pd.read_csv(GEO_DIR / "municipios.csv")
+    with _bench_master(rows, geo):
+        snap = store.snapshot("master")
+        df, legacy = snap.df, _as_legacy(snap.df)
+        t0 = time.perf_counter()
+        engine = query_engine.current(snap)
+        build = (time.perf_counter() - t0) * 1000
+        muni = df["municipio"].value_counts()
+        year = int(df["anio"].max())
+        cases = {
+            "departamento": {"departamento": "SANTANDER"},
+            "municipio": {"departamento": "SANTANDER", "municipio": muni.index[0]},
+            "municipio chico": {"departamento": "SANTANDER", "municipio": muni[muni > 0].index[-1]},
+            "tipo + anio": {"departamento": "SANTANDER", "tipo_delito": "hurto", "anio": year},
+            "anio + mes": {"departamento": "SANTANDER", "anio": year, "mes": 3},
+        }
+        fecha = df["fecha_hecho"].to_numpy()
+        print(f"📊 /crimes/query (top {limit}) sobre {len(df):,} eventos del master")
+        print(f"   construcción de índices: {build:.1f} ms (una vez por versión)")
+        print(f"   {'filtros':16} {'máscaras p50':>13} {'índices p50':>12} {'p99':>8}  misma salida")
+        for label, filters in cases.items():
+            old = _query_masks(legacy, filters, limit)
+            pos, _ = engine.search(filters, limit)
+            # Los empates de fecha pueden salir en otro orden: misma secuencia de fechas y
+            # mismas filas salvo las empatadas con la última fecha de la página
+            newer = fecha[pos] > old["fecha_hecho"].min() if len(old) else []
+            same = np.array_equal(fecha[pos], old["fecha_hecho"].to_numpy()) and \
+                set(df.index[pos][newer]) == set(old.index[old["fecha_hecho"] > old["fecha_hecho"].min()])
+            t_old = _latencies(lambda: _query_masks(legacy, filters, limit), max(n // 10, 5))
+            t_new = _latencies(lambda: df.iloc[engine.search(filters, limit)[0]], n)
+            print(f"   {label:16} {np.percentile(t_old, 50):>13.2f} {np.percentile(t_new, 50):>12.2f} "
+                  f"{np.percentile(t_new, 99):>8.2f}  {'sí' if same else 'NO'}")
+
+def bench_risk(n_munis: int = 87):
+    # Grilla de un año completo: la petición típica de las herramientas de planeación
+    from app.services import risk
+    if not (PROC_DIR / "features.parquet").exists() or not (store.model_dir() / store.MODEL_FILE).exists():
+        print("⚠️ --risk necesita features.parquet y risk_model.pkl (corre el pipeline primero)")
+        return
+    model = store.model().data
+    snap = store.snapshot("features")
+    df = snap.df
+    year = int(df["anio"].max())
+    keys = [("SANTANDER", m, year, mes) for m in sorted(df["municipio"].dropna().unique())[:n_munis] for mes in range(1, 13)]
+
+    def per_row():
+        out = []
+        for dep, muni, anio, mes in keys:
+            filt = (df["departamento"] == dep) & (df["anio"] == anio) & (df["mes"] == mes) & (df["municipio"] == muni)
+            cand = df.loc[filt]
+            if not cand.empty:
+                X = cand.sort_values("cantidad", ascending=False).head(1)[risk.MODEL_FEATURES]
+                out.append(model.predict_proba(X)[0, 1])
+        return out
+
+    def batch():
+        table = snap.derived("risk.lookup", risk.lookup_table)
+        pos = table.positions(keys)
+        return risk.score(model, table.X.iloc[pos[pos >= 0]])
+
+    t0 = time.perf_counter()
+    snap.derived("risk.lookup", risk.lookup_table)
+    build = (time.perf_counter() - t0) * 1000
+    t_old, _ = _timeit(per_row, repeat=1)
+    t_new, _ = _timeit(batch)
+    print(f"📊 Riesgo para {len(keys):,} combinaciones (municipio, mes) de {year}")
+    print(f"   tabla indexada: {build:.1f} ms (una vez por versión del features)")
+    print(f"   fila por fila (máscaras + predict_proba): {t_old * 1000:10.1f} ms")
+    print(f"   lote (tabla + un predict_proba)         : {t_new * 1000:10.1f} ms  (x{t_old / t_new:.0f})")
+
+def _training_frame(rows: int) -> pd.DataFrame:
+    """features de Santander (o sintético con la misma forma), remuestreado a `rows` filas."""
+    from app.services import train
+    path = PROC_DIR / "features.parquet"
+    if path.exists():
+        df = pd.read_parquet(path, columns=train.FEATURES + [train.TARGET])
+        df = df[df["departamento"] == "SANTANDER"]
+    else:
+        rng = np.random.default_rng(5)
+        n = min(rows, 200_000)
+        df = pd.DataFrame({
+            "departamento": "SANTANDER",
+            "anio": rng.integers(2017, 2025, n), "mes": rng.integers(1, 13, n),
+            "tasa_delitos_muni_mes_lag": rng.gamma(2.0, 20.0, n),
+            "tasa_delitos_dep_mes_lag": rng.gamma(5.0, 4.0, n),
+            "acumulado_90d": rng.poisson(30, n).astype(float),
+        })
+        logit = 0.04 * (df["tasa_delitos_muni_mes_lag"] - 40) + 0.05 * (df["acumulado_90d"] - 30)
+        df[train.TARGET] = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    if rows > len(df):
+        df = df.sample(n=rows, replace=True, random_state=0)
+    return df
+
+def bench_models(rows: int, backends=None):
+    from app.services import model_metrics, train
+    df = _training_frame(rows)
+    X_train, y_train, X_test, y_test = train.temporal_split(df)
+    batch = X_test.sample(n=10_000, replace=True, random_state=1)
+    print(f"📊 Backends del modelo de riesgo ({len(X_train):,} filas de train, {len(X_test):,} de validación, {os.cpu_count()} núcleos)")
+    print(f"   {'backend':12} {'train (s)':>10} {'10k filas (ms)':>15} {'ROC-AUC':>9} {'PR-AUC':>8}")
+    for backend in backends or train.BACKENDS:
+        model = train.build_pipeline(backend)
+        t_fit, _ = _timeit(lambda: model.fit(X_train, y_train), repeat=1)
+        t_inf, _ = _timeit(lambda: model.predict_proba(batch))
+        y_proba = model.predict_proba(X_test)[:, 1]
+        m = model_metrics.evaluate(y_test, model.predict(X_test), y_proba)
+        print(f"   {backend:12} {t_fit:>10.1f} {t_inf * 1000:>15.1f} {m['roc_auc']:>9.3f} {m['pr_auc']:>8.3f}")
+
+def _chat_context_scan(df: pd.DataFrame, pregunta: str):
+    # Implementación original de /chatbot/ask: normalizar todos los .unique() y filtrar el frame
+    from app.services.chat_index import DIMENSIONS, normalize
+    texto = normalize(pregunta)
+    found = {}
+    for dim in DIMENSIONS:
+        lista = df[dim].dropna().unique()
+        found[dim] = next((lista[i] for i, item in enumerate([normalize(v) for v in lista]) if item in texto), None)
+    sub = df
+    for dim, value in found.items():
+        if value:
+            sub = sub[sub[dim] == value]
+    hora = sub["franja_hora"].value_counts().idxmax() if not found["franja_hora"] and not sub.empty else (found["franja_hora"] or "SIN_DATO")
+    muni_counts = sub["municipio"].value_counts()
+    return found, int(sub["cantidad"].sum()), hora, muni_counts[muni_counts > 0].head(3).index.tolist()
+
+def _chat_context_index(index, cube, pregunta: str):
+    found = index.detect(pregunta)
+    hora_counts = cube.sum(by=["franja_hora"], where=found, measure="filas").sort_values(ascending=False)
+    hora = hora_counts.index[0] if not found["franja_hora"] and len(hora_counts) else (found["franja_hora"] or "SIN_DATO")
+    muni_counts = cube.sum(by=["municipio"], where=found, measure="filas").sort_values(ascending=False)
+    return found, int(cube.sum(where=found)), hora, muni_counts.head(3).index.tolist()
+
+def bench_chat(rows: int, n: int = 200):
+    from app.services import chat_index, olap
+    df = _synthetic_features(rows)
+    rng = np.random.default_rng(5)
+    names = {d: df[d].dropna().unique().tolist() for d in chat_index.DIMENSIONS}
+    preguntas = [
+        " ".join(["¿cómo está la seguridad"] + [str(rng.choice(names[d])).lower() for d in rng.choice(chat_index.DIMENSIONS, rng.integers(0, 4), replace=False)] + ["?"])
+        for _ in range(n)
+    ]
+    t_build, (index, cube) = _timeit(lambda: (chat_index.EntityIndex(df), olap.Cube.from_frame(df)), repeat=1)
+    same = all(_chat_context_scan(df, q) == _chat_context_index(index, cube, q) for q in preguntas[:50])
+    it = iter(preguntas * 2)
+    t_old = _latencies(lambda: _chat_context_scan(df, next(it)), 30)
+    t_new = _latencies(lambda: _chat_context_index(index, cube, next(it)), n)
+    print(f"📊 Contexto de /chatbot/ask ({len(df):,} filas; índice + cubo en {t_build * 1000:.0f} ms, una vez por versión)")
+    print(f"   {'':22} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print(f"   {'unique + filtros':22} {np.percentile(t_old, 50):>10.2f} {np.percentile(t_old, 99):>10.2f}")
+    print(f"   {'autómata + cubo':22} {np.percentile(t_new, 50):>10.2f} {np.percentile(t_new, 99):>10.2f}")
+    print(f"   mismo contexto: {'sí' if same else 'NO'}")
+
+def _cube_queries(df: pd.DataFrame, cube, anio: int, mes: int, municipio: str) -> dict:
+    # Agregados de risk_predict, distribution_municipios y chatbot._summary: recorriendo el frame y desde el cubo
+    dims = ["genero", "grupo_etario", "dia_semana", "franja_hora", "tipo_delito"]
+    return {
+        "risk_predict (5 dims, mes)": (
+            lambda: [df[(df["anio"] == anio) & (df["mes"] == mes)].groupby(d, observed=True)["cantidad"].sum() for d in dims],
+            lambda: [cube.sum(by=[d], where={"anio": anio, "mes": mes}) for d in dims],
+        ),
+        "distribution_municipios": (
+            lambda: [df[df["anio"] == anio].groupby("municipio", observed=True)["cantidad"].sum()],
+            lambda: [cube.sum(by=["municipio"], where={"anio": anio})],
+        ),
+        "chatbot._summary": (
+            lambda: [df[df["municipio"] == municipio].groupby(d, observed=True)["cantidad"].sum() for d in ("franja_hora", "municipio")],
+            lambda: [cube.sum(by=[d], where={"municipio": municipio}) for d in ("franja_hora", "municipio")],
+        ),
+    }
+
+def bench_cube(rows: int, n: int = 50):
+    from app.services import olap
+    df = _synthetic_features(rows)
+    t_build, cube = _timeit(lambda: olap.Cube.from_frame(df), repeat=1)
+    anio, mes = (int(v) for v in cube.sum(by=["anio", "mes"], measure="filas").index[-1])
+    queries = _cube_queries(df, cube, anio, mes, str(df["municipio"].iloc[0]))
+    print(f"📊 Cubo OLAP ({len(df):,} filas -> {len(cube):,} celdas en {t_build * 1000:.0f} ms, una vez por versión)")
+    print(f"   {'':28} {'groupby p50 (ms)':>17} {'cubo p50 (ms)':>14} {'mismo resultado':>16}")
+    for label, (scan, query) in queries.items():
+        same = all(a.equals(b.astype(a.dtype)) for a, b in zip(scan(), query()))  # la primera consulta crea el roll-up
+        t_old, t_new = _latencies(scan, n), _latencies(query, n)
+        print(f"   {label:28} {np.percentile(t_old, 50):>17.2f} {np.percentile(t_new, 50):>14.2f} {'sí' if same else 'NO':>16}")
+
+def _stub_words(n: int, tokens: int) -> list:
+    return ["Respuesta", " de", " prueba", f" #{n}"] + [f" palabra{i}" for i in range(tokens)]
+
+def stub_llm_app(delay: float = 0.5, tokens: int = 0, token_delay: float = 0.0):
+    """Servidor local con /chat/completions compatible con OpenAI para probar el chatbot sin red:
+    uvicorn app.services.bench:stub_llm_app --factory --port 8099
+    y OPENAI_EMBEDDINGS_URL=http://127.0.0.1:8099
+
+    `delay` es la espera hasta el primer fragmento y `token_delay` la de cada fragmento
+    siguiente; con "stream": true responde en SSE (chat.completion.chunk) como la API real."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.sent = 0        # fragmentos enviados en modo stream
+    app.state.cancelled = 0   # streams cortados por el cliente antes de terminar
+
+    @app.post("/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        n, model = app.state.calls, body.get("model", "stub")
+        words = _stub_words(n, tokens)
+        if not body.get("stream"):
+            await asyncio.sleep(delay + token_delay * (len(words) - 1))
+            return {
+                "id": f"stub-{n}", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(words)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+
+        def chunk(delta: dict, finish=None) -> str:
+            data = {"id": f"stub-{n}", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events():
+            done = False
+            try:
+                await asyncio.sleep(delay)
+                yield chunk({"role": "assistant", "content": ""})
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(token_delay)
+                    yield chunk({"content": word})
+                    app.state.sent += 1
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+                done = True
+            finally:
+                if not done:
+                    app.state.cancelled += 1
+        return StreamingResponse(events(), media_type="text/event-stream")
+    return app
+
+def _serve_in_thread(app):
+    import socket
+    import threading
+    import uvicorn
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+def bench_llm(concurrency: int = 50, delay: float = 0.5):
+    """Llamadas remotas y tiempo del gateway frente a llamar al modelo directamente; el contrato
+    (single-flight, caché, versión, respaldo, LRU) está en tests/test_llm_gateway.py."""
+    from openai import AsyncOpenAI
+    from app.services import llm
+    app = stub_llm_app(delay)
+    server, url = _serve_in_thread(app)
+    messages = [("system", "Eres un asistente comunitario."), ("user", "¿Qué tan seguro es Bucaramanga en la noche?")]
+    variant = [("system", "Eres un asistente comunitario."), ("user", "  ¿que tan SEGURO es bucaramanga en la noche? ")]
+
+    async def run():
+        client = AsyncOpenAI(base_url=url, api_key="stub", max_retries=0)
+        rows = []
+        # Antes: una llamada remota por petición, aunque sean idénticas
+        app.state.calls = 0
+        t0 = time.perf_counter()
+        await asyncio.gather(*[client.chat.completions.create(
+            model="stub", messages=[{"role": r, "content": c} for r, c in messages]) for _ in range(concurrency)])
+        rows.append((f"{concurrency} idénticas, sin gateway", app.state.calls, time.perf_counter() - t0))
+        gw = llm.Gateway(client, model="stub", timeout=10 * delay)
+        app.state.calls = 0
+        t0 = time.perf_counter()
+        await asyncio.gather(*[gw.complete(messages, "respaldo", "v1") for _ in range(concurrency)])
+        rows.append((f"{concurrency} idénticas, single-flight", app.state.calls, time.perf_counter() - t0))
+        app.state.calls = 0
+        t0 = time.perf_counter()
+        for _ in range(concurrency):
+            await gw.complete(variant, "respaldo", "v1")
+        rows.append((f"{concurrency} repetidas, caché", app.state.calls, time.perf_counter() - t0))
+        app.state.calls = 0
+        t0 = time.perf_counter()
+        await gw.complete(messages, "respaldo", "v2")
+        rows.append(("nueva versión de datos", app.state.calls, time.perf_counter() - t0))
+        slow = llm.Gateway(client, model="stub", timeout=delay / 5)
+        t0 = time.perf_counter()
+        await slow.complete(messages, "respaldo", "v1")
+        rows.append(("timeout -> respaldo", 1, time.perf_counter() - t0))
+        return rows, gw.stats
+
+    rows, stats = asyncio.run(run())
+    server.should_exit = True
+    print(f"📊 Gateway LLM contra servidor local (latencia simulada {delay * 1000:.0f} ms)")
+    print(f"   {'':34} {'llamadas':>9} {'tiempo (ms)':>12}")
+    for label, calls, secs in rows:
+        print(f"   {label:40} {calls:>9} {secs * 1000:>12.0f}")
+    print(f"   stats del gateway: {dict(stats)}")
+
+def bench_stream(tokens: int = 40, delay: float = 0.3, token_delay: float = 0.02):
+    """/chatbot/ask vs /chatbot/ask/stream (API real + modelo local simulado): tiempo hasta el
+    resumen, hasta el primer fragmento y total. El orden de los eventos y la cancelación al
+    desconectarse el cliente están en tests/test_chat_stream.py."""
+    import httpx
+    from httpx_sse import aconnect_sse
+    from openai import AsyncOpenAI
+    from app.main import app as api
+    from app.services import llm
+    stub = stub_llm_app(delay, tokens, token_delay)
+    stub_server, stub_url = _serve_in_thread(stub)
+    api_server, api_url = _serve_in_thread(api)
+    gateway = llm.Gateway(AsyncOpenAI(base_url=stub_url, api_key="stub", max_retries=0), model="stub")
+    body = {"pregunta": "¿Cuántos hurtos hubo en Bucaramanga en la madrugada?"}
+
+    async def run():
+        rows = []
+        async with httpx.AsyncClient(base_url=api_url, timeout=30) as client:
+            gateway.cache.clear()
+            t0 = time.perf_counter()
+            await client.post("/chatbot/ask", json=body)
+            total = time.perf_counter() - t0
+            rows.append(("/ask", total, total, total))
+
+            gateway.cache.clear()
+            marks = {}
+            t0 = time.perf_counter()
+            async with aconnect_sse(client, "POST", "/chatbot/ask/stream", json=body) as source:
+                async for sse in source.aiter_sse():
+                    marks.setdefault(sse.event, time.perf_counter() - t0)
+            rows.append(("/ask/stream", marks["resumen"], marks["token"], marks["fin"]))
+            return rows
+    try:
+        with _patched(llm, _gateway=gateway):
+            rows = asyncio.run(run())
+    finally:
+        api_server.should_exit = stub_server.should_exit = True
+    words = len(_stub_words(0, tokens))
+    print(f"📊 Chatbot en streaming ({words} fragmentos, {delay * 1000:.0f} ms al primero y {token_delay * 1000:.0f} ms entre fragmentos)")
+    print(f"   {'':14} {'resumen (ms)':>13} {'1er token (ms)':>15} {'total (ms)':>11}")
+    for label, first, token, total in rows:
+        print(f"   {label:14} {first * 1000:>13.0f} {token * 1000:>15.0f} {total * 1000:>11.0f}")
+
+def threadpool_app():
+    """La API con sus endpoints síncronos originales en el threadpool de Starlette (sin carriles
+    ni límites), para comparar con executor.py: uvicorn app.services.bench:threadpool_app --factory"""
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from fastapi.routing import APIRoute
+    from app.main import app as api
+
+    @asynccontextmanager
+    async def lifespan(_):
+        store.preload()
+        yield
+    legacy = FastAPI(lifespan=lifespan)
+    legacy.add_api_route("/health", lambda: {"status": "ok"}, methods=["GET"])
+    for route in api.routes:
+        if isinstance(route, APIRoute) and route.path != "/health":
+            legacy.add_api_route(route.path, getattr(route.endpoint, "__wrapped__", route.endpoint),
+                                 methods=list(route.methods), response_model=route.response_model)
+    return legacy
+
+def _serve_process(target: str, factory: bool = False):
+    # La API en otro proceso: el cliente del benchmark no compite por su GIL
+    import socket
+    import subprocess
+    import sys
+    import httpx
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    cmd = [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd + (["--factory"] if factory else []))
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{target} no arrancó")
+
+def _probe(url: str, paths, ready, stop, queue):
+    # Peticiones baratas mientras dura la ráfaga, desde otro proceso (su latencia no incluye al cliente de la ráfaga)
+    import httpx
+    out = {p: [] for p in paths}
+    with httpx.Client(base_url=url, timeout=300) as client:
+        ready.set()
+        while not stop.is_set():
+            for p in paths:
+                t0 = time.perf_counter()
+                client.get(p)
+                out[p].append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.02)
+    queue.put(out)
+
+async def _burst(url: str, path: str, burst: int) -> dict:
+    import httpx
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=httpx.Limits(max_connections=burst)) as client:
+        responses = await asyncio.gather(*[client.get(path) for _ in range(burst)])
+    statuses = {}
+    for r in responses:
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+    return statuses
+
+def bench_executor(burst: int = 200, path: str = "/analytics/metrics?rescore=true"):
+    import httpx
+    probes = ["/health", "/crimes/recent"]
+    ctx = mp.get_context("spawn")
+    print(f"📊 Ráfaga de {burst} × {path} con sondeo de {', '.join(probes)}")
+    print(f"   {'':26} {'ráfaga (s)':>10} {'respuestas':>18} " + " ".join(f"{p + ' p50/p99 (ms)':>30}" for p in probes))
+    for label, target, factory in [("threadpool sin límites", "app.services.bench:threadpool_app", True),
+                                   ("carriles + load shedding", "app.main:app", False)]:
+        proc, url = _serve_process(target, factory)
+        ready, stop, queue = ctx.Event(), ctx.Event(), ctx.Queue()
+        prober = ctx.Process(target=_probe, args=(url, probes, ready, stop, queue))
+        try:
+            prober.start()
+            ready.wait()
+            time.sleep(0.5)
+            t0 = time.perf_counter()
+            statuses = asyncio.run(_burst(url, path, burst))
+            elapsed = time.perf_counter() - t0
+            stop.set()
+            latencies = queue.get()
+            prober.join()
+            metrics = None if factory else httpx.get(f"{url}/metrics/executor").json()
+        finally:
+            proc.terminate()
+            proc.wait()
+        codes = ", ".join(f"{n}×{code}" for code, n in sorted(statuses.items()))
+        cols = " ".join(f"{np.percentile(latencies[p], 50):>14.1f} / {np.percentile(latencies[p], 99):>11.1f}" for p in probes)
+        print(f"   {label:26} {elapsed:>10.2f} {codes:>18} {cols}")
+        if metrics:
+            heavy = metrics["lanes"]["heavy"]
+            print(f"   métricas heavy: aceptadas {heavy['accepted']}, rechazadas {heavy['rejected']}, "
+                  f"plazo en cola {heavy['queue_timeouts']}, 504 {heavy['timeouts']}; "
+                  f"por ruta: { {k: v['shed'] for k, v in metrics['routes'].items() if v['shed']} }")
+
+def bench_http_cache(n: int = 100):
+    import httpx
+    paths = ["/analytics/municipios", "/analytics/distribution/municipios", "/analytics/risk/predict",
+             "/analytics/prediction/trend", "/analytics/metrics", "/analytics/kpis"]
+    proc, url = _serve_process("app.main:app")
+    print(f"📊 Latencia por petición (ms, p50 / p99 de {n}) contra uvicorn: sin caché, cuerpo en caché y 304")
+    print(f"   {'ruta':36} {'sin caché':>16} {'en caché':>16} {'304':>16}")
+    try:
+        with httpx.Client(base_url=url, timeout=300) as client:
+            for path in paths:
+                # Un parámetro distinto en cada petición (que el endpoint ignora) fuerza el fallo de caché
+                miss = _latencies(lambda it=iter(range(n)): client.get(f"{path}?_={next(it)}"), n)
+                etag = client.get(path).headers["etag"]
+                hit = _latencies(lambda: client.get(path), n)
+                not_modified = _latencies(lambda: client.get(path, headers={"If-None-Match": etag}), n)
+                cols = " ".join(f"{np.percentile(t, 50):>7.2f} / {np.percentile(t, 99):>6.2f}" for t in (miss, hit, not_modified))
+                print(f"   {path:36} {cols}")
+            print(f"   métricas: {client.get('/metrics/cache').json()}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def _smaps() -> dict:
+    # MB según el kernel: Rss cuenta completas las páginas compartidas en cada proceso,
+    # Pss las reparte entre los procesos que las mapean y Anonymous es la memoria propia
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Anonymous"):
+                out[key] = int(rest.split()[0]) / 1024
+    return out
+
+def _child_worker_memory(proc_dir: str, shared: bool, barrier, queue):
+    # Un worker de la API: carga los datasets como en el arranque y toca todas sus columnas
+    store.PROC_DIR = Path(proc_dir)
+    store.SHARED_DATA = shared
+    base = _smaps()
+    t0 = time.perf_counter()
+    store.preload()
+    load = (time.perf_counter() - t0) * 1000
+    for name in store.DATASETS:
+        df = store.snapshot(name).df
+        for col in df.columns:
+            df[col].count()
+    # Se mide con todos los workers vivos y cargados: así Pss reparte lo compartido entre N
+    barrier.wait()
+    after = _smaps()
+    queue.put({"load_ms": load, **{k: after[k] - base[k] for k in after}})
+    barrier.wait()
+
+def bench_workers(rows: int, workers: int = 4):
+    geo = pd.read_csv(GEO_DIR / "municipios.csv")
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp, _patched(store, PROC_DIR=Path(tmp)):
+        store.publish(_synthetic_features(rows), Path(tmp) / "features.parquet")
+        store.publish(_synthetic_master(rows, geo), Path(tmp) / "master.parquet")
+        for name in store.DATASETS:
+            store.share(name)
+        print(f"📊 Memoria por worker (MB, sobre el proceso sin datos) con {workers} workers: features + master de {rows:,} filas")
+        print(f"   {'':24} {'carga (ms)':>10} {'RSS':>8} {'PSS':>8} {'anónima':>8} {'PSS total':>10}")
+        for label, shared in [("parquet en cada worker", False), ("arrow mapeado", True)]:
+            barrier, queue = ctx.Barrier(workers), ctx.Queue()
+            procs = [ctx.Process(target=_child_worker_memory, args=(tmp, shared, barrier, queue)) for _ in range(workers)]
+            for proc in procs:
+                proc.start()
+            results = [queue.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+            mean = {k: np.mean([r[k] for r in results]) for k in results[0]}
+            total = sum(r["Pss"] for r in results)
+            print(f"   {label:24} {mean['load_ms']:>10.0f} {mean['Rss']:>8.1f} {mean['Pss']:>8.1f} "
+                  f"{mean['Anonymous']:>8.1f} {total:>10.1f}")
+
+def _refresh_master(rows: int, geo: pd.DataFrame) -> pd.DataFrame:
+    # Master con las columnas que usa features._prepare, en orden de llegada (por fecha)
+    rng = np.random.default_rng(13)
+    df = _synthetic_master(rows, geo).sort_values("fecha_hecho", kind="mergesort").reset_index(drop=True)
+    df["genero"] = rng.choice(["FEMENINO", "MASCULINO", "SIN_DATO"], rows)
+    df["grupo_etario"] = rng.choice(["ADULTOS", "ADOLESCENTES", "MENORES"], rows)
+    df["armas_medios"] = rng.choice(["ARMA BLANCA", "SIN EMPLEO DE ARMAS"], rows)
+    df["dia"] = df["fecha_hecho"].dt.day
+    return dtypes.compact(df)
+
+def bench_features_refresh(rows: int, daily: int = 500):
+    """Refresco diario: el master recibe `daily` filas del día siguiente al último cargado."""
+    geo = pd.read_csv(GEO_DIR / "municipios.csv")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        parts = tmp / "features_parts"
+        with _patched(store, PROC_DIR=tmp), _patched(features, PROC_DIR=tmp, PARTS_DIR=parts,
+                                                      MANIFEST=parts / "_manifest.parquet", SHARED_DATA=False):
+            master = _refresh_master(rows, geo)
+            store.publish(master, tmp / "master.parquet")
+            features.rolling_90d(master.head(1_000))  # compilación JIT fuera de la medición
+            features.build()
+
+            new = master.tail(daily).copy()
+            new["fecha_hecho"] = master["fecha_hecho"].max().normalize() + pd.Timedelta(days=1, hours=12)
+            new["anio"], new["mes"], new["dia"] = new["fecha_hecho"].dt.year, new["fecha_hecho"].dt.month, new["fecha_hecho"].dt.day
+            store.publish(dtypes.compact(pd.concat([master, new], ignore_index=True)), tmp / "master.parquet")
+
+            before = {p: p.stat().st_mtime_ns for p in features.PARTS_DIR.glob("*.parquet") if p != features.MANIFEST}
+            t_inc, _ = _timeit(lambda: features.build(incremental=True), repeat=1)
+            rewritten = sum(p.stat().st_mtime_ns != before.get(p) for p in features.PARTS_DIR.glob("*.parquet")
+                            if p != features.MANIFEST)
+            incremental = pd.read_parquet(tmp / "features.parquet")
+            t_full, _ = _timeit(lambda: features.build(), repeat=1)
+            same = incremental.equals(pd.read_parquet(tmp / "features.parquet"))
+    print(f"📊 features.parquet tras cargar {daily:,} filas de un día sobre {rows:,}")
+    print(f"   build completo     : {t_full * 1000:10.1f} ms")
+    print(f"   build incremental  : {t_inc * 1000:10.1f} ms  (x{t_full / t_inc:.1f})")
+    print(f"   meses reescritos   : {rewritten} de {len(before)}")
+    print(f"   misma salida       : {'sí' if same else 'NO'}")
+    if not same:
+        raise SystemExit(1)
+
+def bench_compiled(sizes=(1, 10, 100, 10_000)):
+    from app.services import compiled, risk
+    if not (PROC_DIR / "features.parquet").exists() or not (store.model_dir() / store.MODEL_FILE).exists():
+        print("⚠️ --compiled necesita features.parquet y risk_model.pkl (corre el pipeline primero)")
+        return
+    pipeline = store.model()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = compiled.export(pipeline.data, Path(tmp) / compiled.COMPILED_FILE, pipeline.version)
+        fast = compiled._load(path)
+    X = store.features()[risk.MODEL_FEATURES]
+    print(f"📊 Inferencia {fast.kind}: Pipeline (pkl) vs arreglos compilados")
+    print(f"   {'filas':>8} {'Pipeline p50':>14} {'compilado p50':>15} {'p99':>9}  (µs)")
+    for n in sizes:
+        batch = X.sample(n=n, replace=True, random_state=n)
+        t_old = _latencies(lambda: pipeline.data.predict_proba(batch), 50 if n < 10_000 else 5) * 1000
+        t_new = _latencies(lambda: fast.predict_proba(batch), 500 if n < 10_000 else 20) * 1000
+        print(f"   {n:>8,} {np.percentile(t_old, 50):>14.0f} {np.percentile(t_new, 50):>15.0f} {np.percentile(t_new, 99):>9.0f}")
+    print(f"   paridad: máx |Δp| = {compiled.parity(pipeline.data, fast, X):.2e} en {len(X):,} filas")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--rolling", action="store_true")
+    parser.add_argument("--normalize", action="store_true")
+    parser.add_argument("--ingest", action="store_true",
+                        help="tiempo de build_master con --jobs 1 vs N sobre copias locales de las fuentes")
+    parser.add_argument("--dtypes", action="store_true")
+    parser.add_argument("--recent", action="store_true")
+    parser.add_argument("--geo", action="store_true")
+    parser.add_argument("--query", action="store_true")
+    parser.add_argument("--risk", action="store_true")
+    parser.add_argument("--models", action="store_true")
+    parser.add_argument("--compiled", action="store_true")
+    parser.add_argument("--chat", action="store_true")
+    parser.add_argument("--cube", action="store_true")
+    parser.add_argument("--llm", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--executor", action="store_true")
+    parser.add_argument("--http-cache", action="store_true")
+    parser.add_argument("--features-refresh", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="Memoria por worker con N procesos: parquet vs arrow mapeado")
+    parser.add_argument("--backends", nargs="*", default=None)
+    args = parser.parse_args()
+    if args.rolling:
+        bench_rolling(args.rows)
+    if args.normalize:
+        bench_normalize([args.rows // 4, args.rows, args.rows * 2])
+    if args.ingest:
+        bench_ingest(args.rows)
+    if args.dtypes:
+        bench_dtypes(args.rows)
+    if args.recent:
+        bench_recent(args.rows)
+    if args.geo:
+        bench_geo(args.rows)
+    if args.query:
+        bench_query(args.rows)
+    if args.risk:
+        bench_risk()
+    if args.models:
+        bench_models(args.rows, args.backends)
+    if args.compiled:
+        bench_compiled()
+    if args.chat:
+        bench_chat(args.rows)
+    if args.cube:
+        bench_cube(args.rows)
+    if args.llm:
+        bench_llm()
+    if args.stream:
+        bench_stream()
+    if args.executor:
+        bench_executor()
+    if args.http_cache:
+        bench_http_cache()
+    if args.features_refresh:
+        bench_features_refresh(args.rows)
+    if args.workers:
+        bench_workers(args.rows, args.workers)
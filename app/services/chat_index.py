@@ -0,0 +1,88 @@
+# app/services/chat_index.py
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from app.services import store
+
+# Entidades que el chatbot reconoce en la pregunta (en el orden del prompt); los agregados
+# del contexto salen del cubo OLAP (olap.py)
+DIMENSIONS = ["municipio", "tipo_delito", "grupo_etario", "franja_hora", "genero"]
+
+
+def normalize(text) -> str:
+    """Minúsculas y sin tildes: así se comparan la pregunta y los nombres de las entidades."""
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+class Matcher:
+    """Autómata Aho-Corasick: todas las apariciones de todos los patrones en una sola pasada."""
+
+    def __init__(self, patterns: List[Tuple[str, object]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[list] = [[]]
+        for text, payload in patterns:
+            if not text:
+                continue
+            state = 0
+            for ch in text:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.out[state].append(payload)
+        # Enlaces de fallo por niveles (BFS); cada estado hereda las salidas de su fallo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text: str):
+        state = 0
+        for ch in text:
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            yield from self.out[state]
+
+
+class EntityIndex:
+    """Nombres normalizados de las DIMENSIONS del features en un solo autómata.
+
+    Si varios valores de una dimensión aparecen en la pregunta gana el primero en orden
+    de aparición en el frame (el mismo que daba recorrer `.unique()`).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        patterns = []
+        for dim in DIMENSIONS:
+            if dim in df.columns:
+                for rank, value in enumerate(df[dim].dropna().unique()):
+                    patterns.append((normalize(value), (dim, rank, value)))
+        self.matcher = Matcher(patterns)
+
+    def detect(self, pregunta: str) -> Dict[str, Optional[str]]:
+        best: Dict[str, Tuple[int, str]] = {}
+        for dim, rank, value in self.matcher.find(normalize(pregunta)):
+            if dim not in best or rank < best[dim][0]:
+                best[dim] = (rank, value)
+        return {dim: best[dim][1] if dim in best else None for dim in DIMENSIONS}
+
+
+def entities(snap: store.Snapshot) -> EntityIndex:
+    """Índice de entidades del snapshot del features (se construye una vez por versión)."""
+    return snap.derived("chat.entities", EntityIndex)
@@ -0,0 +1,230 @@
+# app/services/compiled.py
+import argparse
+import json
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+from numba import njit
+from app.services import store
+
+# Artefacto de inferencia exportado de risk_model.pkl (risk_model.npz):
+#   preprocesamiento -> categorías del one-hot, valor de imputación, media y escala
+#   ensamble         -> todos los árboles en arreglos planos (feature, threshold,
+#                       left, right, value) + la raíz de cada árbol
+# Puntuar es recorrer esos arreglos con numba: sin DataFrame ni ColumnTransformer.
+COMPILED_FILE = "risk_model.npz"
+PARITY_TOL = 1e-6
+
+
+def _preprocessing(pre) -> dict:
+    cat = pre.named_transformers_["cat"]
+    num = pre.named_transformers_["num"]
+    (_, _, cat_cols), (_, _, num_cols) = [t for t in pre.transformers_ if t[0] in ("cat", "num")]
+    imputer, scaler = num.named_steps["imputer"], num.named_steps["scaler"]
+    fill = np.asarray(imputer.statistics_, dtype=np.float64)
+    return {
+        "cat_col": np.array(cat_cols[0]),
+        "categories": np.asarray(cat.categories_[0]).astype(str),
+        "num_cols": np.array(num_cols),
+        "fill": fill,
+        "mean": np.asarray(scaler.mean_ if scaler.with_mean else np.zeros_like(fill), dtype=np.float64),
+        "scale": np.asarray(scaler.scale_ if scaler.with_std else np.ones_like(fill), dtype=np.float64),
+    }
+
+
+def _flatten(trees) -> dict:
+    # trees: lista de (feature, threshold, left, right, value) con índices locales a cada árbol
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    for f, t, l, r, v in trees:
+        roots.append(offset)
+        leaf = f < 0
+        feature.append(np.where(leaf, -1, f))
+        threshold.append(t)
+        left.append(np.where(leaf, -1, l + offset))
+        right.append(np.where(leaf, -1, r + offset))
+        value.append(v)
+        offset += len(f)
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int32),
+    }
+
+
+def _sklearn_gb(clf, n_features: int) -> dict:
+    trees = []
+    for est in clf.estimators_[:, 0]:
+        t = est.tree_
+        trees.append((t.feature, t.threshold, t.children_left, t.children_right, t.value[:, 0, 0] * clf.learning_rate))
+    # Los árboles de sklearn comparan X en float32 con umbral float64 (x <= umbral)
+    base = float(clf._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0, 0])
+    return {**_flatten(trees), "base": base, "strict": False, "float32": True}
+
+
+def _hist_gb(clf) -> dict:
+    trees = []
+    for (predictor,) in clf._predictors:
+        n = predictor.nodes
+        if n["is_categorical"].any():
+            raise ValueError("Splits categóricos de HistGradientBoosting no soportados")
+        f = np.where(n["is_leaf"], -1, n["feature_idx"]).astype(np.int64)
+        trees.append((f, n["num_threshold"], n["left"].astype(np.int64), n["right"].astype(np.int64), n["value"]))
+    return {**_flatten(trees), "base": float(np.ravel(clf._baseline_prediction)[0]), "strict": False, "float32": False}
+
+
+def _xgboost(clf) -> dict:
+    raw = json.loads(clf.get_booster().save_raw("json"))
+    learner = raw["learner"]
+    trees = []
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        left = np.array(tree["left_children"], dtype=np.int64)
+        cond = np.array(tree["split_conditions"], dtype=np.float32).astype(np.float64)
+        f = np.where(left < 0, -1, np.array(tree["split_indices"], dtype=np.int64))
+        # En las hojas split_conditions guarda el valor de la hoja
+        trees.append((f, cond, left, np.array(tree["right_children"], dtype=np.int64), np.where(left < 0, cond, 0.0)))
+    p = float(learner["learner_model_param"]["base_score"])
+    # XGBoost compara en float32 con x < umbral
+    return {**_flatten(trees), "base": float(np.log(p / (1 - p))), "strict": True, "float32": True}
+
+
+def export(model, path: Path = None, model_version: Optional[str] = None) -> Path:
+    """Exporta el Pipeline ("pre", "clf") a arreglos NumPy en `path` (risk_model.npz).
+
+    `model_version` es store.model_version() del pkl exportado: current() solo usa el
+    compilado si coincide con la versión del Pipeline vigente."""
+    path = path or store.model_dir() / COMPILED_FILE
+    pre, clf = model.named_steps["pre"], model.named_steps["clf"]
+    arrays = _preprocessing(pre)
+    n_features = len(arrays["categories"]) + len(arrays["num_cols"])
+    kind = type(clf).__name__
+    if kind == "GradientBoostingClassifier":
+        ensemble = _sklearn_gb(clf, n_features)
+    elif kind == "HistGradientBoostingClassifier":
+        ensemble = _hist_gb(clf)
+    elif kind == "XGBClassifier":
+        ensemble = _xgboost(clf)
+    else:
+        raise ValueError(f"Clasificador {kind} sin exportador")
+    with store.atomic_path(path) as tmp:
+        with open(tmp, "wb") as f:
+            np.savez(
+                f, **arrays, **ensemble, classes=np.asarray(clf.classes_), kind=np.array(kind),
+                model_version=np.array(model_version or ""),
+            )
+    return path
+
+
+@njit(cache=True)
+def _raw_scores(X, feature, threshold, left, right, value, roots, strict):
+    out = np.empty(X.shape[0])
+    for i in range(X.shape[0]):
+        acc = 0.0
+        for t in range(roots.shape[0]):
+            node = roots[t]
+            while feature[node] >= 0:
+                x = X[i, feature[node]]
+                go_left = x < threshold[node] if strict else x <= threshold[node]
+                node = left[node] if go_left else right[node]
+            acc += value[node]
+        out[i] = acc
+    return out
+
+
+class CompiledModel:
+    """Modelo de riesgo exportado; misma interfaz que el Pipeline para predict/predict_proba."""
+
+    def __init__(self, arrays):
+        a = {k: arrays[k] for k in arrays.files}
+        self.kind = str(a["kind"])
+        self.model_version = str(a["model_version"])
+        self.classes_ = a["classes"]
+        self.cat_col = str(a["cat_col"])
+        self.categories = a["categories"].astype(object)
+        self.num_cols = [str(c) for c in a["num_cols"]]
+        self.fill, self.mean, self.scale = a["fill"], a["mean"], a["scale"]
+        self.feature, self.threshold = a["feature"], a["threshold"]
+        self.left, self.right, self.value, self.roots = a["left"], a["right"], a["value"], a["roots"]
+        self.base, self.strict, self.float32 = float(a["base"]), bool(a["strict"]), bool(a["float32"])
+
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        """Mismo resultado que model.named_steps["pre"].transform (denso)."""
+        cat = X[self.cat_col].to_numpy(dtype=object)
+        onehot = (cat[:, None] == self.categories[None, :]).astype(np.float64)
+        num = np.column_stack([X[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.num_cols])
+        num = np.where(np.isnan(num), self.fill, num)
+        Xt = np.hstack([onehot, (num - self.mean) / self.scale])
+        # El ensamble ve la misma precisión que vería el modelo original
+        return Xt.astype(np.float32).astype(np.float64) if self.float32 else Xt
+
+    def decision_function(self, X: pd.DataFrame) -> np.ndarray:
+        Xt = np.ascontiguousarray(self.transform(X))
+        return self.base + _raw_scores(Xt, self.feature, self.threshold, self.left, self.right, self.value, self.roots, self.strict)
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        p = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def _load(path: Path) -> CompiledModel:
+    with np.load(path, allow_pickle=False) as arrays:
+        model = CompiledModel(arrays)
+    model.decision_function(_warmup_frame(model))  # compilación JIT fuera de las peticiones
+    return model
+
+
+def _warmup_frame(model: CompiledModel) -> pd.DataFrame:
+    return pd.DataFrame({model.cat_col: [model.categories[0]], **{c: [0.0] for c in model.num_cols}})
+
+
+def current(pipeline: Optional[store.Snapshot] = None):
+    """Modelo para puntuar en las peticiones: el compilado si corresponde al snapshot
+    `pipeline` (el pkl vigente por defecto), si no el Pipeline de ese snapshot."""
+    pipeline = pipeline or store.model()
+    path = store.model_dir() / COMPILED_FILE
+    if path.exists():
+        compiled = store.artifact(path, _load).data
+        if compiled.model_version == pipeline.version:
+            return compiled
+    return pipeline.data
+
+
+def parity(model, compiled: CompiledModel, X: pd.DataFrame) -> float:
+    """Máxima diferencia absoluta de probabilidad entre el Pipeline y el compilado."""
+    return float(np.abs(model.predict_proba(X)[:, 1] - compiled.predict_proba(X)[:, 1]).max()) if len(X) else 0.0
+
+
+def check() -> float:
+    """Verifica el artefacto contra risk_model.pkl sobre todas las filas del features."""
+    from app.services import risk
+    pipeline = store.model()
+    compiled = _load(store.model_dir() / COMPILED_FILE)
+    X = store.features()[risk.MODEL_FEATURES]
+    diff = parity(pipeline.data, compiled, X)
+    same_version = compiled.model_version == pipeline.version
+    ok = diff <= PARITY_TOL and same_version
+    print(f"{'✅' if ok else '❌'} {compiled.kind}: máx |Δp| = {diff:.2e} en {len(X):,} filas"
+          f" (tolerancia {PARITY_TOL:g}); versión del pkl {'coincide' if same_version else 'NO coincide'}")
+    if not same_version:
+        print(f"   compilado de {compiled.model_version or '?'}, pkl vigente {pipeline.version}: "
+              f"python -m app.services.compiled --export")
+    return diff if ok else float("inf")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export", action="store_true", help="Exporta risk_model.pkl a risk_model.npz")
+    parser.add_argument("--check", action="store_true", help="Compara probabilidades con risk_model.pkl")
+    args = parser.parse_args()
+    if args.export:
+        model = store.model()
+        print(f"✅ Modelo exportado en {export(model.data, model_version=model.version)}")
+    if args.check and check() == float("inf"):
+        raise SystemExit(1)
@@ -0,0 +1,50 @@
+# app/services/dtypes.py
+import pandas as pd
+
+# Esquema compacto de master.parquet y features.parquet
+#
+# | Columnas                                             | dtype en memoria / parquet            |
+# |------------------------------------------------------|---------------------------------------|
+# | departamento, municipio, genero, grupo_etario,       | category (diccionario, categorías     |
+# | tipo_delito, dia_semana, franja_hora, modalidad,     | ordenadas alfabéticamente)            |
+# | grupo_edad_bin, delito, modalidad_hurto, armas_medios|                                       |
+# | anio                                                 | Int16 (<NA> si no hay fecha)          |
+# | mes, dia                                             | Int8  (<NA> si no hay fecha)          |
+# | cantidad, evento_id                                  | int32                                 |
+# | es_mujer, es_hombre, riesgo_alto                     | int8                                  |
+# | has_edad, has_genero, has_armas                      | bool                                  |
+#
+# El resto (fecha_hecho, codigo_dane, tasas, acumulado_90d, proxies de riesgo)
+# conserva su tipo. Las categorías ordenadas hacen que ordenar por una columna
+# categórica dé el mismo resultado que ordenar el texto.
+CATEGORY_COLS = [
+    "departamento", "municipio", "genero", "grupo_etario", "tipo_delito",
+    "dia_semana", "franja_hora", "modalidad", "grupo_edad_bin",
+    "delito", "modalidad_hurto", "armas_medios",
+]
+INT_COLS = {
+    "anio": "Int16", "mes": "Int8", "dia": "Int8",
+    "cantidad": "int32", "evento_id": "int32",
+    "es_mujer": "int8", "es_hombre": "int8", "riesgo_alto": "int8",
+}
+BOOL_COLS = ["has_edad", "has_genero", "has_armas"]
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte las columnas presentes al esquema compacto."""
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Ya categórica (viene del master): solo se podan y ordenan las categorías
+                values = values.cat.remove_unused_categories()
+            else:
+                values = pd.Series(pd.Categorical(values), index=values.index)
+            categories = sorted(values.cat.categories)
+            df[col] = values if categories == values.cat.categories.tolist() else values.cat.set_categories(categories)
+    for col, dtype in INT_COLS.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    for col in BOOL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(bool)
+    return df
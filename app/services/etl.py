@@ -1,27 +1,34 @@
 # app/services/etl.py
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
-from app.config import RAW_DIR, PROC_DIR, SOURCES, COMMON_COLS
+from app.config import RAW_DIR, PROC_DIR, SHARED_DATA, SOURCES, COMMON_COLS
 
 # Importar los demás servicios
-from app.services import features, train, validate
+from app.services import dtypes, explain, features, kpis, olap, raw_cache, scores, train, validate, store
 
-def fetch_source(name: str, url: str) -> Path:
+def fetch_source(name: str, url: str, force: bool = False) -> Path:
     RAW_DIR.mkdir(parents=True, exist_ok=True)
     path = RAW_DIR / f"{name}.csv"
     print(f"➡️ Descargando fuente: {name} desde {url}")
-    df_iter = pd.read_csv(url, chunksize=100_000, dtype=str)
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        for i, chunk in enumerate(df_iter):
-            chunk.to_csv(f, index=False, header=(i == 0))
-    print(f"✅ Fuente {name} guardada en {path}")
+    # Descarga condicional/reanudable con manifiesto (tamaño, hash, ETag, filas)
+    entry = raw_cache.fetch(name, url, path, force=force)
+    print(f"✅ Fuente {name} guardada en {path} ({entry.get('rows', '?')} filas)")
     return path
 
-def normalize(name: str, path: Path) -> Path:
-    PROC_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"➡️ Normalizando dataset: {name}")
-    df = pd.read_csv(path, dtype=str)
+# Columnas crudas que consume normalize (proyección aplicada al leer el CSV)
+RAW_COLS = set(COMMON_COLS + ["delito", "tipo_de_hurto"])
+CHUNK_ROWS = 100_000
+
+def _normalize_chunk(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Filtro por Santander primero: el resto de la limpieza solo toca filas útiles
+    if "departamento" in df.columns:
+        df["departamento"] = df["departamento"].str.strip().str.upper()
+        df = df[df["departamento"] == "SANTANDER"].copy()
 
     if name == "sexuales":
         df["tipo_delito"] = "delitos_sexuales"
@@ -46,29 +53,78 @@ def normalize(name: str, path: Path) -> Path:
     df["cantidad"] = pd.to_numeric(df.get("cantidad", 0), errors="coerce").fillna(0).astype(int)
     df["fecha_hecho"] = pd.to_datetime(df.get("fecha_hecho"), errors="coerce", dayfirst=True)
 
-    df["departamento"] = df.get("departamento", "SIN_DATO").str.strip().str.upper()
     df["municipio"] = df.get("municipio", "SIN_DATO").str.strip().str.upper()
     df["genero"] = df.get("genero", "SIN_DATO").fillna("SIN_DATO").str.upper()
     df["grupo_etario"] = df.get("grupo_etario", "SIN_DATO").fillna("SIN_DATO").str.upper()
+    return df
 
-    # Filtro por Santander
-    if "departamento" in df.columns:
-        df = df[df["departamento"] == "SANTANDER"]
+def _arrow_schema(df: pd.DataFrame) -> pa.Schema:
+    # Esquema fijo para todos los bloques (un bloque sin datos en una columna no cambia su tipo)
+    types = {"cantidad": pa.int64(), "fecha_hecho": pa.timestamp("ns")}
+    return pa.schema([(c, types.get(c, pa.string())) for c in df.columns])
 
+def normalize(name: str, path: Path, chunksize: int = CHUNK_ROWS, use_cache: bool = True) -> Path:
+    """Normaliza el CSV crudo por bloques: la memoria pico no depende del tamaño de la fuente."""
+    PROC_DIR.mkdir(parents=True, exist_ok=True)
     out = PROC_DIR / f"{name}.parquet"
-    df.to_parquet(out, index=False)
-    print(f"✅ Dataset {name} normalizado y guardado en {out}")
+    if use_cache and raw_cache.is_normalized(name, path, out):
+        print(f"⏭️ Dataset {name} sin cambios, se reutiliza {out}")
+        return out
+    print(f"➡️ Normalizando dataset: {name}")
+    reader = pd.read_csv(path, dtype=str, usecols=lambda c: c in RAW_COLS, chunksize=chunksize)
+
+    rows = 0
+    writer = None
+    with store.atomic_path(out) as tmp:
+        try:
+            for chunk in reader:
+                df = _normalize_chunk(name, chunk)
+                if writer is None:
+                    schema = _arrow_schema(df)
+                    writer = pq.ParquetWriter(tmp, pa.Table.from_pandas(df, schema=schema, preserve_index=False).schema)
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            # CSV sin filas: se publica el parquet vacío con las mismas columnas
+            empty = pd.read_csv(path, dtype=str, usecols=lambda c: c in RAW_COLS, nrows=0)
+            _normalize_chunk(name, empty).to_parquet(tmp, index=False)
+    if use_cache:
+        raw_cache.mark_normalized(name, path, out)
+    print(f"✅ Dataset {name} normalizado y guardado en {out} ({rows} filas de Santander)")
     return out
 
-def build_master() -> Path:
+def local_sources(directory: Path) -> dict:
+    """SOURCES apuntando a copias locales (<dir>/<fuente>.csv) vía file:// para correr sin red."""
+    return {name: (Path(directory).resolve() / f"{name}.csv").as_uri() for name in SOURCES}
+
+def ingest(name: str, url: str, force: bool = False) -> Path:
+    """Descarga + normalización de una fuente (unidad de trabajo independiente)."""
+    t0 = time.perf_counter()
+    csv_path = fetch_source(name, url, force=force)
+    t1 = time.perf_counter()
+    pq_path = normalize(name, csv_path, use_cache=not force)
+    t2 = time.perf_counter()
+    print(f"⏱️ {name}: descarga {t1 - t0:.1f}s, normalización {t2 - t1:.1f}s, total {t2 - t0:.1f}s")
+    return pq_path
+
+def build_master(jobs: int = 1, sources: dict = None, force: bool = False) -> Path:
     print("➡️ Construyendo master.parquet…")
-    parts = []
-    for name, url in SOURCES.items():
-        csv_path = fetch_source(name, url)
-        pq_path = normalize(name, csv_path)
-        parts.append(pd.read_parquet(pq_path))
+    sources = sources or SOURCES
+    t0 = time.perf_counter()
+    if jobs > 1:
+        # Las fuentes son independientes: una por proceso
+        with ProcessPoolExecutor(max_workers=min(jobs, len(sources))) as pool:
+            futures = {name: pool.submit(ingest, name, url, force) for name, url in sources.items()}
+            paths = {name: fut.result() for name, fut in futures.items()}
+    else:
+        paths = {name: ingest(name, url, force) for name, url in sources.items()}
+    print(f"⏱️ Ingesta de {len(sources)} fuentes con {jobs} proceso(s): {time.perf_counter() - t0:.1f}s")
 
-    master = pd.concat(parts, ignore_index=True)
+    # Orden determinista (el de `sources`), sin importar cuál terminó primero
+    master = pd.concat([pd.read_parquet(paths[name]) for name in sources], ignore_index=True)
 
     # Columnas derivadas
     master["anio"] = master["fecha_hecho"].dt.year
@@ -84,25 +140,50 @@ def build_master() -> Path:
     master["has_genero"] = (master["genero"] != "SIN_DATO").astype(int)
     master["has_armas"] = master.get("armas_medios", pd.Series([None]*len(master))).notna().astype(int)
 
+    # Esquema compacto (categorías, enteros pequeños y booleanos)
+    master = dtypes.compact(master)
+
+    # Publicación atómica: la API nunca lee un master.parquet a medio escribir
     out = PROC_DIR / "master.parquet"
-    master.to_parquet(out, index=False)
+    store.publish(master, out)
     print("✅ ETL terminado, master.parquet generado.")
+    if SHARED_DATA:
+        store.share("master")
     return out
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--fetch", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1, help="Procesos para ingerir las fuentes en paralelo")
+    parser.add_argument("--sources-dir", type=Path, default=None,
+                        help="Carpeta con <fuente>.csv locales en lugar de datos.gov.co")
+    parser.add_argument("--force", action="store_true", help="Ignora la caché de descargas y normalización")
+    parser.add_argument("--backend", choices=sorted(train.BACKENDS), default=train.DEFAULT_BACKEND,
+                        help="Clasificador del modelo de riesgo")
     args = parser.parse_args()
     if args.fetch:
         # 1. ETL
-        build_master()
+        build_master(
+            jobs=args.jobs,
+            sources=local_sources(args.sources_dir) if args.sources_dir else None,
+            force=args.force,
+        )
         # 2. Features
         print("➡️ Generando features.parquet…")
-        features.build()
+        # Solo se recalculan las particiones municipio/mes que cambiaron con la descarga
+        features.build(incremental=True)
+        # 2a. Cubo OLAP (agregados por municipio/periodo/delito/perfil que consultan los routers)
+        olap.build()
+        # 2b. KPIs del tablero (snapshot precalculado)
+        kpis.build()
         # 3. Train
         print("➡️ Entrenando modelo…")
-        train.train_model()
+        version = train.train_model(args.backend)
+        # 3b. Probabilidades por fila para el modelo nuevo (caché de tendencia/ranking/métricas)
+        scores.build()
         # 4. Validate
         print("➡️ Validando modelo…")
-        validate.validate()
+        validate.validate(store.REGISTRY_DIR / version)
+        # 5. Explicaciones SHAP del modelo nuevo (las sirve /analytics/explain)
+        explain.build()
         print("🎯 Pipeline completo ejecutado con éxito.")
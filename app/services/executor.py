@@ -0,0 +1,170 @@
+# app/services/executor.py
+import asyncio
+import functools
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import numpy as np
+from fastapi import HTTPException
+from app.config import EXECUTOR_QUEUE, EXECUTOR_TIMEOUT_SECONDS, EXECUTOR_WORKERS
+
+# Dónde corre cada endpoint:
+#   event loop -> /health, métricas, snapshots JSON y esperas de red (LLM): nunca bloquean
+#   "light"    -> búsquedas sobre índices y artefactos ya calculados (milisegundos)
+#   "heavy"    -> agregaciones y scoring sobre el features
+# Los carriles se reparten los EXECUTOR_WORKERS hilos de un pool compartido, así una ráfaga
+# de trabajo pesado nunca deja sin hilos a las búsquedas ni al event loop. Cada carril (y
+# cada ruta con límite propio) admite `concurrency` ejecuciones y `queue` en espera; más
+# allá, o si el plazo vence en la cola, responde 503 con Retry-After (load shedding), y si
+# vence ejecutando responde 504. Son hilos y no procesos porque todo el trabajo lee los
+# snapshots en memoria de store.py; pandas/NumPy/numba liberan el GIL en lo pesado.
+LATENCY_WINDOW = 1024
+RETRY_AFTER_SECONDS = 1
+
+
+class Gate:
+    """Cupo de ejecuciones simultáneas con cola acotada y sus métricas."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float):
+        self.name, self.concurrency, self.queue, self.timeout = name, concurrency, queue, timeout
+        self.running = 0
+        self.waiting = 0
+        self.stats = Counter()
+        self.latency = deque(maxlen=LATENCY_WINDOW)  # segundos, de la admisión al fin del hilo
+        self.wait = deque(maxlen=LATENCY_WINDOW)     # segundos en cola
+        self._loop = None
+        self._slots = None
+
+    def _semaphore(self, loop) -> asyncio.Semaphore:
+        if self._loop is not loop:
+            self._loop, self._slots = loop, asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    def _shed(self, reason: str):
+        raise HTTPException(
+            status_code=503, detail=f"Servicio saturado ({self.name}): {reason}; reintenta en unos segundos",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+    async def acquire(self, deadline: float):
+        loop = asyncio.get_running_loop()
+        slots = self._semaphore(loop)
+        if slots.locked() and self.waiting >= self.queue:
+            self.stats["rejected"] += 1
+            self._shed("cola llena")
+        self.waiting += 1
+        queued = loop.time()
+        try:
+            await asyncio.wait_for(slots.acquire(), max(deadline - queued, 0))
+        except asyncio.TimeoutError:
+            self.stats["queue_timeouts"] += 1
+            self._shed("plazo vencido en cola")
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.stats["accepted"] += 1
+        self.wait.append(loop.time() - queued)
+
+    def release(self, seconds: Optional[float] = None):
+        self.running -= 1
+        if seconds is not None:
+            self.latency.append(seconds)
+        self._slots.release()
+
+    def snapshot(self) -> dict:
+        pct = lambda values, q: round(float(np.percentile(values, q)) * 1000, 2) if values else None
+        latency, wait = list(self.latency), list(self.wait)
+        return {
+            "concurrency": self.concurrency, "queue": self.queue, "timeout_s": self.timeout,
+            "running": self.running, "waiting": self.waiting,
+            **{k: self.stats[k] for k in ("accepted", "completed", "rejected", "queue_timeouts", "timeouts", "errors")},
+            "shed": self.stats["rejected"] + self.stats["queue_timeouts"],
+            "p50_ms": pct(latency, 50), "p99_ms": pct(latency, 99), "wait_p99_ms": pct(wait, 99),
+        }
+
+
+_heavy = max(1, EXECUTOR_WORKERS // 2)
+LANES: Dict[str, Gate] = {
+    "light": Gate("light", max(1, EXECUTOR_WORKERS - _heavy), EXECUTOR_QUEUE, EXECUTOR_TIMEOUT_SECONDS),
+    "heavy": Gate("heavy", _heavy, EXECUTOR_QUEUE, EXECUTOR_TIMEOUT_SECONDS),
+}
+ROUTES: Dict[str, Gate] = {}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Un hilo por cupo de carril: lo admitido nunca espera por un hilo libre
+            _pool = ThreadPoolExecutor(max_workers=sum(g.concurrency for g in LANES.values()), thread_name_prefix="api")
+        return _pool
+
+
+async def run(lane: str, fn: Callable, *args, route: Optional[Gate] = None, **kwargs):
+    """fn(*args, **kwargs) en el pool, dentro del cupo de `lane` (y de `route` si se indica)."""
+    loop = asyncio.get_running_loop()
+    gates = [g for g in (route, LANES[lane]) if g is not None]
+    start = loop.time()
+    deadline = start + LANES[lane].timeout
+    admitted = []
+    try:
+        for gate in gates:
+            await gate.acquire(deadline)
+            admitted.append(gate)
+    except BaseException:
+        for gate in admitted:
+            gate.release()
+        raise
+    future = loop.run_in_executor(_executor(), functools.partial(fn, *args, **kwargs))
+
+    def finished(f):
+        # Los cupos se devuelven cuando el hilo termina, aunque la petición ya haya vencido
+        for gate in admitted:
+            gate.release(loop.time() - start)
+            if f.cancelled() or f.exception() is None or isinstance(f.exception(), HTTPException):
+                gate.stats["completed"] += 1
+            else:
+                gate.stats["errors"] += 1
+    future.add_done_callback(finished)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        for gate in admitted:
+            gate.stats["timeouts"] += 1
+        raise HTTPException(status_code=504, detail=f"La consulta superó {LANES[lane].timeout:g} s")
+
+
+def offload(lane: str, limit: Optional[int] = None):
+    """Decorador para endpoints síncronos: los vuelve async y los ejecuta en `lane`, con a lo
+    sumo `limit` ejecuciones simultáneas de la ruta (por defecto, las del carril)."""
+    def wrap(fn):
+        parent = LANES[lane]
+        route = Gate(f"{lane}:{fn.__name__}", limit or parent.concurrency, parent.queue, parent.timeout)
+        ROUTES[route.name] = route
+
+        @functools.wraps(fn)
+        async def endpoint(*args, **kwargs):
+            return await run(lane, fn, *args, route=route, **kwargs)
+        return endpoint
+    return wrap
+
+
+def metrics() -> dict:
+    """Estado y contadores (acumulados desde el arranque) de carriles y rutas."""
+    return {
+        "workers": sum(g.concurrency for g in LANES.values()),
+        "lanes": {name: gate.snapshot() for name, gate in LANES.items()},
+        "routes": {name: gate.snapshot() for name, gate in ROUTES.items()},
+    }
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -1,37 +1,194 @@
 # app/services/explain.py
-import shap
-import joblib
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
 import pandas as pd
-from app.config import MODELS_DIR, PROC_DIR
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+from app.config import PROC_DIR
+from app.services import risk, store
 
-def explain_sample(n=1000):
-    # Cargar modelo entrenado
-    model = joblib.load(MODELS_DIR / "risk_model.pkl")
+# Explicaciones SHAP (TreeExplainer) de todas las filas del features, agregadas por
+# (municipio, anio, mes): media de la contribución de cada variable (log-odds) y de su
+# valor absoluto. Se guardan en explain/<versión del modelo>.parquet, como scores.py.
+EXPLAIN_DIR = PROC_DIR / "explain"
+KEEP_VERSIONS = 5
+CHUNK_ROWS = 8_192
+GROUP_COLS = ["municipio", "anio", "mes"]
+
+
+def _feature_columns(pre) -> Dict[str, List[int]]:
+    # Columnas transformadas de cada variable del modelo (el one-hot se vuelve a sumar)
+    groups: Dict[str, List[int]] = {f: [] for f in risk.MODEL_FEATURES}
+    for i, name in enumerate(pre.get_feature_names_out()):
+        col = name.split("__", 1)[1]
+        feature = col if col in groups else next(f for f in groups if col.startswith(f"{f}_"))
+        groups[feature].append(i)
+    return groups
+
+
+def _shap_block(clf, Xt: np.ndarray, columns: List[List[int]], with_base: bool):
+    # Un solo TreeExplainer por worker; recorre su bloque de a CHUNK_ROWS filas (memoria acotada)
+    import shap
+    explainer = shap.TreeExplainer(clf)
+    out = []
+    for i in range(0, len(Xt), CHUNK_ROWS):
+        values = explainer.shap_values(Xt[i:i + CHUNK_ROWS], check_additivity=False)
+        values = np.asarray(values[1] if isinstance(values, list) else values)
+        if values.ndim == 3:
+            values = values[..., 1]
+        out.append(np.column_stack([values[:, idx].sum(axis=1) if idx else np.zeros(len(values)) for idx in columns]))
+    # expected_value se lee después de explicar: con XGBoost recién ahí queda en log-odds
+    base = float(np.ravel(explainer.expected_value)[-1]) if with_base else None
+    return np.vstack(out), base
+
+
+def shap_values(model, X: pd.DataFrame, n_jobs: int = None):
+    """Contribución SHAP (log-odds) de cada variable del modelo para cada fila de X y el
+    valor base (la suma de ambos es el log-odds que da el modelo). Las filas se reparten
+    en un bloque por worker (n_jobs, por defecto todos los CPU)."""
+    if X.empty:
+        return pd.DataFrame(np.empty((0, len(risk.MODEL_FEATURES))), columns=risk.MODEL_FEATURES, index=X.index), 0.0
+    pre, clf = model.named_steps["pre"], model.named_steps["clf"]
+    Xt = pre.transform(X[risk.MODEL_FEATURES])
+    Xt = np.asarray(Xt.toarray() if hasattr(Xt, "toarray") else Xt, dtype=np.float64)
+    columns = list(_feature_columns(pre).values())
+    # Sin bloques de menos de CHUNK_ROWS filas: el modelo se envía una vez por bloque
+    n_blocks = min(n_jobs or os.cpu_count() or 1, -(-len(Xt) // CHUNK_ROWS))
+    blocks = Parallel(n_jobs=n_blocks)(
+        delayed(_shap_block)(clf, block, columns, k == 0) for k, block in enumerate(np.array_split(Xt, n_blocks))
+    )
+    values = np.vstack([v for v, _ in blocks])
+    # Valor base de un único explainer (el del primer bloque)
+    base = blocks[0][1]
+    return pd.DataFrame(values, columns=risk.MODEL_FEATURES, index=X.index), base
+
+
+def aggregate(df: pd.DataFrame, values: pd.DataFrame) -> pd.DataFrame:
+    """Media de la contribución (shap_*) y de su valor absoluto (abs_*) por municipio-mes."""
+    signed = values.add_prefix("shap_")
+    absolute = values.abs().add_prefix("abs_")
+    frame = pd.concat([df[GROUP_COLS], signed, absolute], axis=1)
+    frame = frame[frame["anio"].notna() & frame["mes"].notna()]
+    grouped = frame.groupby(GROUP_COLS, observed=True, sort=True)
+    out = grouped.mean().reset_index()
+    out.insert(len(GROUP_COLS), "filas", grouped.size().to_numpy())
+    out["municipio"] = out["municipio"].astype(str)
+    out[["anio", "mes"]] = out[["anio", "mes"]].astype(int)
+    return out
+
+
+def _path(model_version: str):
+    return EXPLAIN_DIR / f"{model_version}.parquet"
 
-    # Cargar features y filtrar solo Santander
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
 
-    # Agregación mensual por municipio
-    agg = df.groupby(["departamento","municipio","anio","mes"], as_index=False).agg({
-        "tasa_delitos_muni_mes":"mean",
-        "tasa_delitos_dep_mes":"mean",
-        "acumulado_90d":"mean"
-    })
+def _write(table_df: pd.DataFrame, base: float, feat: store.Snapshot, model: store.Snapshot):
+    EXPLAIN_DIR.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(table_df, preserve_index=False)
+    meta = {
+        **(table.schema.metadata or {}), b"features_version": feat.version.encode(),
+        b"model_version": model.version.encode(), b"base": json.dumps(base).encode(),
+    }
+    with store.atomic_path(_path(model.version)) as tmp:
+        pq.write_table(table.replace_schema_metadata(meta), tmp)
+    # Solo se conservan las versiones de modelo más recientes
+    for old in sorted(EXPLAIN_DIR.glob("*.parquet"), key=lambda p: p.stat().st_mtime_ns)[:-KEEP_VERSIONS]:
+        old.unlink(missing_ok=True)
 
-    # Selección de variables para explicar
-    X = agg[[
-        "departamento","municipio","anio","mes",
-        "tasa_delitos_muni_mes","tasa_delitos_dep_mes","acumulado_90d"
-    ]].head(n)
 
-    # Transformar con el preprocesador del pipeline
-    X_trans = model.named_steps["pre"].transform(X)
+class Explanations:
+    """Explicaciones guardadas de una versión de modelo, indexadas por municipio."""
 
-    # Crear explainer sobre el clasificador final
-    explainer = shap.Explainer(model.named_steps["clf"], X_trans)
+    def __init__(self, table: pa.Table):
+        meta = table.schema.metadata or {}
+        self.features_version = meta.get(b"features_version", b"").decode()
+        self.model_version = meta.get(b"model_version", b"").decode()
+        self.base = json.loads(meta.get(b"base", b"0"))
+        df = table.to_pandas()
+        self.features = [c[len("shap_"):] for c in df.columns if c.startswith("shap_")]
+        self.municipios = df["municipio"].to_numpy(dtype=object)
+        self.periods = (df["anio"] * 100 + df["mes"]).to_numpy()
+        self.filas = df["filas"].to_numpy()
+        self.signed = df[[f"shap_{f}" for f in self.features]].to_numpy()
+        self.absolute = df[[f"abs_{f}" for f in self.features]].to_numpy()
+        # Filas ordenadas por (municipio, anio, mes): rango contiguo por municipio
+        self.spans: Dict[str, tuple] = {}
+        for i, m in enumerate(self.municipios):
+            start, _ = self.spans.get(m, (i, i))
+            self.spans[m] = (start, i + 1)
+        weights = self.filas / self.filas.sum() if len(self.filas) else self.filas
+        self.importance = sorted(
+            ({"feature": f, "importancia": round(float(v), 6)} for f, v in zip(self.features, weights @ self.absolute)),
+            key=lambda d: d["importancia"], reverse=True,
+        )
+
+    def municipio(self, municipio: str, anio: Optional[int] = None, mes: Optional[int] = None) -> Optional[dict]:
+        """Contribuciones del municipio en (anio, mes); por defecto su último mes con datos."""
+        start, end = self.spans.get(municipio, (0, 0))
+        if start == end:
+            return None
+        periods = self.periods[start:end]
+        if anio is None and mes is None:
+            i = end - 1
+        else:
+            match = np.ones(len(periods), dtype=bool)
+            if anio is not None:
+                match &= periods // 100 == anio
+            if mes is not None:
+                match &= periods % 100 == mes
+            hits = np.flatnonzero(match)
+            if not len(hits):
+                return None
+            i = start + int(hits[-1])
+        contributions = sorted(
+            ({"feature": f, "shap": round(float(v), 6)} for f, v in zip(self.features, self.signed[i])),
+            key=lambda d: abs(d["shap"]), reverse=True,
+        )
+        return {
+            "municipio": municipio, "anio": int(self.periods[i] // 100), "mes": int(self.periods[i] % 100),
+            "filas": int(self.filas[i]), "base": round(self.base, 6),
+            "contribuciones": contributions, "importancia_global": self.importance,
+        }
+
+
+def _load(path) -> Explanations:
+    return Explanations(pq.read_table(path))
+
+
+def current() -> Optional[Explanations]:
+    """Explicaciones del modelo y features vigentes, o None si no se han calculado."""
+    feat, model = store.snapshot("features"), store.model()
+    path = _path(model.version)
+    if not path.exists():
+        return None
+    explanations = store.artifact(path, _load).data
+    return explanations if explanations.features_version == feat.version else None
+
+
+def build(n_jobs: int = None):
+    feat, model = store.snapshot("features"), store.model()
+    t0 = time.perf_counter()
+    values, base = shap_values(model.data, feat.df, n_jobs)
+    table_df = aggregate(feat.df, values)
+    _write(table_df, base, feat, model)
+    print(f"✅ Explicaciones SHAP guardadas en {_path(model.version)} "
+          f"({len(values):,} filas, {len(table_df):,} municipio-mes, {time.perf_counter() - t0:.1f} s)")
+    return table_df
+
+
+def explain_sample(n=1000):
+    """Contribuciones SHAP por fila para las primeras `n` filas del features."""
+    X = store.features().head(n)
+    values, _ = shap_values(store.model().data, X)
+    return values, X
 
-    # Calcular valores SHAP
-    shap_values = explainer(X_trans)
 
-    return shap_values, X
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos para SHAP (por defecto todos los núcleos)")
+    args = parser.parse_args()
+    build(args.jobs)
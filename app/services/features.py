@@ -1,6 +1,12 @@
 # app/services/features.py
+import argparse
+import numpy as np
 import pandas as pd
-from app.config import PROC_DIR
+import pyarrow as pa
+import pyarrow.parquet as pq
+from numba import njit
+from app.config import PROC_DIR, SHARED_DATA
+from app.services import dtypes, store
 
 DERIVED_COLS = [
     "anio","mes","dia","dia_semana","franja_hora",
@@ -10,16 +16,75 @@ DERIVED_COLS = [
     "grupo_edad_bin","es_mujer","es_hombre","riesgo_alto"
 ]
 
-def build():
+WINDOW_90D = pd.Timedelta("90D").value
+
+# Dataset particionado para builds incrementales: un parquet por anio-mes con las
+# filas de features ya terminadas (evento_id, lags, acumulado_90d, riesgo_alto) y un
+# manifiesto por partición (municipio, anio, mes) con el hash de sus filas del master,
+# su total mensual y los valores que dependen de otras particiones (MONTHLY_COLS).
+PARTS_DIR = PROC_DIR / "features_parts"
+MANIFEST = PARTS_DIR / "_manifest.parquet"
+PARTS_VERSION = 2
+PARTITION_KEYS = ["municipio", "mes_idx"]
+MONTHLY_COLS = ["tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "riesgo_alto"]
+# Una ventana de 90 días alcanza como máximo 4 meses calendario hacia adelante
+ROLLING_CONTEXT_MONTHS = 4
+
+@njit(cache=True)
+def _window_sums(groups, ts, values, window):
+    # Ventana deslizante (t - window, t] sobre un arreglo ordenado por grupo y fecha
+    n = len(values)
+    out = np.empty(n)
+    left = 0
+    acc = 0.0
+    for i in range(n):
+        if i > 0 and groups[i] != groups[i - 1]:
+            left = i
+            acc = 0.0
+        acc += values[i]
+        while ts[left] <= ts[i] - window:
+            acc -= values[left]
+            left += 1
+        out[i] = acc
+    return out
+
+def rolling_90d(df: pd.DataFrame) -> np.ndarray:
+    """Suma móvil de 90 días de `cantidad` por municipio.
+
+    `df` debe venir ordenado por municipio y fecha_hecho; equivale a
+    `rolling("90D").sum()` dentro de cada municipio, en una sola pasada.
+    """
+    fecha = df["fecha_hecho"]
+    out = np.full(len(df), np.nan)
+    valid = fecha.notna().to_numpy()
+    if valid.any():
+        muni = df["municipio"]
+        codes = muni.cat.codes.to_numpy() if isinstance(muni.dtype, pd.CategoricalDtype) else pd.factorize(muni)[0]
+        groups = codes[valid]
+        ts = fecha.to_numpy()[valid].astype("int64")
+        values = df["cantidad"].to_numpy(dtype="float64")[valid]
+        out[valid] = _window_sums(groups, ts, values, WINDOW_90D)
+    return out
+
+def _load_master() -> pd.DataFrame:
     df = pd.read_parquet(PROC_DIR / "master.parquet")
 
     # Filtro por departamento Santander
     if "departamento" in df.columns:
         df = df[df["departamento"] == "SANTANDER"].copy()
+    return df
 
-    # Identificador de evento
-    df["evento_id"] = df.index
+def _keyed(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipos de fecha y cantidad y clave de partición: lo que necesitan el hash, los totales y la ventana."""
+    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
+    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce").fillna(0)
 
+    # Índice de mes (anio*12 + mes - 1) para particionar; -1 si no hay fecha
+    df["mes_idx"] = (df["anio"].astype(float) * 12 + df["mes"].astype(float) - 1).fillna(-1).astype(int)
+    return df
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Variables a nivel de fila (no dependen de otras filas)."""
     # Modalidad del delito
     df["modalidad"] = df.get("modalidad_hurto", df.get("delito", "SIN_DATO"))
 
@@ -29,83 +94,204 @@ def build():
 
     # Age bins
     def age_bin(s):
-        s = s.fillna("SIN_DATO")
-        return s.apply(lambda x: "NNA" if "NNA" in x else ("ADULTO" if "ADULTO" in x else "SIN_DATO"))
+        return np.where(s.str.contains("NNA", na=False), "NNA",
+                        np.where(s.str.contains("ADULTO", na=False), "ADULTO", "SIN_DATO"))
     if "grupo_etario" in df.columns:
         df["grupo_edad_bin"] = age_bin(df["grupo_etario"])
     else:
         df["grupo_edad_bin"] = "SIN_DATO"
+    return df
 
-    # Asegurar tipos
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce")
-    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce").fillna(0)
+def _monthly(hashes: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Lags mensuales (municipio y departamento) y riesgo_alto de cada partición, a partir de
+    los totales por partición de `hashes` (no vuelve a agrupar las filas del master)."""
+    monthly = hashes[["cantidad"]].reset_index()
+    dated = monthly[monthly["mes_idx"] >= 0].sort_values(PARTITION_KEYS)
 
-    # Monthly rates por municipio
-    if "municipio" in df.columns:
-        monthly = df.groupby(["departamento","municipio","anio","mes"], as_index=False)["cantidad"].sum()
-        monthly["tasa_delitos_muni_mes"] = monthly["cantidad"]
+    # Lag municipal: total del mes anterior con datos del mismo municipio
+    muni_lag = dated.groupby("municipio")["cantidad"].shift(1)
 
-        # Lag municipal
-        monthly["tasa_delitos_muni_mes_lag"] = monthly.sort_values(["municipio","anio","mes"]) \
-            .groupby("municipio")["tasa_delitos_muni_mes"].shift(1)
+    # Riesgo alto por mes (top 10% de municipios en cada anio-mes)
+    p90 = dated.groupby("mes_idx")["cantidad"].transform("quantile", 0.9)
+    riesgo = (dated["cantidad"] >= p90).astype(int)
 
-        df = df.merge(
-            monthly[["departamento","municipio","anio","mes","tasa_delitos_muni_mes_lag"]],
-            on=["departamento","municipio","anio","mes"], how="left"
-        )
-    else:
-        df["tasa_delitos_muni_mes_lag"] = 0
-
-    # Monthly rates por departamento y lag
-    dep_monthly = df.groupby(["departamento","anio","mes"], as_index=False)["cantidad"].sum()
-    dep_monthly["tasa_delitos_dep_mes"] = dep_monthly["cantidad"]
-    dep_monthly["tasa_delitos_dep_mes_lag"] = dep_monthly.sort_values(["departamento","anio","mes"]) \
-        .groupby("departamento")["tasa_delitos_dep_mes"].shift(1)
-
-    df = df.merge(
-        dep_monthly[["departamento","anio","mes","tasa_delitos_dep_mes_lag"]],
-        on=["departamento","anio","mes"], how="left"
-    )
-
-    # Rolling 90 días por municipio
-    if "municipio" in df.columns:
-        df = df.sort_values(["municipio","fecha_hecho"])
-        def rolling_90d(group):
-            g = group.set_index("fecha_hecho").sort_index()
-            out = group.copy()
-            out["acumulado_90d"] = g["cantidad"].rolling("90D").sum().values
-            return out
-        df = df.groupby("municipio", group_keys=False).apply(rolling_90d)
-    else:
-        df["acumulado_90d"] = 0
+    # Total departamental por mes y su lag (un solo departamento tras el filtro de _load_master);
+    # cuenta también las filas sin municipio, que no forman partición
+    sin_muni = df.loc[df["municipio"].isna() & (df["mes_idx"] >= 0), ["mes_idx", "cantidad"]]
+    dep = pd.concat([dated[["mes_idx", "cantidad"]], sin_muni]).groupby("mes_idx")["cantidad"].sum()
+    dep_lag = dated["mes_idx"].map(dep.shift(1))
 
-    # Riesgo alto por mes (top 10% de municipios en cada anio-mes)
-    if "municipio" in df.columns:
-        muni_month = monthly.copy()
-        # Para cada (anio, mes), marcamos como 1 a los municipios con tasa en el top 10% de ese mes
-        muni_month["riesgo_alto"] = muni_month.groupby(["anio","mes"])["tasa_delitos_muni_mes"] \
-            .transform(lambda s: (s >= s.quantile(0.9)).astype(int))
-
-        df = df.merge(
-            muni_month[["departamento","municipio","anio","mes","riesgo_alto"]],
-            on=["departamento","municipio","anio","mes"], how="left"
-        )
-    else:
-        df["riesgo_alto"] = 0
+    monthly = monthly.join(pd.DataFrame({
+        "tasa_delitos_muni_mes_lag": muni_lag, "tasa_delitos_dep_mes_lag": dep_lag, "riesgo_alto": riesgo,
+    }))
+    # Mismo relleno que reciben las filas: 0 para el primer mes y para las filas sin fecha
+    for col in MONTHLY_COLS:
+        monthly[col] = monthly[col].fillna(0).astype(int if col == "riesgo_alto" else float)
+    return monthly.set_index(PARTITION_KEYS)[MONTHLY_COLS]
 
-    # Proxies de riesgo
-    if "municipio" in df.columns:
-        df["municipio_riesgo"] = df.groupby("municipio")["cantidad"].transform("sum")
-    else:
-        df["municipio_riesgo"] = 0
-    df["departamento_riesgo"] = df.groupby("departamento")["cantidad"].transform("sum")
+def _with_rolling(df: pd.DataFrame, dirty: pd.MultiIndex = None) -> pd.DataFrame:
+    """Filas ordenadas por municipio/fecha con acumulado_90d, solo de las particiones `dirty` (todas si es None)."""
+    # Las filas sin municipio quedaban fuera del groupby; se conserva ese comportamiento
+    df = df[df["municipio"].notna()]
+    if dirty is not None:
+        # Contexto: meses previos del mismo municipio que alimentan la ventana de 90 días
+        first = pd.Series(dirty.get_level_values("mes_idx"), index=dirty.get_level_values("municipio")) \
+            .groupby(level=0).min()
+        desde = df["municipio"].astype(object).map(first).astype(float)
+        df = df[desde.notna() & ((df["mes_idx"] >= desde - ROLLING_CONTEXT_MONTHS) | (df["mes_idx"] < 0))]
+    df = df.sort_values(["municipio","fecha_hecho"], kind="mergesort")
+    df["acumulado_90d"] = rolling_90d(df)
+    if dirty is not None:
+        df = df[pd.MultiIndex.from_frame(df[PARTITION_KEYS]).isin(dirty)].copy()
+    return df
 
-    # Imputación segura post-merge para evitar NaNs en features
+def _attach(df: pd.DataFrame, monthly: pd.DataFrame) -> pd.DataFrame:
+    """Une a las filas el identificador de evento, los agregados mensuales de su partición y la imputación final."""
+    # Identificador de evento: índice del master
+    df.insert(list(df.columns).index("modalidad"), "evento_id", df.index)
+    keys = pd.MultiIndex.from_arrays([df["municipio"].astype(object), df["mes_idx"]])
+    values = monthly.reindex(keys)
+    for col in MONTHLY_COLS:
+        df[col] = values[col].fillna(0).to_numpy()
+
+    # Imputación segura para evitar NaNs en features
     for col in ["tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d", "riesgo_alto"]:
         df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int if col=="riesgo_alto" else float)
 
-    df.to_parquet(PROC_DIR / "features.parquet", index=False)
+    # Mismo orden de columnas que el build original; mes_idx queda al final para PARTS_DIR
+    cols = [c for c in df.columns if c not in ("acumulado_90d", "mes_idx")]
+    cols.insert(cols.index("tasa_delitos_dep_mes_lag") + 1, "acumulado_90d")
+    return df[cols + ["mes_idx"]]
+
+def _rows(df: pd.DataFrame, monthly: pd.DataFrame, dirty: pd.MultiIndex = None) -> pd.DataFrame:
+    """Filas terminadas de las particiones `dirty` (todas si es None), tal como se guardan en PARTS_DIR."""
+    rows = _prepare(_with_rolling(df, dirty))
+    return dtypes.compact(_attach(rows, monthly))
+
+def _finish(rows: pd.DataFrame) -> pd.DataFrame:
+    """features.parquet a partir de las filas de todas las particiones: orden (municipio, fecha)
+    y los proxies de riesgo, que son totales de toda la historia y cambian en cada fila."""
+    rows = dtypes.compact(rows)
+    # Mismo orden que el sort estable del build original: municipio, fecha (las filas sin
+    # fecha al final) y, en los empates, el orden del master
+    fecha = rows["fecha_hecho"]
+    ts = np.where(fecha.isna(), np.iinfo(np.int64).max, fecha.to_numpy().astype("int64"))
+    order = np.lexsort((rows["evento_id"].to_numpy(), ts, rows["municipio"].cat.codes.to_numpy()))
+    rows = rows.take(order).reset_index(drop=True)
+
+    # Proxies de riesgo
+    rows["municipio_riesgo"] = rows.groupby("municipio", observed=True)["cantidad"].transform("sum")
+    rows["departamento_riesgo"] = rows.groupby("departamento", observed=True)["cantidad"].transform("sum")
+    return rows.drop(columns="mes_idx")
+
+def _partition_hashes(df: pd.DataFrame) -> pd.DataFrame:
+    """Hash (sensible al orden y al índice del master, que es el evento_id), número de filas
+    y total de `cantidad` del master por partición (municipio, anio, mes)."""
+    df = df[df["municipio"].notna()]
+    row_hash = pd.util.hash_pandas_object(df.drop(columns=["mes_idx"]), index=True).to_numpy()
+    pos = df.groupby(PARTITION_KEYS, sort=False, observed=True).cumcount().to_numpy().astype(np.uint64)
+    row_hash = pd.util.hash_array(row_hash + pos * np.uint64(0x9E3779B97F4A7C15))
+    parts = pd.DataFrame({"municipio": df["municipio"].astype(object).to_numpy(), "mes_idx": df["mes_idx"].to_numpy(),
+                          "hash": row_hash, "cantidad": df["cantidad"].to_numpy()})
+    out = parts.groupby(PARTITION_KEYS).agg(hash=("hash", "sum"), filas=("hash", "size"), cantidad=("cantidad", "sum"))
+    out["version"] = PARTS_VERSION
+    return out
+
+def _part_path(mes_idx: int):
+    name = "sin_fecha" if mes_idx < 0 else f"{mes_idx // 12:04d}-{mes_idx % 12 + 1:02d}"
+    return PARTS_DIR / f"{name}.parquet"
+
+def _write_parts(rows: pd.DataFrame, months, drop: pd.MultiIndex = None):
+    """Reescribe los archivos de los meses dados reemplazando las particiones `drop` por `rows`."""
+    PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    by_month = dict(tuple(rows.groupby("mes_idx")))
+    for mes_idx in months:
+        path = _part_path(mes_idx)
+        new = by_month.get(mes_idx, rows.iloc[:0])
+        if drop is not None and path.exists():
+            old = pd.read_parquet(path)
+            old = old[~pd.MultiIndex.from_frame(old[PARTITION_KEYS]).isin(drop)]
+            if len(old):
+                new = old if new.empty else dtypes.compact(pd.concat([old, new], ignore_index=True)) \
+                    .sort_values(["municipio","fecha_hecho","evento_id"], kind="mergesort")
+        if new.empty:
+            path.unlink(missing_ok=True)
+        else:
+            store.publish(new, path)
+
+def _read_parts() -> pd.DataFrame:
+    """Todas las filas guardadas en PARTS_DIR, en una sola conversión de arrow a pandas."""
+    paths = sorted(p for p in PARTS_DIR.glob("*.parquet") if p != MANIFEST)
+    if not paths:
+        return None
+    tables = [pq.ParquetFile(path).read() for path in paths]
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+def build(incremental: bool = False):
+    """Construye features.parquet (y PARTS_DIR con su manifiesto).
+
+    Con `incremental`, la preparación, acumulado_90d, los lags y riesgo_alto se calculan
+    solo para las particiones nuevas o modificadas, sus sucesoras dentro de la ventana de
+    90 días y las que cambian de lag o de riesgo_alto por datos de otra partición; el resto
+    se lee de PARTS_DIR tal cual. El master se lee y se hashea completo (es la única forma
+    de saber qué cambió) y features.parquet se vuelve a escribir entero: es un solo archivo
+    y municipio_riesgo/departamento_riesgo son totales de toda la historia en cada fila.
+    """
+    df = _keyed(_load_master())
+    hashes = _partition_hashes(df)
+    monthly = _monthly(hashes, df)
+    manifest = hashes.join(monthly)
+
+    out = None
+    previous = pd.read_parquet(MANIFEST) if incremental and MANIFEST.exists() else None
+    if previous is not None and (previous["version"] == PARTS_VERSION).all():
+        previous = previous.set_index(PARTITION_KEYS)
+        # Particiones nuevas o cuyo contenido cambió, y particiones que desaparecieron
+        common = manifest.index.intersection(previous.index)
+        modified = manifest.loc[common, "hash"].to_numpy() != previous.loc[common, "hash"].to_numpy()
+        changed = manifest.index.difference(previous.index).append(common[modified])
+        removed = previous.index.difference(manifest.index)
+        # Dependientes: los meses siguientes del mismo municipio dentro de la ventana de 90 días
+        touched = changed.append(removed)
+        follow = pd.MultiIndex.from_tuples(
+            [(m, i + k) for m, i in touched if i >= 0 for k in range(1, ROLLING_CONTEXT_MONTHS + 1)],
+            names=PARTITION_KEYS,
+        )
+        # ... y las que cambian de lag o de riesgo_alto (mes anterior o resto del mes modificados)
+        relabeled = common[(manifest.loc[common, MONTHLY_COLS].to_numpy()
+                            != previous.loc[common, MONTHLY_COLS].to_numpy()).any(axis=1)]
+        dirty = changed.append(manifest.index.intersection(follow)).append(relabeled).unique()
+        # Solo se reescriben los archivos de los meses con particiones sucias o eliminadas
+        if len(dirty) or len(removed):
+            months = set(dirty.get_level_values("mes_idx")) | set(removed.get_level_values("mes_idx"))
+            _write_parts(_rows(df, monthly, dirty), months, drop=dirty.append(removed))
+        rows = _read_parts()
+        if rows is None or len(rows) != manifest["filas"].sum():
+            print("⚠️ Particiones incompletas en disco: se recalculan todas.")
+        else:
+            out = _finish(rows)
+            print(f"♻️ Build incremental: {len(dirty)} de {len(manifest)} particiones recalculadas, {len(removed)} eliminadas.")
+    if out is None:
+        rows = _rows(df, monthly)
+        months = rows["mes_idx"].unique()
+        _write_parts(rows, months)
+        # Se publica cada mes encima del anterior; después se quitan los meses que ya no existen
+        keep = {_part_path(m) for m in months} | {MANIFEST}
+        for old in PARTS_DIR.glob("*.parquet"):
+            if old not in keep:
+                old.unlink()
+        out = _finish(rows)
+
+    store.publish(manifest.reset_index(), MANIFEST)
+    store.publish(out, PROC_DIR / "features.parquet")
     print("✅ Features built with >20 variables (solo Santander, con lag mensual).")
+    if SHARED_DATA:
+        store.share("features")
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Recalcula solo las particiones (municipio, anio, mes) nuevas o modificadas")
+    args = parser.parse_args()
+    build(incremental=args.incremental)
@@ -0,0 +1,78 @@
+# app/services/geoindex.py
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.config import GEO_DIR
+from app.services import recency, store
+
+GEO_FILE = GEO_DIR / "municipios.csv"
+
+_coords = None
+
+def coordinates() -> pd.DataFrame:
+    """lat/lon por codigo_dane (texto), leídas una sola vez del CSV de municipios."""
+    global _coords
+    if _coords is None:
+        geo = pd.read_csv(GEO_FILE)
+        _coords = geo.assign(codigo_dane=geo["codigo_dane"].astype(str)).set_index("codigo_dane")[["lat", "lon"]]
+    return _coords
+
+
+class GeoIndex:
+    """Coordenadas del master unidas una vez por versión + índice por ubicación y municipio.
+
+    Las coordenadas salen de codigo_dane, así que cada código del CSV es una ubicación:
+    una consulta por bbox filtra las ~300 ubicaciones y solo toca los eventos de las
+    que caen dentro del rectángulo.
+    """
+
+    def __init__(self, df: pd.DataFrame, order: np.ndarray):
+        coords = coordinates()
+        codes = pd.Categorical(df["codigo_dane"].astype(str), categories=coords.index).codes
+        self.loc_lat = coords["lat"].to_numpy()
+        self.loc_lon = coords["lon"].to_numpy()
+        self.lat = np.where(codes >= 0, self.loc_lat[codes], np.nan)
+        self.lon = np.where(codes >= 0, self.loc_lon[codes], np.nan)
+        self.order = order
+        self.rank = recency.rank(order)
+        # Los eventos sin coordenadas (código -1) quedan fuera de los grupos
+        self.loc_perm, self.loc_bounds = recency.groups(codes, order, len(coords))
+        muni = pd.Categorical(df["municipio"])
+        self.municipios = {m: i for i, m in enumerate(muni.categories)}
+        self.muni_perm, self.muni_bounds = recency.groups(muni.codes, order, len(muni.categories))
+
+    def _inside(self, lat: np.ndarray, lon: np.ndarray, bbox: Tuple[float, float, float, float]) -> np.ndarray:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+
+    def query(self, bbox: Optional[Tuple[float, float, float, float]] = None,
+              municipio: Optional[str] = None, limit: int = 200) -> np.ndarray:
+        """Posiciones de los `limit` eventos más recientes con coordenadas dentro del bbox y/o municipio."""
+        if municipio is not None:
+            m = self.municipios.get(municipio)
+            if m is None:
+                return np.empty(0, dtype=np.int64)
+            cand = self.muni_perm[self.muni_bounds[m]:self.muni_bounds[m + 1]]
+            keep = ~np.isnan(self.lat[cand])
+            if bbox is not None:
+                keep &= self._inside(self.lat[cand], self.lon[cand], bbox)
+            return cand[keep][:limit]
+
+        locs = np.arange(len(self.loc_lat)) if bbox is None else \
+            np.flatnonzero(self._inside(self.loc_lat, self.loc_lon, bbox))
+        # Basta con los `limit` más recientes de cada ubicación para el top global
+        parts = [
+            self.loc_perm[self.loc_bounds[l]:min(self.loc_bounds[l + 1], self.loc_bounds[l] + limit)]
+            for l in locs
+        ]
+        cand = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return cand[np.argsort(self.rank[cand], kind="stable")][:limit]
+
+
+def build(snap: store.Snapshot) -> GeoIndex:
+    return GeoIndex(snap.df, snap.derived("recency", recency.index))
+
+
+def current(snap: store.Snapshot) -> GeoIndex:
+    """Índice geográfico del snapshot del master (se construye una vez por versión)."""
+    return snap.derived("geo", lambda _: build(snap))
@@ -0,0 +1,159 @@
+# app/services/http_cache.py
+import hashlib
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+from app.config import HTTP_CACHE_MAX_AGE, HTTP_CACHE_SIZE, PROC_DIR
+from app.services import explain, kpis, model_metrics, store
+
+# Caché de respuestas GET del tablero (middleware ASGI). Cada ruta declara de qué artefactos
+# publicados depende; la versión de la respuesta es la de esos archivos (mtime-tamaño, la
+# misma de los snapshots de store.py) y el ETag es hash(ruta + parámetros + versión):
+#   If-None-Match igual -> 304 sin ejecutar el endpoint (ni tocar el pool)
+#   misma versión       -> cuerpo guardado (LRU de HTTP_CACHE_SIZE respuestas)
+#   ETL/train publican  -> cambia la versión: la entrada vieja se descarta en la siguiente petición
+# Solo se guardan respuestas 200; errores, 503 y 504 siempre pasan al endpoint.
+MAX_BODY = 1024 ** 2  # respuestas más grandes se sirven sin guardarlas
+# Parámetros que piden recalcular (p. ej. /analytics/metrics?rescore=true): con valor
+# verdadero la petición va siempre al endpoint, sin 304 y sin guardar la respuesta
+BYPASS_PARAMS = ("rescore",)
+TRUTHY = {"1", "true", "t", "yes", "y", "on"}
+
+
+def _file(path) -> str:
+    return store.file_version(path) if path.exists() else "-"
+
+
+def _model() -> str:
+    # current.json decide el directorio; el pkl y sus métricas (validate las reescribe) la versión
+    directory = store.model_dir()
+    return f"{directory.name}:{_file(directory / store.MODEL_FILE)}:{_file(directory / model_metrics.METRICS_FILE)}"
+
+
+ARTIFACTS: Dict[str, Callable[[], str]] = {
+    "features": lambda: _file(PROC_DIR / store.DATASETS["features"][0]),
+    "kpis": lambda: _file(PROC_DIR / kpis.KPIS_FILE),
+    "model": _model,
+    # explain.build publica con rename dentro de la carpeta: cambia su mtime
+    "explain": lambda: _file(explain.EXPLAIN_DIR),
+}
+
+# Ruta -> artefactos de los que depende la respuesta (terminada en "/" = prefijo)
+ROUTES: Dict[str, Tuple[str, ...]] = {
+    "/analytics/municipios": ("features",),
+    "/analytics/distribution/municipios": ("features",),
+    "/analytics/metrics": ("features", "model"),
+    "/analytics/risk/predict": ("features", "model"),
+    "/analytics/prediction/trend": ("features", "model"),
+    "/analytics/explain/": ("features", "model", "explain"),
+    "/analytics/kpis": ("features", "kpis"),
+    "/analytics/incidents/total": ("features", "kpis"),
+    "/analytics/response-time": ("features", "kpis"),
+    "/analytics/crime-rate": ("features", "kpis"),
+    "/analytics/cases/resolved": ("features", "kpis"),
+}
+
+
+def dependencies(path: str) -> Optional[Tuple[str, ...]]:
+    deps = ROUTES.get(path)
+    if deps is None:
+        deps = next((d for route, d in ROUTES.items() if route.endswith("/") and path.startswith(route)), None)
+    return deps
+
+
+def version(deps: Tuple[str, ...]) -> str:
+    return "|".join(ARTIFACTS[d]() for d in deps)
+
+
+class _Entry:
+    __slots__ = ("etag", "headers", "body")
+
+    def __init__(self, etag: bytes, headers: list, body: bytes):
+        self.etag, self.headers, self.body = etag, headers, body
+
+
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+stats = Counter()
+
+
+def _matches(if_none_match: bytes, etag: bytes) -> bool:
+    tags = [t.strip() for t in if_none_match.split(b",")]
+    return b"*" in tags or etag in (t[2:] if t.startswith(b"W/") else t for t in tags)
+
+
+def _store(key: str, entry: _Entry):
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    while len(_entries) > HTTP_CACHE_SIZE:
+        _entries.popitem(last=False)
+        stats["evictions"] += 1
+
+
+class ResponseCache:
+    """Middleware: ETag/Cache-Control, 304 y LRU de respuestas para las rutas de ROUTES."""
+
+    def __init__(self, app, max_age: int = HTTP_CACHE_MAX_AGE):
+        self.app = app
+        self.cache_control = f"max-age={max_age}, must-revalidate".encode()
+
+    async def __call__(self, scope, receive, send):
+        deps = dependencies(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if deps is None:
+            await self.app(scope, receive, send)
+            return
+        params = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        if any(k in BYPASS_PARAMS and v.lower() in TRUTHY for k, v in params):
+            stats["bypassed"] += 1
+            await self.app(scope, receive, send)
+            return
+        # Parámetros en orden canónico: ?a=1&b=2 y ?b=2&a=1 son la misma respuesta
+        query = urlencode(sorted(params))
+        key = f"{scope['path']}?{query}"
+        etag = f'"{hashlib.sha256(f"{key}#{version(deps)}".encode()).hexdigest()[:20]}"'.encode()
+        headers = dict(scope["headers"])
+
+        if _matches(headers.get(b"if-none-match", b""), etag):
+            stats["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [(b"etag", etag), (b"cache-control", self.cache_control)]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        entry = _entries.get(key)
+        if entry is not None and entry.etag == etag:
+            stats["hits"] += 1
+            _entries.move_to_end(key)
+            await send({"type": "http.response.start", "status": 200, "headers": entry.headers + [(b"x-cache", b"HIT")]})
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+        if entry is not None:
+            # Publicaron datos o modelo nuevos desde que se guardó
+            stats["invalidated"] += 1
+            _entries.pop(key, None)
+        stats["misses"] += 1
+
+        response = {"headers": None, "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    response["headers"] = [(k, v) for k, v in message.get("headers", [])
+                                           if k.lower() not in (b"etag", b"cache-control")]
+                    response["headers"] += [(b"etag", etag), (b"cache-control", self.cache_control)]
+                    message = {**message, "headers": response["headers"] + [(b"x-cache", b"MISS")]}
+            elif message["type"] == "http.response.body" and response["headers"] is not None:
+                response["body"].append(message.get("body", b""))
+                size = sum(len(b) for b in response["body"])
+                if not message.get("more_body", False) and size <= MAX_BODY:
+                    _store(key, _Entry(etag, response["headers"], b"".join(response["body"])))
+                elif size > MAX_BODY:
+                    response["headers"] = None
+            await send(message)
+
+        await self.app(scope, receive, capture)
+
+
+def metrics() -> dict:
+    """Aciertos, 304, invalidaciones, peticiones sin caché y ocupación del LRU (acumulados desde el arranque)."""
+    return {"size": len(_entries), "capacity": HTTP_CACHE_SIZE,
+            **{k: stats[k] for k in ("hits", "misses", "not_modified", "invalidated", "evictions", "bypassed")}}
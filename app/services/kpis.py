@@ -0,0 +1,79 @@
+# app/services/kpis.py
+import pandas as pd
+from app.config import PROC_DIR
+from app.services import store
+
+KPIS_FILE = "kpis.json"
+
+def month_bounds(last_date: pd.Timestamp):
+    cur_start = last_date.replace(day=1)
+    prev_start = (cur_start - pd.DateOffset(months=1)).replace(day=1)
+    return cur_start, prev_start
+
+def _variation(cur, prev) -> float:
+    return round(float((cur - prev) / prev * 100), 1) if prev else 0.0
+
+def compute(df: pd.DataFrame) -> dict:
+    """Calcula todos los KPIs del tablero (mes actual vs. mes anterior) en una sola pasada."""
+    fecha = pd.to_datetime(df["fecha_hecho"], errors="coerce")
+    last_date = fecha.max()
+    cur_start, prev_start = month_bounds(last_date)
+
+    cur_mask = (fecha >= cur_start) & (fecha <= last_date)
+    prev_mask = (fecha >= prev_start) & (fecha < cur_start)
+    cur, prev = df[cur_mask], df[prev_mask]
+
+    # Incidentes totales
+    cur_total = int(cur["cantidad"].sum())
+    prev_total = int(prev["cantidad"].sum())
+
+    # Tiempo de respuesta (proxy: máximo acumulado 90 días)
+    cur_resp = float(cur["acumulado_90d"].max()) if len(cur) else None
+    prev_resp = float(prev["acumulado_90d"].max()) if len(prev) else 0.0
+
+    # Tasa de criminalidad (proxy: tasa departamental con lag)
+    cur_rate = float(cur["tasa_delitos_dep_mes_lag"].mean()) if len(cur) else None
+    prev_rate = float(prev["tasa_delitos_dep_mes_lag"].mean()) if len(prev) else 0.0
+
+    # Casos en municipios de riesgo alto
+    cur_res = int(cur.loc[cur["riesgo_alto"] == 1, "cantidad"].sum())
+    prev_res = int(prev.loc[prev["riesgo_alto"] == 1, "cantidad"].sum())
+
+    return {
+        "periodo": {"desde": str(cur_start.date()), "hasta": str(last_date)},
+        "incidents_total": {"valor": cur_total, "variacion_pct": _variation(cur_total, prev_total)},
+        "response_time": {
+            "valor": round(cur_resp, 1) if cur_resp is not None else "N/A",
+            "variacion_pct": _variation(cur_resp, prev_resp) if cur_resp is not None else 0.0,
+        },
+        "crime_rate": {
+            "valor": round(cur_rate, 1) if cur_rate is not None else "N/A",
+            "variacion_pct": _variation(cur_rate, prev_rate) if cur_rate is not None else 0.0,
+        },
+        "cases_resolved": {"valor": cur_res, "variacion_pct": _variation(cur_res, prev_res)},
+    }
+
+def build():
+    df = pd.read_parquet(PROC_DIR / "features.parquet", columns=[
+        "departamento", "fecha_hecho", "cantidad", "acumulado_90d",
+        "tasa_delitos_dep_mes_lag", "riesgo_alto",
+    ])
+    df = df[df["departamento"] == "SANTANDER"]
+    snapshot = compute(df)
+    store.publish_json(snapshot, PROC_DIR / KPIS_FILE)
+    print(f"✅ KPIs del tablero guardados en {PROC_DIR / KPIS_FILE}")
+    return snapshot
+
+def fresh() -> bool:
+    """True si kpis.json existe y no es anterior al features."""
+    path = PROC_DIR / KPIS_FILE
+    return path.exists() and path.stat().st_mtime_ns >= (PROC_DIR / "features.parquet").stat().st_mtime_ns
+
+def current() -> dict:
+    """Snapshot de KPIs vigente; si falta o es anterior al features se deriva del frame en memoria."""
+    if fresh():
+        return store.document(KPIS_FILE).data
+    return store.snapshot("features").derived("kpis", compute)
+
+if __name__ == "__main__":
+    build()
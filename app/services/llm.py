@@ -0,0 +1,183 @@
+# app/services/llm.py
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.config import GITHUB_TOKEN, LLM_CACHE_TTL_SECONDS, LLM_TIMEOUT_SECONDS, MODEL_NAME, OPENAI_EMBEDDINGS_URL
+from app.services.chat_index import normalize
+
+# Puerta de salida única hacia el modelo remoto (GitHub Models, API compatible con OpenAI):
+#   caché TTL/LRU    -> misma pregunta normalizada + misma versión de datos = misma respuesta
+#   single-flight    -> peticiones idénticas concurrentes esperan una sola llamada
+#   timeout/fallback -> si el modelo no responde a tiempo se devuelve la respuesta de respaldo
+#   stream           -> fragmentos a medida que llegan; la respuesta completa también va a la caché
+CACHE_SIZE = 512
+
+Messages = List[Tuple[str, str]]  # (rol, contenido)
+
+
+class TTLCache:
+    """LRU acotado a `size` entradas que además expiran a los `ttl` segundos."""
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = LLM_CACHE_TTL_SECONDS):
+        self.size, self.ttl = size, ttl
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def _normalize_prompt(text: str) -> str:
+    return re.sub(r"\s+", " ", normalize(text)).strip()
+
+
+def cache_key(model: str, messages: Messages, data_version: str, params: dict) -> str:
+    payload = [model, [(role, _normalize_prompt(content)) for role, content in messages], data_version, sorted(params.items())]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def _default_client():
+    from openai import AsyncOpenAI
+    # Sin reintentos del SDK: el plazo total lo controla el gateway
+    return AsyncOpenAI(base_url=OPENAI_EMBEDDINGS_URL, api_key=GITHUB_TOKEN, max_retries=0)
+
+
+class Gateway:
+    """Cliente asíncrono del LLM con caché, coalescencia de peticiones y respuesta de respaldo."""
+
+    def __init__(self, client=None, model: str = MODEL_NAME, timeout: float = LLM_TIMEOUT_SECONDS,
+                 cache: Optional[TTLCache] = None):
+        self._client = client
+        self.model = model
+        self.timeout = timeout
+        self.cache = cache or TTLCache()
+        self.stats = Counter()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _default_client()
+        return self._client
+
+    async def complete(self, messages: Messages, fallback: str, data_version: str = "", **params) -> str:
+        """Respuesta del modelo para `messages`; `fallback` si falla o supera el timeout
+        (las respuestas de respaldo no se guardan en caché)."""
+        key = cache_key(self.model, messages, data_version, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            # La llamada vive en su propia tarea: si quien la inició se cancela, los demás la siguen esperando
+            task = asyncio.ensure_future(self._fetch(key, messages, fallback, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _create(self, messages: Messages, params: dict, stream: bool = False):
+        return self.client.chat.completions.create(
+            model=self.model, messages=[{"role": r, "content": c} for r, c in messages], stream=stream, **params,
+        )
+
+    def _failed(self, e: Exception, detail: str = "se usa la respuesta de respaldo"):
+        if isinstance(e, asyncio.TimeoutError):
+            self.stats["timeouts"] += 1
+            print(f"⚠️ LLM sin respuesta en {self.timeout:g} s: {detail}")
+        else:
+            self.stats["errors"] += 1
+            print(f"⚠️ LLM no disponible ({type(e).__name__}): {detail}")
+
+    async def _fetch(self, key: str, messages: Messages, fallback: str, params: dict) -> str:
+        try:
+            response = await asyncio.wait_for(self._create(messages, params), self.timeout)
+            answer = response.choices[0].message.content
+        except Exception as e:
+            self._failed(e)
+            return fallback
+        self.cache.set(key, answer)
+        return answer
+
+    async def stream(self, messages: Messages, fallback: str, data_version: str = "", **params) -> AsyncIterator[str]:
+        """Fragmentos de la respuesta a medida que los entrega el modelo.
+
+        Una respuesta en caché sale de una vez; si el modelo falla o no responde antes del
+        primer fragmento sale `fallback`, y si se corta a mitad se propaga el error. Solo se
+        pide el siguiente fragmento cuando el anterior ya se entregó (contrapresión), y al
+        cerrar el generador (cliente desconectado) se cierra la conexión con el modelo.
+        """
+        key = cache_key(self.model, messages, data_version, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            yield cached
+            return
+        self.stats["streams"] += 1
+        try:
+            upstream = await asyncio.wait_for(self._create(messages, params, stream=True), self.timeout)
+        except Exception as e:
+            self._failed(e)
+            yield fallback
+            return
+        parts = []
+        try:
+            chunks = upstream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            if parts:
+                self._failed(e, "respuesta interrumpida")
+                raise
+            self._failed(e)
+            yield fallback
+            return
+        finally:
+            await upstream.close()
+        self.cache.set(key, "".join(parts))
+
+
+_gateway: Optional[Gateway] = None
+
+
+def gateway() -> Gateway:
+    """Gateway compartido por los routers (se crea al primer uso)."""
+    global _gateway
+    if _gateway is None:
+        _gateway = Gateway()
+    return _gateway
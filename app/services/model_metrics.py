@@ -0,0 +1,53 @@
+# app/services/model_metrics.py
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from sklearn.metrics import classification_report, roc_auc_score, precision_recall_curve, auc
+from app.services import store
+
+# Métricas del modelo calculadas al entrenar/validar, junto a risk_model.pkl.
+# "model_version" es la versión del pkl al que corresponden (store.model_version: hash del contenido).
+METRICS_FILE = "risk_model.metrics.json"
+
+
+def evaluate(y_true, y_pred, y_proba: Optional[np.ndarray] = None) -> dict:
+    """ROC-AUC, PR-AUC y classification_report (0.0 si el modelo no da probabilidades
+    o si en y_true hay una sola clase)."""
+    roc = pr = 0.0
+    if y_proba is not None and len(np.unique(y_true)) > 1:
+        roc = float(roc_auc_score(y_true, y_proba))
+        precision, recall, _ = precision_recall_curve(y_true, y_proba)
+        pr = float(auc(recall, precision))
+    report = classification_report(y_true, y_pred, output_dict=True)
+    return {"roc_auc": roc, "pr_auc": pr, "report": report, "filas": int(len(y_true))}
+
+
+def write(section: str, values: dict, directory: Path = None):
+    """Guarda `section` (train / validation) para el pkl de `directory` (el vigente por
+    defecto); si el archivo era de otro modelo se empieza de cero."""
+    directory = directory or store.model_dir()
+    version = store.model_version(directory)
+    path = directory / METRICS_FILE
+    doc = {}
+    if path.exists():
+        doc = store.document(METRICS_FILE, directory).data
+    if doc.get("model_version") != version:
+        doc = {"model_version": version}
+    doc = {**doc, section: {**values, "at": datetime.now(timezone.utc).isoformat(timespec="seconds")}}
+    store.publish_json(doc, path)
+
+
+def read(directory: Path) -> Optional[dict]:
+    path = directory / METRICS_FILE
+    return store.document(METRICS_FILE, directory).data if path.exists() else None
+
+
+def current(model: Optional[store.Snapshot] = None) -> Optional[dict]:
+    """Métricas del snapshot `model` (el vigente por defecto), o None si no hay artefacto
+    o es de otro pkl."""
+    model = model or store.model()
+    doc = read(store.model_dir())
+    if doc is None:
+        return None
+    return doc if doc.get("model_version") == model.version else None
@@ -0,0 +1,176 @@
+# app/services/olap.py
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.config import PROC_DIR
+from app.services import store
+
+# Cubo OLAP del features: suma de 'cantidad' y número de filas por cada combinación de
+# DIMENSIONS presente en los datos. Se materializa en cube.parquet después de features.build();
+# los roll-ups (el cubo con menos dimensiones) se agregan desde él la primera vez que una
+# consulta los necesita y quedan en memoria con el snapshot del features.
+DIMENSIONS = ["municipio", "anio", "mes", "tipo_delito", "genero", "grupo_etario", "dia_semana", "franja_hora"]
+MEASURES = ["cantidad", "filas"]
+CUBE_FILE = "cube.parquet"
+
+
+def _aggregate(labels: Dict[str, list], codes: List[np.ndarray], measures: Dict[str, np.ndarray]):
+    # Una celda por combinación de códigos (-1 = sin dato) con la suma de cada medida
+    rows = len(next(iter(measures.values())))
+    shape = tuple(len(labels[d]) + 1 for d in labels)
+    shifted = [np.where(c < 0, len(labels[d]), c) for d, c in zip(labels, codes)]
+    # Sin dimensiones (el total) queda una sola celda
+    flat = np.ravel_multi_index(shifted, shape) if shifted and rows else np.zeros(rows, dtype=np.int64)
+    keys, inverse = np.unique(flat, return_inverse=True)
+    cells = {}
+    for d, c in zip(labels, np.unravel_index(keys, shape) if shape else ()):
+        cells[d] = np.where(c == len(labels[d]), -1, c).astype(np.int32)
+    sums = {}
+    for name, values in measures.items():
+        total = np.bincount(inverse, weights=values, minlength=len(keys))
+        sums[name] = np.rint(total).astype(np.int64) if values.dtype.kind in "iub" else total
+    return cells, sums
+
+
+class Cube:
+    """Celdas del cubo en arreglos: código de cada dimensión (-1 = sin dato) y sus medidas."""
+
+    def __init__(self, labels: Dict[str, list], codes: Dict[str, np.ndarray], measures: Dict[str, np.ndarray]):
+        self.labels = labels
+        self.lookup = {d: {v: i for i, v in enumerate(values)} for d, values in labels.items()}
+        self.codes = codes
+        self.measures = measures
+        self._rollups: Dict[frozenset, "Cube"] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.measures["filas"])
+
+    @property
+    def dimensions(self) -> List[str]:
+        return list(self.codes)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dimensions: Sequence[str] = DIMENSIONS) -> "Cube":
+        """Agrega el frame por filas (el features) a una celda por combinación de `dimensions`."""
+        labels, codes = {}, []
+        for dim in dimensions:
+            cat = pd.Categorical(df[dim])
+            labels[dim] = cat.categories.tolist()
+            codes.append(cat.codes.astype(np.int64))
+        cantidad = df["cantidad"]
+        if pd.api.types.is_integer_dtype(cantidad.dtype) and not cantidad.hasnans:
+            cantidad = cantidad.to_numpy(dtype=np.int64)
+        else:
+            cantidad = np.nan_to_num(cantidad.to_numpy(dtype=np.float64, na_value=np.nan))
+        cells, sums = _aggregate(labels, codes, {"cantidad": cantidad, "filas": np.ones(len(df), dtype=np.int64)})
+        return cls(labels, cells, sums)
+
+    @classmethod
+    def from_cells(cls, df: pd.DataFrame) -> "Cube":
+        """Cubo ya agregado (cube.parquet): columnas categóricas por dimensión y las medidas."""
+        labels, codes = {}, {}
+        for dim in (c for c in df.columns if c not in MEASURES):
+            # Parquet solo conserva como categóricas las de texto; anio/mes vuelven numéricas
+            cat = pd.Categorical(df[dim])
+            labels[dim] = cat.categories.tolist()
+            codes[dim] = cat.codes.astype(np.int32)
+        return cls(labels, codes, {m: df[m].to_numpy() for m in MEASURES})
+
+    def to_frame(self) -> pd.DataFrame:
+        cells = {d: pd.Categorical.from_codes(c, categories=self.labels[d]) for d, c in self.codes.items()}
+        return pd.DataFrame({**cells, **self.measures})
+
+    def rollup(self, dimensions: Iterable[str]) -> "Cube":
+        """El cubo con solo `dimensions` (las demás se suman); se calcula una vez y se reutiliza."""
+        wanted = set(dimensions)
+        unknown = wanted - set(self.codes)
+        if unknown:
+            raise KeyError(f"Dimensiones fuera del cubo: {sorted(unknown)}")
+        if len(wanted) == len(self.codes):
+            return self
+        key = frozenset(wanted)
+        cube = self._rollups.get(key)
+        if cube is None:
+            with self._lock:
+                cube = self._rollups.get(key)
+                if cube is None:
+                    # Se parte del roll-up ya calculado más pequeño que contenga esas dimensiones
+                    source = min((c for k, c in self._rollups.items() if key < k), key=len, default=self)
+                    keep = [d for d in self.codes if d in wanted]
+                    cells, sums = _aggregate(
+                        {d: self.labels[d] for d in keep}, [source.codes[d] for d in keep], source.measures,
+                    )
+                    cube = self._rollups[key] = Cube({d: self.labels[d] for d in keep}, cells, sums)
+        return cube
+
+    def sum(self, by: Sequence[str] = (), where: Optional[Dict[str, object]] = None, measure: str = "cantidad"):
+        """Suma de `measure` ('cantidad' o 'filas') agrupada por `by` entre las celdas que cumplen `where`.
+
+        `where` es dimensión -> valor o lista de valores (None = sin filtro). Con `by` vacío
+        devuelve el total; si no, una Series igual a `groupby(by, observed=True)[measure].sum()`
+        sobre el frame filtrado: grupos con filas, en el orden de las categorías.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        where = {d: v for d, v in (where or {}).items() if v is not None}
+        cube = self.rollup(set(by) | set(where))
+        mask = np.ones(len(cube), dtype=bool)
+        for dim, value in where.items():
+            values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            wanted = [cube.lookup[dim][v] for v in values if v in cube.lookup[dim]]
+            mask &= np.isin(cube.codes[dim], wanted)
+        values = cube.measures[measure]
+        if not by:
+            return values[mask].sum().item()
+        for dim in by:
+            mask &= cube.codes[dim] >= 0
+        shape = tuple(len(cube.labels[d]) for d in by)
+        keys, inverse = np.unique(np.ravel_multi_index([cube.codes[d][mask] for d in by], shape), return_inverse=True)
+        sums = np.bincount(inverse, weights=values[mask], minlength=len(keys))
+        if values.dtype.kind in "iub":
+            sums = np.rint(sums).astype(np.int64)
+        positions = np.unravel_index(keys, shape)
+        levels = [pd.Index(cube.labels[d]).take(p) for d, p in zip(by, positions)]
+        index = levels[0].rename(by[0]) if len(by) == 1 else pd.MultiIndex.from_arrays(levels, names=by)
+        return pd.Series(sums, index=index, name=measure)
+
+
+def _read(feat: store.Snapshot) -> Optional[Cube]:
+    path = PROC_DIR / CUBE_FILE
+    if not path.exists():
+        return None
+    meta = pq.read_schema(path).metadata or {}
+    if meta.get(b"features_version", b"").decode() != feat.version:
+        return None
+    return Cube.from_cells(pd.read_parquet(path))
+
+
+def current(feat: Optional[store.Snapshot] = None) -> Cube:
+    """Cubo del snapshot del features: el de cube.parquet si corresponde a esa versión, si no
+    se agrega desde el frame en memoria (una vez por versión)."""
+    feat = feat or store.snapshot("features")
+    def load(df: pd.DataFrame) -> Cube:
+        cube = _read(feat)
+        return cube if cube is not None else Cube.from_frame(df)
+    return feat.derived("olap.cube", load)
+
+
+def build() -> Cube:
+    feat = store.snapshot("features")
+    t0 = time.perf_counter()
+    cube = Cube.from_frame(feat.df)
+    table = pa.Table.from_pandas(cube.to_frame(), preserve_index=False)
+    meta = {**(table.schema.metadata or {}), b"features_version": feat.version.encode()}
+    with store.atomic_path(PROC_DIR / CUBE_FILE) as tmp:
+        pq.write_table(table.replace_schema_metadata(meta), tmp)
+    print(f"✅ Cubo OLAP guardado en {PROC_DIR / CUBE_FILE} "
+          f"({len(feat.df):,} filas -> {len(cube):,} celdas, {time.perf_counter() - t0:.2f} s)")
+    return cube
+
+
+if __name__ == "__main__":
+    build()
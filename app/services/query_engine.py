@@ -0,0 +1,92 @@
+# app/services/query_engine.py
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.services import recency, store
+
+# Columnas con índice invertido (las que filtra /crimes/query)
+FILTER_COLS = ["departamento", "municipio", "tipo_delito", "anio", "mes"]
+# Filas que se verifican por bloque contra los filtros restantes
+SCAN_BLOCK = 4_096
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+class Postings:
+    """Índice invertido de una columna: valor -> posiciones de más reciente a más vieja."""
+
+    def __init__(self, values: pd.Series, order: np.ndarray, rank: np.ndarray):
+        codes, uniques = pd.factorize(values)
+        self.codes = codes
+        self.lookup = {v: i for i, v in enumerate(uniques.tolist())}
+        self.perm, self.bounds = recency.groups(codes, order, len(uniques))
+        # Puesto de recencia de cada entrada (creciente dentro de cada lista) para reanudar con el cursor
+        self.ranks = rank[self.perm]
+
+    def code(self, value) -> int:
+        return self.lookup.get(value, -1)
+
+    def span(self, code: int) -> Tuple[int, int]:
+        return (self.bounds[code], self.bounds[code + 1]) if code >= 0 else (0, 0)
+
+    def size(self, code: int) -> int:
+        start, end = self.span(code)
+        return end - start
+
+
+class QueryEngine:
+    """Consultas por igualdad sobre el master sin copiar ni ordenar el frame.
+
+    Se recorre la lista invertida más corta (ya en orden de recencia) y sus posiciones
+    se verifican por bloques contra los códigos de las demás columnas hasta juntar
+    `limit` filas. El cursor es el puesto de recencia de la última fila entregada.
+    """
+
+    def __init__(self, df: pd.DataFrame, order: np.ndarray):
+        self.order = order
+        self.rank = recency.rank(order)
+        self.seq = np.arange(len(order))
+        self.postings = {c: Postings(df[c], order, self.rank) for c in FILTER_COLS if c in df.columns}
+
+    def search(self, filters: Dict[str, object], limit: int, after: Optional[int] = None):
+        """Posiciones de las `limit` filas más recientes que cumplen `filters` (columna -> valor)
+        y el cursor de la página siguiente (None si no hay más)."""
+        if limit <= 0:
+            return _EMPTY, None
+        codes = {c: self.postings[c].code(v) for c, v in filters.items()}
+        if any(code < 0 for code in codes.values()):
+            return _EMPTY, None
+
+        if codes:
+            lead = min(codes, key=lambda c: self.postings[c].size(codes[c]))
+            perm, ranks = self.postings[lead].perm, self.postings[lead].ranks
+            start, end = self.postings[lead].span(codes[lead])
+        else:
+            lead, perm, ranks = None, self.order, self.seq
+            start, end = 0, len(perm)
+        if after is not None:
+            start += int(np.searchsorted(ranks[start:end], after, side="right"))
+        rest = [(self.postings[c].codes, code) for c, code in codes.items() if c != lead]
+
+        found, total = [], 0
+        block = max(SCAN_BLOCK, limit + 1)
+        while start < end and total <= limit:
+            cand = perm[start:min(start + block, end)]
+            for col_codes, code in rest:
+                cand = cand[col_codes[cand] == code]
+            found.append(cand)
+            total += len(cand)
+            start += block
+        hits = np.concatenate(found) if found else _EMPTY
+        page = hits[:limit]
+        more = len(hits) > limit
+        return page, (int(self.rank[page[-1]]) if more else None)
+
+
+def build(snap: store.Snapshot) -> QueryEngine:
+    return QueryEngine(snap.df, snap.derived("recency", recency.index))
+
+
+def current(snap: store.Snapshot) -> QueryEngine:
+    """Motor de consultas del snapshot del master (índices construidos una vez por versión)."""
+    return snap.derived("query", lambda _: build(snap))
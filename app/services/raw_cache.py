@@ -0,0 +1,176 @@
+# app/services/raw_cache.py
+import hashlib
+import json
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import requests
+from app.config import RAW_DIR
+from app.services import store
+
+# Un manifiesto por fuente (<fuente>.manifest.json en RAW_DIR) para que las
+# ingestas en paralelo no compitan por el mismo archivo.
+NORMALIZE_VERSION = 1
+CHUNK_BYTES = 1 << 20
+TIMEOUT = 60
+
+def _manifest_path(name: str) -> Path:
+    return RAW_DIR / f"{name}.manifest.json"
+
+def load(name: str) -> dict:
+    path = _manifest_path(name)
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save(name: str, entry: dict):
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
+    store.publish_json(entry, _manifest_path(name))
+
+def digest(path: Path) -> dict:
+    """sha256, tamaño y número de filas (líneas de datos) de un CSV."""
+    sha = hashlib.sha256()
+    lines = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+            sha.update(block)
+            lines += block.count(b"\n")
+    st = path.stat()
+    return {"sha256": sha.hexdigest(), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "rows": max(lines - 1, 0)}
+
+def file_sha256(path: Path, entry: Optional[dict] = None) -> str:
+    """Hash del archivo; reutiliza el del manifiesto si es el mismo archivo con igual tamaño y mtime."""
+    st = path.stat()
+    if (
+        entry and "sha256" in entry and path == RAW_DIR / entry.get("path", "")
+        and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return entry["sha256"]
+    return digest(path)["sha256"]
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+def _fetch_local(name: str, url: str, path: Path, entry: dict) -> dict:
+    src = Path(url2pathname(urlparse(url).path))
+    st = src.stat()
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if path.exists() and entry.get("url") == url and entry.get("etag") == etag:
+        return {"status": "sin cambios"}
+    with store.atomic_path(path) as tmp:
+        shutil.copyfile(src, tmp)
+    return {"status": "descargado", "etag": etag, "last_modified": None}
+
+def _content_range(value: Optional[str]):
+    """(inicio, total) de un Content-Range "bytes a-b/total" o "bytes */total" (None si no se entiende)."""
+    try:
+        unit, spec = value.split(" ", 1)
+        span, total = spec.split("/", 1)
+        start = None if span == "*" else int(span.split("-", 1)[0])
+        return (start, None if total == "*" else int(total)) if unit == "bytes" else None
+    except (AttributeError, ValueError):
+        return None
+
+def _fetch_http(name: str, url: str, path: Path, entry: dict) -> dict:
+    part = path.with_name(f"{path.name}.part")
+    headers = {}
+    partial = (entry.get("partial") or {}) if entry.get("url") == url else {}
+    validator = partial.get("etag") or partial.get("last_modified")
+    if part.exists() and not validator:
+        # Sin ETag ni Last-Modified no hay If-Range: el servidor mandaría bytes de un recurso
+        # que pudo cambiar y se pegarían al .part viejo. Se descarga de cero.
+        part.unlink()
+    offset = part.stat().st_size if part.exists() else 0
+    if offset:
+        # Reanudar la descarga interrumpida, solo si el recurso sigue siendo el mismo
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif path.exists() and entry.get("url") == url:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    def restart():
+        part.unlink(missing_ok=True)
+        return _fetch_http(name, url, path, {k: v for k, v in entry.items() if k != "partial"})
+
+    with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as resp:
+        if resp.status_code == 304:
+            return {"status": "sin cambios"}
+        if resp.status_code == 416 and offset:
+            # El .part ya estaba completo (el corte fue tras el último byte) o el recurso se achicó
+            total = (_content_range(resp.headers.get("Content-Range")) or (None, None))[1]
+            if total != offset:
+                return restart()
+            part.replace(path)
+            return {"status": "reanudado", **partial}
+        resp.raise_for_status()
+        resumed = resp.status_code == 206
+        if resumed:
+            start, total = _content_range(resp.headers.get("Content-Range")) or (None, None)
+            if start != offset:
+                return restart()
+        else:
+            # Content-Length cuenta bytes codificados: solo sirve para verificar sin compresión
+            length = resp.headers.get("Content-Length")
+            encoded = resp.headers.get("Content-Encoding", "identity") != "identity"
+            total = int(length) if length and not encoded else None
+            # Se registran los validadores antes de escribir para poder reanudar si se corta
+            validators = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+            save(name, {**entry, "url": url, "partial": validators})
+        with open(part, "ab" if resumed else "wb") as f:
+            for block in resp.iter_content(CHUNK_BYTES):
+                f.write(block)
+    size = part.stat().st_size
+    if total is not None and size != total:
+        if size > total:
+            part.unlink()
+        raise IOError(f"Descarga de {name} incompleta: {size} de {total} bytes")
+    part.replace(path)
+    return {"status": "reanudado" if resumed else "descargado", **(partial if resumed else validators)}
+
+def fetch(name: str, url: str, path: Path, force: bool = False) -> dict:
+    """Descarga `url` en `path` solo si cambió desde la última vez; devuelve la entrada del manifiesto."""
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
+    entry = {} if force else load(name)
+    if force:
+        path.unlink(missing_ok=True)
+    fetcher = _fetch_local if urlparse(url).scheme == "file" else _fetch_http
+    result = fetcher(name, url, path, entry)
+    if result.pop("status") == "sin cambios":
+        print(f"⏭️ Fuente {name} sin cambios (caché {path.name})")
+        return entry
+
+    info = digest(path)
+    new_entry = {**result, **info, "url": url, "path": path.name, "fetched_at": _now()}
+    # Mismo contenido aunque el servidor no soporte peticiones condicionales
+    if entry.get("sha256") == info["sha256"]:
+        new_entry["normalized"] = entry.get("normalized")
+    save(name, {k: v for k, v in new_entry.items() if v is not None})
+    return new_entry
+
+def is_normalized(name: str, src: Path, out: Path) -> bool:
+    """True si `out` ya se generó a partir de este mismo `src` (mismo hash y versión de normalize)."""
+    entry = load(name)
+    done = entry.get("normalized") or {}
+    return (
+        out.exists()
+        and done.get("version") == NORMALIZE_VERSION
+        and done.get("output") == out.name
+        and done.get("sha256") == file_sha256(src, entry)
+    )
+
+def mark_normalized(name: str, src: Path, out: Path):
+    entry = load(name)
+    entry["normalized"] = {
+        "sha256": file_sha256(src, entry),
+        "version": NORMALIZE_VERSION,
+        "output": out.name,
+        "at": _now(),
+    }
+    save(name, entry)
@@ -0,0 +1,50 @@
+# app/services/recency.py
+import json
+import numpy as np
+import pandas as pd
+from app.services import store
+
+def index(df: pd.DataFrame) -> np.ndarray:
+    """Posiciones de todos los eventos, de más nuevo a más viejo (NaT al final).
+
+    Usa el mismo orden que sort_values("fecha_hecho", ascending=False) sobre el frame
+    completo, de modo que los empates quedan igual que antes.
+    """
+    order = df["fecha_hecho"].reset_index(drop=True).sort_values(ascending=False).index
+    return order.to_numpy()
+
+def rank(order: np.ndarray) -> np.ndarray:
+    """Puesto de recencia de cada posición (0 = el más reciente)."""
+    out = np.empty(len(order), dtype=np.int64)
+    out[order] = np.arange(len(order))
+    return out
+
+def groups(keys: np.ndarray, order: np.ndarray, n_keys: int):
+    """Listas invertidas: posiciones agrupadas por clave (0..n_keys-1) y, dentro de cada
+    grupo, de más reciente a más vieja. Las claves -1 (faltantes) quedan fuera."""
+    # Orden estable sobre posiciones que ya vienen por recencia
+    perm = order[np.argsort(keys[order], kind="stable")]
+    bounds = np.searchsorted(keys[perm], np.arange(n_keys + 1))
+    return perm, bounds
+
+def latest(snap: store.Snapshot, n: int) -> pd.DataFrame:
+    """Los `n` eventos más recientes del snapshot del master (índice calculado una vez por versión)."""
+    order = snap.derived("recency", index)
+    return snap.df.iloc[order[:n]]
+
+def severity(cantidad: pd.Series) -> np.ndarray:
+    cantidad = cantidad.fillna(0).to_numpy()
+    return np.select([cantidad >= 3, cantidad == 2], ["crítica", "alta"], "media")
+
+def text(s: pd.Series) -> pd.Series:
+    """Columna como texto, con los faltantes como "None" (lo que daba str() sobre el object original)."""
+    return s.astype(object).where(s.notna(), None).map(str)
+
+def render(records: list) -> bytes:
+    # Mismo JSON que produce JSONResponse de Starlette
+    return json.dumps(records, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def columns_to_records(cols: dict) -> list:
+    """Arma la lista de dicts a partir de columnas (sin iterar el DataFrame fila por fila)."""
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*(cols[k] for k in keys))]
@@ -0,0 +1,165 @@
+# app/services/registry.py
+import argparse
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+from app.config import MODELS_DIR
+from app.services import compiled, model_metrics, store
+
+# Registro de modelos en MODELS_DIR:
+#   registry/<versión>/ -> risk_model.pkl, risk_model.npz, risk_model.metrics.json, meta.json
+#   current.json        -> {"version", "pinned", "at"}: la versión que sirve la API
+# Activar o fijar una versión es reescribir current.json (rename atómico). La API lo
+# nota en store.model() y el watcher carga la versión nueva en segundo plano.
+META_FILE = "meta.json"
+KEEP_VERSIONS = 10
+WATCH_SECONDS = 5.0
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def pointer() -> Optional[dict]:
+    """Contenido de current.json, o None si todavía no hay registro."""
+    if not (MODELS_DIR / store.CURRENT_FILE).exists():
+        return None
+    return store.document(store.CURRENT_FILE, MODELS_DIR).data
+
+
+def _point(version: str, pinned: bool) -> dict:
+    if not (store.REGISTRY_DIR / version / META_FILE).exists():
+        raise KeyError(version)
+    doc = {"version": version, "pinned": pinned, "at": _now()}
+    store.publish_json(doc, MODELS_DIR / store.CURRENT_FILE)
+    return doc
+
+
+def new_version(backend: str) -> Path:
+    """Directorio para los artefactos de un entrenamiento (no se sirve hasta `register`)."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    name, n = f"{stamp}-{backend}", 1
+    while (store.REGISTRY_DIR / name).exists():
+        n += 1
+        name = f"{stamp}-{backend}-{n}"
+    directory = store.REGISTRY_DIR / name
+    directory.mkdir(parents=True)
+    return directory
+
+
+def _adopt_legacy() -> Optional[str]:
+    """El risk_model.pkl suelto de antes del registro pasa a ser una versión (para poder volver a él)."""
+    legacy = MODELS_DIR / store.MODEL_FILE
+    if pointer() is not None or not legacy.exists():
+        return None
+    directory = store.REGISTRY_DIR / f"legacy-{store.file_version(legacy)}"
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in (store.MODEL_FILE, compiled.COMPILED_FILE, model_metrics.METRICS_FILE):
+        if (MODELS_DIR / name).exists():
+            # Mismo contenido, misma versión de modelo: scores y explicaciones siguen valiendo
+            shutil.copy2(MODELS_DIR / name, directory / name)
+    store.publish_json({"version": directory.name, "created_at": _now(), "legacy": True}, directory / META_FILE)
+    _point(directory.name, pinned=False)
+    print(f"✅ Modelo previo registrado como {directory.name}")
+    return directory.name
+
+
+def register(directory: Path, meta: dict) -> str:
+    """Publica meta.json de la versión en `directory` y la activa, salvo que haya una versión fijada."""
+    _adopt_legacy()
+    version = directory.name
+    store.publish_json({
+        **meta, "version": version, "created_at": _now(),
+        "model_version": store.model_version(directory),
+    }, directory / META_FILE)
+    current = pointer()
+    if current and current["pinned"]:
+        print(f"⚠️ Versión {version} registrada sin activar: {current['version']} está fijada")
+    else:
+        _point(version, pinned=False)
+        print(f"✅ Versión {version} activa")
+    _prune()
+    return version
+
+
+def _prune():
+    # Se conservan las KEEP_VERSIONS más recientes (y siempre la vigente)
+    current = (pointer() or {}).get("version")
+    dirs = sorted((d for d in store.REGISTRY_DIR.iterdir() if d.is_dir()), key=lambda d: d.stat().st_mtime_ns)
+    for directory in dirs[:-KEEP_VERSIONS]:
+        if directory.name != current:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def versions() -> List[dict]:
+    """Versiones registradas (más reciente primero) con sus métricas de validación o de entrenamiento."""
+    if not store.REGISTRY_DIR.exists():
+        return []
+    current = pointer() or {}
+    out = []
+    for path in store.REGISTRY_DIR.glob(f"*/{META_FILE}"):
+        meta = store.document(META_FILE, path.parent).data
+        metrics = model_metrics.read(path.parent) or {}
+        section = metrics.get("validation") or metrics.get("train") or {}
+        out.append({
+            **meta, "roc_auc": section.get("roc_auc"), "pr_auc": section.get("pr_auc"),
+            "current": meta["version"] == current.get("version"),
+            "pinned": meta["version"] == current.get("version") and current.get("pinned", False),
+        })
+    return sorted(out, key=lambda v: v["created_at"], reverse=True)
+
+
+def pin(version: str) -> dict:
+    """Sirve `version` y la mantiene aunque se entrenen versiones nuevas (KeyError si no existe)."""
+    return _point(version, pinned=True)
+
+
+def unpin() -> Optional[dict]:
+    """Quita la fijación; la versión vigente sigue hasta el próximo entrenamiento."""
+    current = pointer()
+    return _point(current["version"], pinned=False) if current else None
+
+
+def warm():
+    """Carga la versión vigente (pkl y compilado) si aún no está en memoria."""
+    if (store.model_dir() / store.MODEL_FILE).exists():
+        store.model()
+        compiled.current()
+
+
+def watch(stop: threading.Event, interval: float = WATCH_SECONDS) -> threading.Thread:
+    """Hilo que sigue a current.json para que la carga de una versión nueva ocurra en
+    segundo plano y no dentro de la próxima petición que la necesite."""
+    def loop():
+        while not stop.wait(interval):
+            try:
+                warm()
+            except Exception as e:
+                print(f"⚠️ Watcher de modelos: {e}")
+    thread = threading.Thread(target=loop, name="model-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list", action="store_true", help="Lista las versiones registradas")
+    parser.add_argument("--pin", metavar="VERSION", help="Sirve VERSION aunque se entrenen versiones nuevas")
+    parser.add_argument("--unpin", action="store_true", help="El próximo entrenamiento vuelve a activarse solo")
+    parser.add_argument("--adopt", action="store_true", help="Registra el risk_model.pkl suelto de MODELS_DIR")
+    args = parser.parse_args()
+    if args.adopt:
+        _adopt_legacy()
+    if args.pin:
+        pin(args.pin)
+        print(f"📌 Versión {args.pin} fijada")
+    if args.unpin:
+        unpin()
+        print("✅ Sin versión fijada")
+    if args.list:
+        for v in versions():
+            mark = "📌" if v["pinned"] else ("✅" if v["current"] else "  ")
+            auc = f"{v['roc_auc']:.3f}" if v["roc_auc"] is not None else "—"
+            print(f"{mark} {v['version']:<36} {v.get('backend') or '—':<11} ROC-AUC {auc}  {v['created_at']}")
@@ -0,0 +1,52 @@
+# app/services/risk.py
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Variables que consume el modelo de riesgo (mismo orden que en train.py)
+MODEL_FEATURES = [
+    "departamento", "anio", "mes",
+    "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d",
+]
+
+Key = Tuple[str, Optional[str], int, int]
+
+
+class LookupTable:
+    """Fila representativa (mayor 'cantidad') por (departamento, municipio, anio, mes).
+
+    También guarda la fila por (departamento, anio, mes) con municipio None, que es
+    lo que se usa cuando la petición no trae municipio.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        ranked = df.sort_values("cantidad", ascending=False, kind="stable")
+        ranked = ranked[ranked["anio"].notna() & ranked["mes"].notna()]
+        by_muni = ranked.drop_duplicates(["departamento", "municipio", "anio", "mes"])
+        by_dep = ranked.drop_duplicates(["departamento", "anio", "mes"])
+        self.X = pd.concat([by_muni[MODEL_FEATURES], by_dep[MODEL_FEATURES]], ignore_index=True)
+        keys = list(zip(
+            by_muni["departamento"].astype(object).tolist(), by_muni["municipio"].astype(object).tolist(),
+            by_muni["anio"].astype(int).tolist(), by_muni["mes"].astype(int).tolist(),
+        )) + list(zip(
+            by_dep["departamento"].astype(object).tolist(), [None] * len(by_dep),
+            by_dep["anio"].astype(int).tolist(), by_dep["mes"].astype(int).tolist(),
+        ))
+        self.index: Dict[Key, int] = {k: i for i, k in enumerate(keys)}
+
+    def positions(self, keys: List[Key]) -> np.ndarray:
+        """Posición en X de cada clave (-1 si no hay features para esa combinación)."""
+        return np.fromiter((self.index.get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+
+
+def lookup_table(df: pd.DataFrame) -> LookupTable:
+    return LookupTable(df)
+
+
+def score(model, X: pd.DataFrame):
+    """Predicción y probabilidad de riesgo alto con una sola llamada a predict_proba."""
+    if not hasattr(model, "predict_proba"):
+        y_hat = model.predict(X)
+        return y_hat, y_hat.astype(float)
+    proba = model.predict_proba(X)
+    return model.classes_[proba.argmax(axis=1)], proba[:, 1]
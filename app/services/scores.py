@@ -0,0 +1,81 @@
+# app/services/scores.py
+from typing import Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.config import PROC_DIR
+from app.services import risk, store
+
+# Probabilidades por fila del features, una vez por (versión del features, versión del modelo).
+# Se guardan en scores/<versión del modelo>.parquet (hash del pkl, store.model_version),
+# alineadas con store.features().
+SCORES_DIR = PROC_DIR / "scores"
+KEEP_VERSIONS = 5
+
+
+def compute(model, df: pd.DataFrame) -> pd.DataFrame:
+    """Probabilidad y predicción de riesgo alto para todas las filas, en una sola llamada."""
+    X = df[risk.MODEL_FEATURES]
+    if len(X):
+        prediction, probability = risk.score(model, X)
+    else:
+        prediction, probability = np.empty(0, dtype=int), np.empty(0)
+    return pd.DataFrame({
+        "probabilidad": np.asarray(probability, dtype="float64"),
+        "prediccion": np.asarray(prediction).astype("int8"),
+    })
+
+
+def _path(model_version: str):
+    return SCORES_DIR / f"{model_version}.parquet"
+
+
+def _read(feat: store.Snapshot, model: store.Snapshot):
+    path = _path(model.version)
+    if not path.exists():
+        return None
+    meta = pq.read_schema(path).metadata or {}
+    if meta.get(b"features_version", b"").decode() != feat.version:
+        return None
+    out = pd.read_parquet(path)
+    return out if len(out) == len(feat.df) else None
+
+
+def _write(scores: pd.DataFrame, feat: store.Snapshot, model: store.Snapshot):
+    SCORES_DIR.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(scores, preserve_index=False)
+    meta = {**(table.schema.metadata or {}), b"features_version": feat.version.encode(), b"model_version": model.version.encode()}
+    with store.atomic_path(_path(model.version)) as tmp:
+        pq.write_table(table.replace_schema_metadata(meta), tmp)
+    # Solo se conservan las versiones de modelo más recientes
+    for old in sorted(SCORES_DIR.glob("*.parquet"), key=lambda p: p.stat().st_mtime_ns)[:-KEEP_VERSIONS]:
+        old.unlink(missing_ok=True)
+
+
+def _load_or_compute(feat: store.Snapshot, model: store.Snapshot) -> pd.DataFrame:
+    scores = _read(feat, model)
+    if scores is None:
+        scores = compute(model.data, feat.df)
+        _write(scores, feat, model)
+    return scores
+
+
+def current(feat: Optional[store.Snapshot] = None, model: Optional[store.Snapshot] = None):
+    """(scores, versión del modelo) para los snapshots del features y del modelo (los
+    vigentes por defecto); se recalculan solo si cambió el features o el modelo."""
+    feat, model = feat or store.snapshot("features"), model or store.model()
+    scores = feat.derived(f"scores:{model.version}", lambda _: _load_or_compute(feat, model))
+    return scores, model.version
+
+
+def build():
+    feat, model = store.snapshot("features"), store.model()
+    scores = compute(model.data, feat.df)
+    _write(scores, feat, model)
+    print(f"✅ Probabilidades por fila guardadas en {_path(model.version)} ({len(scores):,} filas)")
+    return scores
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,258 @@
+# app/services/store.py
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.config import MODELS_DIR, PROC_DIR, SHARED_DATA
+
+# Columnas que realmente consumen los routers (poda al leer el parquet)
+FEATURES_COLS = [
+    "departamento", "municipio", "anio", "mes", "fecha_hecho", "cantidad",
+    "tipo_delito", "genero", "grupo_etario", "dia_semana", "franja_hora",
+    "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d",
+    "riesgo_alto",
+]
+MASTER_COLS = [
+    "departamento", "municipio", "codigo_dane", "fecha_hecho", "tipo_delito",
+    "delito", "cantidad", "anio", "mes",
+]
+
+MODEL_FILE = "risk_model.pkl"
+# Registro de modelos: registry/<versión>/ con el pkl y sus artefactos; current.json
+# apunta a la versión que sirve la API (ver registry.py)
+REGISTRY_DIR = MODELS_DIR / "registry"
+CURRENT_FILE = "current.json"
+
+DATASETS = {
+    "features": ("features.parquet", FEATURES_COLS),
+    "master": ("master.parquet", MASTER_COLS),
+}
+
+# Copia para varios workers: el frame que sirve snapshot() (ya filtrado y podado) en Arrow
+# IPC sin comprimir junto al parquet. Cada proceso lo mapea en memoria y las columnas
+# numéricas, las fechas y los códigos de las categóricas quedan sobre las páginas del
+# archivo (caché del SO, una sola copia para todos). Se copian por proceso el texto
+# (codigo_dane), los enteros con nulos (anio, mes) y las etiquetas de las categorías.
+SHARED_SUFFIX = ".arrow"
+
+
+class Snapshot:
+    """Versión cargada (e inmutable) de un dataset o artefacto procesado.
+
+    El frame es compartido por todas las peticiones: quien necesite columnas nuevas o
+    convertidas las deriva con assign/copy, nunca asigna sobre `df` ni sobre sus vistas.
+    """
+
+    def __init__(self, name: str, data, signature: Tuple[int, int], version: Optional[str] = None):
+        self.name = name
+        self.data = data
+        self.signature = signature
+        self.version = version or _version(signature)
+        self._derived: Dict[str, object] = {}
+        # Reentrante: un derivado puede apoyarse en otro del mismo snapshot
+        self._lock = threading.RLock()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.data
+
+    def derived(self, key: str, fn: Callable[[object], object]):
+        """Artefacto derivado (índices, agregados) calculado una sola vez por versión."""
+        if key not in self._derived:
+            with self._lock:
+                if key not in self._derived:
+                    self._derived[key] = fn(self.data)
+        return self._derived[key]
+
+
+_lock = threading.Lock()
+_snapshots: Dict[str, Snapshot] = {}
+
+
+def _signature(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _version(signature: Tuple[int, int]) -> str:
+    return f"{signature[0]:x}-{signature[1]:x}"
+
+
+def file_version(path: Path) -> str:
+    """Versión (mtime-tamaño) con la que se publicaría hoy `path` como snapshot."""
+    return _version(_signature(path))
+
+
+def shared_path(name: str) -> Path:
+    return PROC_DIR / Path(DATASETS[name][0]).with_suffix(SHARED_SUFFIX).name
+
+
+def _parquet(name: str, path: Path) -> pd.DataFrame:
+    _, cols = DATASETS[name]
+    available = set(pq.read_schema(path).names)
+    df = pd.read_parquet(path, columns=[c for c in cols if c in available])
+    df = df[df["departamento"] == "SANTANDER"]
+    if "fecha_hecho" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["fecha_hecho"]):
+        df = df.assign(fecha_hecho=pd.to_datetime(df["fecha_hecho"], errors="coerce"))
+    return df
+
+
+def _map(path: Path, source_version: str) -> Optional[pd.DataFrame]:
+    """Frame sobre el Arrow IPC mapeado (sin copiar), si se generó desde esa versión del parquet."""
+    if not path.exists():
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    if (reader.schema.metadata or {}).get(b"source_version", b"").decode() != source_version:
+        return None
+    # split_blocks: una columna por bloque, sin consolidar (consolidar copiaría)
+    return reader.read_all().to_pandas(split_blocks=True)
+
+
+def _read(name: str, path: Path) -> pd.DataFrame:
+    # El .arrow compartido si está al día con el parquet; si no, lectura propia del parquet
+    df = _map(shared_path(name), file_version(path)) if SHARED_DATA else None
+    return df if df is not None else _parquet(name, path)
+
+
+def _current(key: str, path: Path, loader: Callable[[Path], object],
+             versioner: Optional[Callable[[Path], str]] = None) -> Snapshot:
+    sig = _signature(path)
+    snap = _snapshots.get(key)
+    if snap is not None and snap.signature == sig:
+        return snap
+    with _lock:
+        snap = _snapshots.get(key)
+        if snap is None or snap.signature != sig:
+            # Se carga completo antes de publicarlo: nadie ve un frame a medias
+            snap = Snapshot(key, loader(path), sig, versioner(path) if versioner else None)
+            _snapshots[key] = snap
+    return snap
+
+
+def snapshot(name: str) -> Snapshot:
+    """Snapshot vigente de `name`; recarga si el parquet en disco cambió."""
+    return _current(name, PROC_DIR / DATASETS[name][0], lambda path: _read(name, path))
+
+
+def document(filename: str, directory: Path = None) -> Snapshot:
+    """Snapshot de un artefacto JSON (en PROC_DIR por defecto), con la misma recarga atómica."""
+    def _load_json(path: Path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    path = (directory or PROC_DIR) / filename
+    return _current(str(path), path, _load_json)
+
+
+def artifact(path: Path, loader: Callable[[Path], object]) -> Snapshot:
+    """Snapshot de cualquier archivo publicado (modelos exportados, etc.) con la misma recarga atómica."""
+    return _current(str(path), path, loader)
+
+
+def model_dir() -> Path:
+    """Directorio del modelo vigente: registry/<versión> según current.json, o MODELS_DIR
+    mientras no haya registro."""
+    if (MODELS_DIR / CURRENT_FILE).exists():
+        return REGISTRY_DIR / document(CURRENT_FILE, MODELS_DIR).data["version"]
+    return MODELS_DIR
+
+
+def _content_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def model_version(directory: Path = None) -> str:
+    """Versión del pkl de `directory` (el vigente por defecto): hash de su contenido, no
+    mtime-tamaño, para que una copia o restauración del modelo conserve sus scores,
+    métricas y compilado. Se calcula una vez por archivo publicado."""
+    path = (directory or model_dir()) / MODEL_FILE
+    return _current(f"{path}#version", path, _content_hash).data
+
+
+def model() -> Snapshot:
+    """Snapshot del modelo de riesgo; recarga si cambia el puntero o se publica un pkl nuevo.
+    Su `version` es la de model_version()."""
+    return _current("model", model_dir() / MODEL_FILE, joblib.load, versioner=_content_hash)
+
+
+def features() -> pd.DataFrame:
+    return snapshot("features").df
+
+
+def master() -> pd.DataFrame:
+    return snapshot("master").df
+
+
+def share(name: str) -> Path:
+    """Publica <dataset>.arrow desde el parquet vigente (lo llaman features.build y etl.build_master)."""
+    source = PROC_DIR / DATASETS[name][0]
+    version = file_version(source)
+    table = pa.Table.from_pandas(_parquet(name, source))
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"source_version": version.encode()})
+    path = shared_path(name)
+    with atomic_path(path) as tmp:
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    print(f"✅ {path.name} compartido ({table.num_rows:,} filas, {path.stat().st_size / 1024 ** 2:.1f} MB)")
+    return path
+
+
+def preload():
+    """Carga al arranque los datasets disponibles (los ausentes se cargan al primer uso)."""
+    for name, (filename, _) in DATASETS.items():
+        if (PROC_DIR / filename).exists():
+            snapshot(name)
+
+
+@contextmanager
+def atomic_path(path: Path):
+    """Ruta temporal que reemplaza a `path` (rename atómico) solo si la escritura termina bien.
+
+    El temporal tiene nombre único: varios workers o procesos publicando el mismo archivo
+    no escriben sobre el mismo temporal; gana el último rename, siempre con un archivo completo.
+    """
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp = Path(name)
+    try:
+        # mkstemp lo crea con 0600: los artefactos publicados quedan legibles como antes
+        os.chmod(tmp, 0o644)
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def publish(df: pd.DataFrame, path: Path):
+    """Escribe un parquet de forma atómica (archivo temporal + rename)."""
+    with atomic_path(path) as tmp:
+        df.to_parquet(tmp, index=False)
+
+
+def publish_json(obj, path: Path):
+    """Escribe un JSON de forma atómica (archivo temporal + rename)."""
+    with atomic_path(path) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--share", action="store_true", help="Genera los .arrow compartidos de los datasets")
+    args = parser.parse_args()
+    if args.share:
+        for name, (filename, _) in DATASETS.items():
+            if (PROC_DIR / filename).exists():
+                share(name)
@@ -1,27 +1,74 @@
 # app/services/train.py
 import argparse
+import os
+import time
 import joblib
 import pandas as pd
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.impute import SimpleImputer
-from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
 from sklearn.metrics import classification_report, roc_auc_score, precision_recall_curve, auc
 
-from app.config import MODELS_DIR, PROC_DIR
+from app.config import PROC_DIR
+from app.services import compiled, model_metrics, registry, store
 
-def train_model():
-    # Cargar features y filtrar solo Santander
-    df = pd.read_parquet(PROC_DIR / "features.parquet")
-    df = df[df["departamento"] == "SANTANDER"].copy()
+# Definir variables y target (sin municipio)
+FEATURES = [
+    "departamento", "anio", "mes",
+    "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"
+]
+TARGET = "riesgo_alto"
+
+def _sklearn_gb():
+    return GradientBoostingClassifier(random_state=42)
 
-    # Definir variables y target (sin municipio)
-    features = [
-        "departamento", "anio", "mes",
-        "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"
-    ]
-    target = "riesgo_alto"
+def _hist_gb():
+    # Histogramas + OpenMP (usa todos los núcleos); mismos 100 árboles de profundidad 3
+    return HistGradientBoostingClassifier(
+        max_iter=100, max_depth=3, learning_rate=0.1, early_stopping=False, random_state=42,
+    )
+
+def _xgboost():
+    from xgboost import XGBClassifier
+    return XGBClassifier(
+        tree_method="hist", n_estimators=100, max_depth=3, learning_rate=0.1,
+        n_jobs=os.cpu_count(), random_state=42, eval_metric="logloss",
+    )
+
+# Backends del clasificador; todos van en el mismo Pipeline ("pre", "clf")
+BACKENDS = {
+    "sklearn-gb": _sklearn_gb,
+    "hist-gb": _hist_gb,
+    "xgboost": _xgboost,
+}
+DEFAULT_BACKEND = "sklearn-gb"
+
+def build_pipeline(backend: str = DEFAULT_BACKEND) -> Pipeline:
+    # Preprocesamiento de columnas
+    cat_cols = ["departamento"]
+    num_cols = ["anio", "mes", "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"]
+
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
+            ("num", Pipeline([
+                ("imputer", SimpleImputer(strategy="constant", fill_value=0)),
+                ("scaler", StandardScaler())
+            ]), num_cols),
+        ]
+    )
+
+    # Pipeline completo
+    return Pipeline(steps=[
+        ("pre", preprocessor),
+        ("clf", BACKENDS[backend]())
+    ])
+
+def temporal_split(df: pd.DataFrame):
+    """X_train, y_train, X_test, y_test con validación en el último año."""
+    features, target = FEATURES, TARGET
 
     # Split temporal: entrenar con todos los años menos el último y validar en el último
     ultimo_anio = int(df["anio"].max())
@@ -44,31 +91,26 @@ def train_model():
         X_test  = test_df[features]
         y_test  = test_df[target]
 
-    # Preprocesamiento de columnas
-    cat_cols = ["departamento"]
-    num_cols = ["anio", "mes", "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag", "acumulado_90d"]
-
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
-            ("num", Pipeline([
-                ("imputer", SimpleImputer(strategy="constant", fill_value=0)),
-                ("scaler", StandardScaler())
-            ]), num_cols),
-        ]
-    )
+    return X_train, y_train, X_test, y_test
 
-    # Clasificador
-    clf = GradientBoostingClassifier(random_state=42)
+def _window(X: pd.DataFrame) -> dict:
+    # Periodo (anio-mes) cubierto por un split, para la metadata del registro
+    periods = (X["anio"].astype(int) * 100 + X["mes"].astype(int)) if len(X) else pd.Series([0])
+    first, last = int(periods.min()), int(periods.max())
+    return {"desde": f"{first // 100}-{first % 100:02d}", "hasta": f"{last // 100}-{last % 100:02d}", "filas": int(len(X))}
 
-    # Pipeline completo
-    model = Pipeline(steps=[
-        ("pre", preprocessor),
-        ("clf", clf)
-    ])
+def train_model(backend: str = DEFAULT_BACKEND):
+    # Cargar features y filtrar solo Santander
+    df = pd.read_parquet(PROC_DIR / "features.parquet")
+    df = df[df["departamento"] == "SANTANDER"].copy()
+    X_train, y_train, X_test, y_test = temporal_split(df)
 
     # Entrenar
+    model = build_pipeline(backend)
+    t0 = time.perf_counter()
     model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - t0
+    print(f"⏱️ Backend {backend}: entrenamiento en {fit_seconds:.1f} s ({len(X_train):,} filas)")
 
     # Evaluación (validación temporal)
     y_pred = model.predict(X_test)
@@ -76,6 +118,7 @@ def train_model():
     print(classification_report(y_test, y_pred))
 
     # Métricas adicionales
+    y_proba = None
     if hasattr(model, "predict_proba"):
         y_proba = model.predict_proba(X_test)[:, 1]
         roc = roc_auc_score(y_test, y_proba)
@@ -84,14 +127,36 @@ def train_model():
         print(f"ROC-AUC: {roc:.3f}")
         print(f"PR-AUC: {pr:.3f}")
 
-    # Guardar modelo
-    MODELS_DIR.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, MODELS_DIR / "risk_model.pkl")
-    print(f"✅ Modelo guardado en {MODELS_DIR / 'risk_model.pkl'}")
+    # Guardar modelo como versión nueva del registro (la anterior queda para volver a ella)
+    directory = registry.new_version(backend)
+    pkl = directory / store.MODEL_FILE
+    with store.atomic_path(pkl) as tmp:
+        joblib.dump(model, tmp)
+    print(f"✅ Modelo guardado en {pkl}")
+
+    # Artefacto de inferencia en arreglos NumPy (la API cae al pkl si no existe)
+    try:
+        path = compiled.export(model, directory / compiled.COMPILED_FILE, store.model_version(directory))
+        print(f"✅ Inferencia compilada en {path}")
+    except ValueError as e:
+        print(f"⚠️ Sin inferencia compilada: {e}")
+
+    # Métricas de la validación temporal junto al modelo (las sirve /analytics/metrics)
+    model_metrics.write("train", {
+        **model_metrics.evaluate(y_test, y_pred, y_proba),
+        "backend": backend, "fit_seconds": round(fit_seconds, 2),
+    }, directory)
+
+    # Metadata y puntero current.json: la API cambia de modelo sin reiniciar
+    return registry.register(directory, {
+        "backend": backend, "features": FEATURES, "target": TARGET,
+        "ventana_train": _window(X_train), "ventana_test": _window(X_test),
+    })
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--train", action="store_true")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
     args = parser.parse_args()
     if args.train:
-        train_model()
+        train_model(args.backend)
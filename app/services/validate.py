@@ -1,12 +1,17 @@
 # app/services/validate.py
+import argparse
+from pathlib import Path
 import joblib
 import pandas as pd
 from sklearn.metrics import classification_report, roc_auc_score, precision_recall_curve, auc
-from app.config import MODELS_DIR, PROC_DIR
+from app.config import PROC_DIR
+from app.services import model_metrics, store
 
-def validate():
-    # Cargar modelo entrenado
-    model = joblib.load(MODELS_DIR / "risk_model.pkl")
+def validate(directory: Path = None):
+    # Versión del registro a validar: la recién entrenada si se indica (puede quedar sin
+    # activar si hay otra fijada), si no la vigente
+    model = joblib.load(directory / store.MODEL_FILE) if directory else store.model().data
+    directory = directory or store.model_dir()
 
     # Cargar features y filtrar solo Santander
     df = pd.read_parquet(PROC_DIR / "features.parquet")
@@ -30,6 +35,7 @@ def validate():
     print(classification_report(y_val, y_pred))
 
     # Métricas adicionales
+    y_proba = None
     if hasattr(model, "predict_proba"):
         y_proba = model.predict_proba(X_val)[:, 1]
         roc = roc_auc_score(y_val, y_proba)
@@ -38,5 +44,13 @@ def validate():
         print(f"ROC-AUC: {roc:.3f}")
         print(f"PR-AUC: {pr:.3f}")
 
+    # Artefacto versionado junto a risk_model.pkl
+    model_metrics.write("validation", {**model_metrics.evaluate(y_val, y_pred, y_proba), "anio": ultimo_anio},
+                        directory)
+    print(f"✅ Métricas guardadas en {directory / model_metrics.METRICS_FILE}")
+
 if __name__ == "__main__":
-    validate()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--version", default=None, help="Versión del registro a validar (por defecto la vigente)")
+    args = parser.parse_args()
+    validate(store.REGISTRY_DIR / args.version if args.version else None)
@@ -0,0 +1,25 @@
+# tests/conftest.py
+import os
+import pytest
+
+# app.config exige el token al importarse; las pruebas no llaman a servicios externos
+os.environ.setdefault("GITHUB_TOKEN", "test")
+os.environ.setdefault("OPENAI_EMBEDDINGS_URL", "http://127.0.0.1:9/")
+
+
+@pytest.fixture
+def llm_stub():
+    """Arranca servidores /chat/completions locales (bench.stub_llm_app) en un hilo y los apaga
+    al terminar la prueba; devuelve (app, url), con los contadores en app.state."""
+    from app.services.bench import _serve_in_thread, stub_llm_app
+    servers = []
+
+    def start(delay: float = 0.2, tokens: int = 0, token_delay: float = 0.0):
+        app = stub_llm_app(delay, tokens, token_delay)
+        server, url = _serve_in_thread(app)
+        servers.append(server)
+        return app, url
+
+    yield start
+    for server in servers:
+        server.should_exit = True
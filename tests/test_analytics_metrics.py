@@ -0,0 +1,82 @@
+# tests/test_analytics_metrics.py
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from app.routers import analytics
+from app.services import model_metrics, scores, store, train
+
+
+def _features(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "departamento": "SANTANDER",
+        "municipio": rng.choice(["BUCARAMANGA", "GIRON"], n),
+        "anio": rng.integers(2021, 2025, n),
+        "mes": rng.integers(1, 13, n),
+        "tasa_delitos_muni_mes_lag": rng.poisson(2, n).astype(float),
+        "tasa_delitos_dep_mes_lag": rng.poisson(400, n).astype(float),
+        "acumulado_90d": rng.gamma(2.0, 8.0, n),
+        "cantidad": rng.integers(1, 4, n),
+    })
+    # Con ruido: AUCs lejos de 1.0 (y de cualquier valor fijo)
+    noise = rng.normal(0, 2, n)
+    df["riesgo_alto"] = (df["tasa_delitos_muni_mes_lag"] + df["acumulado_90d"] / 8 + noise > 5).astype(int)
+    return df
+
+
+@pytest.fixture
+def artifacts(monkeypatch, tmp_path):
+    """Features y pkl sin risk_model.metrics.json, en directorios temporales."""
+    models, proc = tmp_path / "models", tmp_path / "processed"
+    models.mkdir(), proc.mkdir()
+    monkeypatch.setattr(store, "MODELS_DIR", models)
+    monkeypatch.setattr(store, "REGISTRY_DIR", models / "registry")
+    monkeypatch.setattr(store, "PROC_DIR", proc)
+    monkeypatch.setattr(store, "SHARED_DATA", False)
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(scores, "SCORES_DIR", proc / "scores")
+    df = _features(3_000, seed=3)
+    pipeline = train.build_pipeline("hist-gb")
+    pipeline.named_steps["clf"].set_params(max_iter=20)
+    pipeline.fit(df[train.FEATURES], df["riesgo_alto"])
+    joblib.dump(pipeline, models / store.MODEL_FILE)
+    store.publish(df, proc / "features.parquet")
+    return models, df, pipeline
+
+
+def _expected(df: pd.DataFrame, pipeline) -> dict:
+    val = df[df["anio"] == df["anio"].max()]
+    X = val[train.FEATURES]
+    return model_metrics.evaluate(val["riesgo_alto"], pipeline.predict(X), pipeline.predict_proba(X)[:, 1])
+
+
+def test_trend_computes_and_persists_validation(artifacts):
+    models, df, pipeline = artifacts
+    expected = _expected(df, pipeline)
+    assert 0.5 < expected["roc_auc"] < 0.99
+
+    out = analytics.prediction_trend.__wrapped__()
+    assert out["roc_auc"] == round(expected["roc_auc"], 4)
+    assert out["pr_auc"] == round(expected["pr_auc"], 4)
+
+    saved = model_metrics.current(store.model())
+    assert saved["model_version"] == store.model_version()
+    assert saved["validation"]["anio"] == int(df["anio"].max())
+    assert saved["validation"]["roc_auc"] == pytest.approx(expected["roc_auc"])
+    assert (models / model_metrics.METRICS_FILE).exists()
+
+
+def test_saved_validation_is_reused(artifacts):
+    model_metrics.write("validation", {"roc_auc": 0.61, "pr_auc": 0.42, "report": {}})
+    out = analytics.prediction_trend.__wrapped__()
+    assert (out["roc_auc"], out["pr_auc"]) == (0.61, 0.42)
+    assert analytics.metrics.__wrapped__().roc_auc == 0.61
+
+
+def test_rescore_does_not_replace_saved(artifacts):
+    _, df, pipeline = artifacts
+    model_metrics.write("validation", {"roc_auc": 0.61, "pr_auc": 0.42, "report": {}})
+    fresh = analytics.metrics.__wrapped__(rescore=True)
+    assert fresh.roc_auc == pytest.approx(_expected(df, pipeline)["roc_auc"])
+    assert model_metrics.current(store.model())["validation"]["roc_auc"] == 0.61
@@ -0,0 +1,67 @@
+# tests/test_chat_stream.py
+import asyncio
+import time
+import httpx
+import pytest
+from httpx_sse import aconnect_sse
+from openai import AsyncOpenAI
+from app.services import llm, store
+from app.services.bench import _serve_in_thread, _stub_words, _synthetic_features, stub_llm_app
+
+TOKENS = 40
+BODY = {"pregunta": "¿Cuántos hurtos hubo en Bucaramanga en la madrugada?"}
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """La API real en un hilo, con un features sintético y el gateway apuntando a un modelo local
+    que escribe TOKENS fragmentos (50 ms entre uno y otro)."""
+    proc = tmp_path_factory.mktemp("processed")
+    store.publish(_synthetic_features(5_000), proc / "features.parquet")
+    stub = stub_llm_app(delay=0.1, tokens=TOKENS, token_delay=0.05)
+    stub_server, stub_url = _serve_in_thread(stub)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(store, "PROC_DIR", proc)
+        mp.setattr(store, "SHARED_DATA", False)
+        mp.setattr(llm, "_gateway", llm.Gateway(AsyncOpenAI(base_url=stub_url, api_key="stub", max_retries=0), model="stub"))
+        from app.main import app
+        api_server, api_url = _serve_in_thread(app)
+        yield api_url, stub
+        api_server.should_exit = stub_server.should_exit = True
+
+
+async def _events(url: str, stop_after_tokens: int = None) -> list:
+    """(evento, datos) del stream; con `stop_after_tokens` el cliente se desconecta a mitad."""
+    events = []
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        async with aconnect_sse(client, "POST", "/chatbot/ask/stream", json=BODY) as source:
+            async for sse in source.aiter_sse():
+                events.append((sse.event, sse.json()))
+                if stop_after_tokens and sum(e == "token" for e, _ in events) == stop_after_tokens:
+                    break
+    return events
+
+
+def test_stream_order(api):
+    url, stub = api
+    llm.gateway().cache.clear()
+    events = asyncio.run(_events(url))
+    names = [name for name, _ in events]
+    assert names[0] == "resumen" and names.index("resumen") < names.index("token")
+    assert set(events[0][1]) >= {"entidades", "total", "hora", "top_muni", "reco"}
+    assert names[-1] == "fin" and names.count("fin") == 1 and "error" not in names
+    text = "".join(data["text"] for name, data in events if name == "token")
+    assert text == "".join(_stub_words(stub.state.calls, TOKENS))
+
+
+def test_disconnect_cancels_upstream(api):
+    url, stub = api
+    llm.gateway().cache.clear()
+    stub.state.sent = stub.state.cancelled = 0
+    events = asyncio.run(_events(url, stop_after_tokens=3))
+    assert [name for name, _ in events].count("token") == 3
+    deadline = time.monotonic() + 5
+    while not stub.state.cancelled and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stub.state.cancelled == 1
+    assert stub.state.sent < len(_stub_words(0, TOKENS))
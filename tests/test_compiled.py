@@ -0,0 +1,62 @@
+# tests/test_compiled.py
+import numpy as np
+import pandas as pd
+import pytest
+from app.services import compiled, train
+
+
+def _frame(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "departamento": rng.choice(["SANTANDER", "BOYACA"], n),
+        "anio": rng.integers(2015, 2025, n),
+        "mes": rng.integers(1, 13, n),
+        # Muchos ceros, como el primer mes de cada municipio: hay umbrales cerca del valor imputado
+        "tasa_delitos_muni_mes_lag": rng.poisson(2, n).astype(float),
+        "tasa_delitos_dep_mes_lag": rng.poisson(400, n).astype(float),
+        "acumulado_90d": rng.gamma(2.0, 8.0, n),
+    })[train.FEATURES]
+
+
+@pytest.fixture(scope="module", params=sorted(train.BACKENDS))
+def models(request, tmp_path_factory):
+    """Pipeline pequeño de cada backend y su exportación cargada desde el .npz."""
+    X = _frame(2_000, seed=1)
+    y = ((X["tasa_delitos_muni_mes_lag"] + X["acumulado_90d"] / 4 > 6) ^ (X["departamento"] == "BOYACA")).astype(int)
+    pipeline = train.build_pipeline(request.param)
+    # Pocos árboles: la paridad no depende del tamaño del ensamble
+    pipeline.named_steps["clf"].set_params(**{"max_iter" if request.param == "hist-gb" else "n_estimators": 20})
+    pipeline.fit(X, y)
+    path = compiled.export(pipeline, tmp_path_factory.mktemp(request.param) / compiled.COMPILED_FILE, "v-test")
+    return pipeline, compiled._load(path)
+
+
+def _batch() -> pd.DataFrame:
+    X = _frame(500, seed=2)
+    # Faltantes en cada columna numérica (los imputa el pipeline) y un departamento no visto
+    for k, col in enumerate(X.columns[1:]):
+        X.loc[k * 7:k * 7 + 5, col] = np.nan
+    X.loc[40:49, "departamento"] = "ANTIOQUIA"
+    X.loc[50, ["departamento", *X.columns[1:]]] = ["ANTIOQUIA", *[np.nan] * (len(X.columns) - 1)]
+    return X
+
+
+def _assert_parity(pipeline, model, X):
+    np.testing.assert_allclose(model.predict_proba(X), pipeline.predict_proba(X), rtol=0, atol=compiled.PARITY_TOL)
+    np.testing.assert_array_equal(model.predict(X), pipeline.predict(X))
+
+
+def test_export_metadata(models):
+    pipeline, model = models
+    assert model.kind == type(pipeline.named_steps["clf"]).__name__
+    assert model.model_version == "v-test"
+    np.testing.assert_array_equal(model.classes_, pipeline.classes_)
+
+
+def test_parity_batch(models):
+    _assert_parity(*models, _batch())
+
+
+@pytest.mark.parametrize("row", [60, 3, 45, 50], ids=["completa", "con-nan", "no-vista", "todo-faltante"])
+def test_parity_single_row(models, row):
+    _assert_parity(*models, _batch().iloc[[row]])
@@ -0,0 +1,98 @@
+# tests/test_features.py
+import pandas as pd
+import pytest
+from app.config import GEO_DIR
+from app.services import dtypes, features, store
+from app.services.bench import _refresh_master
+
+
+@pytest.fixture(scope="module")
+def master():
+    return _refresh_master(20_000, pd.read_csv(GEO_DIR / "municipios.csv"))
+
+
+def _build(monkeypatch, directory, master, incremental=False):
+    parts = directory / "features_parts"
+    monkeypatch.setattr(store, "PROC_DIR", directory)
+    monkeypatch.setattr(features, "PROC_DIR", directory)
+    monkeypatch.setattr(features, "PARTS_DIR", parts)
+    monkeypatch.setattr(features, "MANIFEST", parts / "_manifest.parquet")
+    monkeypatch.setattr(features, "SHARED_DATA", False)
+    directory.mkdir(exist_ok=True)
+    store.publish(master, directory / "master.parquet")
+    features.build(incremental=incremental)
+    return pd.read_parquet(directory / "features.parquet")
+
+
+def _files(directory):
+    return {p.name: (p.stat().st_ino, p.stat().st_mtime_ns) for p in directory.glob("*.parquet")
+            if p.name != "_manifest.parquet"}
+
+
+def _refresh(monkeypatch, tmp_path, before, after):
+    """Build incremental de `after` sobre las particiones de `before`; debe dar lo mismo que un
+    build completo de `after`. Devuelve los archivos de PARTS_DIR que se reescribieron."""
+    inc = tmp_path / "incremental"
+    _build(monkeypatch, inc, before)
+    old = _files(inc / "features_parts")
+    incremental = _build(monkeypatch, inc, after, incremental=True)
+    full = _build(monkeypatch, tmp_path / "full", after)
+    pd.testing.assert_frame_equal(incremental, full)
+    new = _files(inc / "features_parts")
+    return {name for name in new.keys() | old.keys() if new.get(name) != old.get(name)}
+
+
+def _month(mes_idx):
+    return features._part_path(mes_idx).name
+
+
+def _mes_idx(df):
+    return (df["anio"].astype(int) * 12 + df["mes"].astype(int) - 1).to_numpy()
+
+
+def test_full_build_columns(monkeypatch, tmp_path, master):
+    out = _build(monkeypatch, tmp_path, master)
+    assert {"evento_id", "modalidad", "tasa_delitos_muni_mes_lag", "tasa_delitos_dep_mes_lag",
+            "acumulado_90d", "grupo_edad_bin", "es_mujer", "es_hombre"} <= set(out.columns)
+    assert len(out) == len(master) and out["evento_id"].is_unique
+    assert list(out.columns[-3:]) == ["riesgo_alto", "municipio_riesgo", "departamento_riesgo"]
+    assert not out[["tasa_delitos_muni_mes_lag", "acumulado_90d", "riesgo_alto"]].isna().any().any()
+
+
+def test_unchanged_master_rewrites_nothing(monkeypatch, tmp_path, master):
+    assert _refresh(monkeypatch, tmp_path, master, master) == set()
+
+
+def test_new_day_rewrites_only_its_month(monkeypatch, tmp_path, master):
+    new = master.tail(200).copy()
+    new["fecha_hecho"] = master["fecha_hecho"].max().normalize() + pd.Timedelta(days=1, hours=12)
+    new["anio"], new["mes"], new["dia"] = new["fecha_hecho"].dt.year, new["fecha_hecho"].dt.month, new["fecha_hecho"].dt.day
+    after = dtypes.compact(pd.concat([master, new], ignore_index=True))
+    assert _refresh(monkeypatch, tmp_path, master, after) == {_month(_mes_idx(new)[0])}
+
+
+def test_edited_month_rewrites_its_successors_only(monkeypatch, tmp_path, master):
+    months = _mes_idx(master)
+    middle = sorted(set(months))[len(set(months)) // 2]
+    after = master.copy()
+    after.loc[(months == middle).argmax(), "cantidad"] += 50
+    rewritten = _refresh(monkeypatch, tmp_path, master, after)
+    # El mes editado (riesgo_alto de todo el mes) y los que toman de él lag o ventana de 90 días
+    assert _month(middle) in rewritten
+    assert rewritten <= {_month(middle + k) for k in range(features.ROLLING_CONTEXT_MONTHS + 1)}
+
+
+def test_removed_partition(monkeypatch, tmp_path, master):
+    months = _mes_idx(master)
+    row = master.iloc[len(master) // 3]
+    gone = (master["municipio"] == row["municipio"]).to_numpy() & (months == months[len(master) // 3])
+    # Sin esas filas y con índice nuevo: todo el evento_id posterior se corre
+    after = master[~gone].reset_index(drop=True)
+    _refresh(monkeypatch, tmp_path, master, after)
+
+
+def test_missing_part_falls_back_to_full_build(monkeypatch, tmp_path, master):
+    _build(monkeypatch, tmp_path / "incremental", master)
+    next((tmp_path / "incremental" / "features_parts").glob("2*.parquet")).unlink()
+    incremental = _build(monkeypatch, tmp_path / "incremental", master, incremental=True)
+    pd.testing.assert_frame_equal(incremental, _build(monkeypatch, tmp_path / "full", master))
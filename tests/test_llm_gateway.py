@@ -0,0 +1,85 @@
+# tests/test_llm_gateway.py
+import asyncio
+import time
+from openai import AsyncOpenAI
+from app.services import llm
+
+SYSTEM = ("system", "Eres un asistente comunitario.")
+MESSAGES = [SYSTEM, ("user", "¿Qué tan seguro es Bucaramanga en la noche?")]
+# Misma pregunta con otras mayúsculas, tildes y espacios
+VARIANT = [SYSTEM, ("user", "  ¿que tan SEGURO es   bucaramanga en la noche? ")]
+
+
+def _gateway(url: str, **kwargs) -> llm.Gateway:
+    return llm.Gateway(AsyncOpenAI(base_url=url, api_key="stub", max_retries=0), model="stub", **kwargs)
+
+
+def _ask(question: str):
+    return [SYSTEM, ("user", question)]
+
+
+def test_identical_concurrent_requests_make_one_call(llm_stub):
+    stub, url = llm_stub(delay=0.3)
+
+    async def run():
+        gw = _gateway(url, timeout=5)
+        return gw, await asyncio.gather(*[gw.complete(MESSAGES, "respaldo", "v1") for _ in range(20)])
+    gw, answers = asyncio.run(run())
+    assert stub.state.calls == 1
+    assert len(set(answers)) == 1 and answers[0] != "respaldo"
+    assert gw.stats["misses"] == 1 and gw.stats["coalesced"] == 19
+
+
+def test_normalized_variant_hits_cache_and_new_version_misses(llm_stub):
+    stub, url = llm_stub(delay=0.05)
+
+    async def run():
+        gw = _gateway(url, timeout=5)
+        first = await gw.complete(MESSAGES, "respaldo", "v1")
+        variant = await gw.complete(VARIANT, "respaldo", "v1")
+        calls = stub.state.calls
+        other = await gw.complete(MESSAGES, "respaldo", "v2")
+        return gw, first, variant, calls, other
+    gw, first, variant, calls, other = asyncio.run(run())
+    assert variant == first and calls == 1 and gw.stats["hits"] == 1
+    assert stub.state.calls == 2 and other != first
+
+
+def test_timeout_returns_fallback_without_caching_it(llm_stub):
+    stub, url = llm_stub(delay=0.5)
+
+    async def run():
+        gw = _gateway(url, timeout=0.05)
+        fallback = await gw.complete(MESSAGES, "respaldo", "v1")
+        gw.timeout = 5
+        return gw, fallback, await gw.complete(MESSAGES, "respaldo", "v1")
+    gw, fallback, answer = asyncio.run(run())
+    assert fallback == "respaldo" and gw.stats["timeouts"] == 1
+    # El respaldo no quedó en caché: la siguiente vez se vuelve a preguntar al modelo
+    assert answer != "respaldo" and stub.state.calls == 2
+
+
+def test_cache_evicts_least_recently_used(llm_stub):
+    stub, url = llm_stub(delay=0.01)
+
+    async def run():
+        gw = _gateway(url, timeout=5, cache=llm.TTLCache(size=2))
+        for question in ["uno", "dos", "uno", "tres"]:  # "uno" se usó después de "dos"
+            await gw.complete(_ask(question), "respaldo", "v1")
+        calls = stub.state.calls
+        await gw.complete(_ask("uno"), "respaldo", "v1")
+        kept = stub.state.calls
+        await gw.complete(_ask("dos"), "respaldo", "v1")
+        return calls, kept
+    calls, kept = asyncio.run(run())
+    assert calls == 3          # "uno" repetido salió de la caché
+    assert kept == 3           # sigue en caché al llegar "tres" (el más reciente de los dos)
+    assert stub.state.calls == 4  # "dos" fue el desalojado
+
+
+def test_cache_entries_expire():
+    cache = llm.TTLCache(size=4, ttl=0.05)
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
@@ -0,0 +1,195 @@
+# tests/test_raw_cache.py
+import json
+import multiprocessing as mp
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pandas as pd
+import pytest
+import requests
+from app.config import SOURCES
+from app.services import etl, raw_cache, store
+from app.services.bench import synthetic_raw_csv
+
+
+class SourceServer:
+    """Servidor HTTP local de CSV con lo que usa raw_cache: ETag/Last-Modified, If-None-Match
+    (304), Range + If-Range (206/416) y cortes simulados a mitad de respuesta."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.log = []          # (ruta, estado, cabeceras de la petición)
+        self.cut = {}          # ruta -> bytes del cuerpo enviados antes de cortar
+        self.validators = True
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def handle(self, req: BaseHTTPRequestHandler):
+        path = self.directory / req.path.lstrip("/")
+        st = path.stat()
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        headers = dict(req.headers)
+
+        def reply(status: int, extra: dict, body: bytes = b""):
+            self.log.append((req.path, status, headers))
+            req.send_response(status)
+            if self.validators:
+                extra = {"ETag": etag, "Last-Modified": formatdate(st.st_mtime, usegmt=True), **extra}
+            for k, v in extra.items():
+                req.send_header(k, v)
+            req.end_headers()
+            cut = self.cut.pop(req.path, None)
+            req.wfile.write(body if cut is None else body[:cut])
+            if cut is not None:
+                req.close_connection = True
+
+        if self.validators and headers.get("If-None-Match") == etag:
+            return reply(304, {})
+        start = 0
+        if headers.get("Range") and (not self.validators or headers.get("If-Range", etag) == etag):
+            start = int(headers["Range"].split("=")[1].split("-")[0])
+            if start >= st.st_size:
+                return reply(416, {"Content-Range": f"bytes */{st.st_size}", "Content-Length": "0"})
+        body = path.read_bytes()[start:]
+        extra = {"Content-Length": str(len(body)), "Accept-Ranges": "bytes"}
+        if start:
+            extra["Content-Range"] = f"bytes {start}-{st.st_size - 1}/{st.st_size}"
+        reply(206 if start else 200, extra, body)
+
+    def statuses(self):
+        return [status for _, status, _ in self.log]
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    served, raw, proc = tmp_path / "served", tmp_path / "raw", tmp_path / "processed"
+    served.mkdir()
+    monkeypatch.setattr(raw_cache, "RAW_DIR", raw)
+    monkeypatch.setattr(etl, "RAW_DIR", raw)
+    monkeypatch.setattr(etl, "PROC_DIR", proc)
+    monkeypatch.setattr(store, "PROC_DIR", proc)
+    monkeypatch.setattr(etl, "SHARED_DATA", False)
+    # Bloques chicos: un corte a mitad de archivo siempre deja bytes en el .part
+    monkeypatch.setattr(raw_cache, "CHUNK_BYTES", 1 << 14)
+    return served, raw
+
+
+@pytest.fixture
+def server(dirs):
+    srv = SourceServer(dirs[0])
+    yield srv
+    srv.httpd.shutdown()
+
+
+@pytest.fixture
+def source(dirs, server):
+    """Un CSV servido, su URL y la ruta de la copia local."""
+    served, raw = dirs
+    src = served / "intrafamiliar.csv"
+    synthetic_raw_csv(src, 5_000)
+    return src, f"{server.url}/intrafamiliar.csv", raw / "intrafamiliar.csv"
+
+
+def _manifest(raw: Path) -> dict:
+    return json.loads((raw / "intrafamiliar.manifest.json").read_text(encoding="utf-8"))
+
+
+def _cut_fetch(server, url, cached):
+    server.cut["/intrafamiliar.csv"] = 3 * raw_cache.CHUNK_BYTES + 100
+    with pytest.raises(requests.RequestException):
+        raw_cache.fetch("intrafamiliar", url, cached)
+
+
+def test_download_then_not_modified(dirs, server, source):
+    src, url, cached = source
+    entry = raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200]
+    assert cached.read_bytes() == src.read_bytes()
+    manifest = _manifest(dirs[1])
+    assert manifest["etag"] == entry["etag"] and manifest["sha256"] == raw_cache.digest(src)["sha256"]
+    assert manifest["rows"] == 5_000 and "partial" not in manifest
+
+    assert raw_cache.fetch("intrafamiliar", url, cached) == manifest
+    assert server.statuses() == [200, 304]
+    assert server.log[-1][2]["If-None-Match"] == manifest["etag"]
+
+
+def test_resume_after_cut(dirs, server, source):
+    src, url, cached = source
+    _cut_fetch(server, url, cached)
+    part = cached.with_name("intrafamiliar.csv.part")
+    assert part.exists() and not cached.exists()
+    assert _manifest(dirs[1])["partial"]["etag"]
+
+    entry = raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200, 206]
+    request = server.log[-1][2]
+    assert request["Range"] == f"bytes={3 * raw_cache.CHUNK_BYTES}-"
+    assert request["If-Range"] == entry["etag"]
+    assert cached.read_bytes() == src.read_bytes()
+    assert "partial" not in _manifest(dirs[1]) and not part.exists()
+
+
+def test_resume_with_stale_validator_downloads_everything(server, source):
+    src, url, cached = source
+    _cut_fetch(server, url, cached)
+    synthetic_raw_csv(src, 5_000, seed=9)  # otro contenido desde el primer byte
+    raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200, 200]
+    assert cached.read_bytes() == src.read_bytes()
+
+
+def test_no_validators_never_resumes(server, source):
+    src, url, cached = source
+    server.validators = False
+    _cut_fetch(server, url, cached)
+    synthetic_raw_csv(src, 5_000, seed=9)
+    raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200, 200]
+    assert "Range" not in server.log[-1][2]
+    assert cached.read_bytes() == src.read_bytes()
+
+
+def test_complete_part_finishes_on_416(dirs, server, source):
+    src, url, cached = source
+    entry = raw_cache.fetch("intrafamiliar", url, cached)
+    # Corte justo después del último byte: .part completo, aún sin renombrar
+    cached.replace(cached.with_name("intrafamiliar.csv.part"))
+    raw_cache.save("intrafamiliar", {**entry, "partial": {"etag": entry["etag"]}})
+    raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200, 416]
+    assert cached.read_bytes() == src.read_bytes()
+
+
+def test_oversized_part_restarts_on_416(dirs, server, source):
+    src, url, cached = source
+    entry = raw_cache.fetch("intrafamiliar", url, cached)
+    cached.with_name("intrafamiliar.csv.part").write_bytes(src.read_bytes() + b"basura\n")
+    cached.unlink()
+    raw_cache.save("intrafamiliar", {**entry, "partial": {"etag": entry["etag"]}})
+    raw_cache.fetch("intrafamiliar", url, cached)
+    assert server.statuses() == [200, 416, 200]
+    assert cached.read_bytes() == src.read_bytes()
+
+
+@pytest.mark.skipif(mp.get_start_method() != "fork", reason="el pool debe heredar las rutas temporales")
+def test_build_master_jobs_parity(dirs, server):
+    served, _ = dirs
+    for i, name in enumerate(SOURCES):
+        synthetic_raw_csv(served / f"{name}.csv", 5_000, seed=42 + i)
+    sources = {name: f"{server.url}/{name}.csv" for name in SOURCES}
+    serial = pd.read_parquet(etl.build_master(jobs=1, sources=sources, force=True))
+    parallel = pd.read_parquet(etl.build_master(jobs=len(SOURCES), sources=sources, force=True))
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(serial, parallel)